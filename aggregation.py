@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+METRIC_COLUMNS = ["Impressions", "Clicks", "Spend", "Sales", "Units"]
+
+TARGET_FIRST_COLUMNS = [
+    "Bid",
+    "Ad Group Default Bid (Informational only)",
+    "Campaign ID",
+    "Ad Group ID",
+    "Campaign Name (Informational only)",
+    "Ad Group Name (Informational only)",
+    "Resolved Product Targeting Expression (Informational only)",
+]
+PLACEMENT_KEYS = ["Placement", "Percentage", "Campaign ID"]
+PLACEMENT_FIRST_COLUMNS = ["Campaign Name (Informational only)"]
+SEARCH_TERM_KEYS = ["Customer Search Term", "Campaign ID", "Ad Group ID"]
+SEARCH_TERM_FIRST_COLUMNS = [
+    "Campaign Name (Informational only)",
+    "Ad Group Name (Informational only)",
+]
+
+
+def column_codes(column):
+    """(int64 codes, number of distinct values) of one key column.
+
+    Categorical columns already carry codes; anything else, free-text
+    search terms included, is factorized once. Missing values are -1.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return (column.cat.codes.to_numpy().astype(np.int64),
+                len(column.cat.categories))
+    codes, uniques = pd.factorize(column, sort=False)
+    return codes.astype(np.int64, copy=False), len(uniques)
+
+
+def factorize_keys(df, keys):
+    """Returns one int64 group code per row, -1 where any key is missing.
+
+    Codes are numbered in order of first appearance, so they can be passed to
+    aggregate() and reused by later stages without hashing the keys again.
+    Composite keys are packed into a single int64 per row from their
+    columns' codes, so the rows are hashed as integers, not tuples.
+    """
+    if len(keys) == 1:
+        return column_codes(df[keys[0]])[0]
+
+    packed = np.zeros(len(df), dtype=np.int64)
+    missing = np.zeros(len(df), dtype=bool)
+    capacity = 1
+    for key in keys:
+        codes, size = column_codes(df[key])
+        capacity *= max(size, 1)
+        if capacity >= 2**63:
+            # Too many distinct combinations to pack into an int64
+            codes = df.groupby(keys, sort=False).ngroup()
+            return codes.fillna(-1).to_numpy(dtype=np.int64)
+        packed = packed * max(size, 1) + codes
+        missing |= codes < 0
+    if not missing.any():
+        return pd.factorize(packed, sort=False)[0].astype(np.int64, copy=False)
+    codes = np.full(len(df), -1, dtype=np.int64)
+    codes[~missing] = pd.factorize(packed[~missing], sort=False)[0]
+    return codes
+
+
+def partition_rows(df, column, values):
+    """Row positions of df for each of `values` in `column`, in one pass.
+
+    The column's codes are stably sorted once and cut at each code's
+    boundaries, so every partition keeps the sheet's row order. Categorical
+    columns reuse their codes instead of being factorized again.
+    """
+    column = df[column]
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = column.cat.codes.to_numpy()
+        uniques = column.cat.categories
+    else:
+        codes, uniques = pd.factorize(column, sort=False)
+    order = np.argsort(codes, kind="stable")
+    # Missing values are coded -1 and sort first, ahead of code 0
+    bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+    partitions = {}
+    for value, code in zip(values, uniques.get_indexer(values)):
+        partitions[value] = order[bounds[code]:bounds[code + 1]] \
+            if code >= 0 else order[:0]
+    return partitions
+
+
+def take_matching(df, positions, column, value):
+    """The rows of df at positions whose column equals value."""
+    keep = (df[column].take(positions) == value).to_numpy()
+    return df.take(positions[keep])
+
+
+def aggregate(df, keys, sum_columns, first_columns, codes=None):
+    """Groups df by keys in a single pass.
+
+    The result has the key columns, then the summed columns, then the first
+    non-null value of each descriptive column, in order of first appearance.
+    """
+    if codes is None:
+        codes = factorize_keys(df, keys)
+    valid = codes >= 0
+    if not valid.all():
+        df = df[valid]
+        codes = codes[valid]
+
+    spec = {col: pd.NamedAgg(col, "first") for col in keys}
+    spec.update({col: pd.NamedAgg(col, "sum") for col in sum_columns})
+    spec.update({col: pd.NamedAgg(col, "first") for col in first_columns})
+    grouped = df.groupby(codes, sort=False).agg(**spec)
+    return grouped.reset_index(drop=True)
+
+
+def aggregate_targets(df, key):
+    """Aggregates Product Targeting or Keyword rows by their ID column."""
+    grouped = aggregate(df, [key], METRIC_COLUMNS, TARGET_FIRST_COLUMNS)
+    grouped["Bid"] = grouped["Bid"].fillna(
+        grouped["Ad Group Default Bid (Informational only)"])
+    return grouped
+
+
+def aggregate_placements(df):
+    return aggregate(df, PLACEMENT_KEYS, METRIC_COLUMNS,
+                     PLACEMENT_FIRST_COLUMNS)
+
+
+def aggregate_search_terms(df):
+    return aggregate(df, SEARCH_TERM_KEYS, METRIC_COLUMNS,
+                     SEARCH_TERM_FIRST_COLUMNS)
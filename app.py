@@ -1,25 +1,37 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Query
+from fastapi import FastAPI, UploadFile, File, Form, Header, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
 import pandas as pd
 import numpy as np
-from io import BytesIO
 import uuid
-from reportlab.lib import colors
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-import base64
 import logging
 import uvicorn
 import asyncio
+import hashlib
+import json
 import os
+import re
+import time
 from pathlib import Path
 import shutil
-from concurrent.futures import ThreadPoolExecutor
 from threading import Lock
-from typing import Dict
+from typing import Dict, List
+import zipfile
 import aiofiles
 
+from artifacts import ARTIFACTS, media_type
+from bid_rules import DEFAULT_BID_RULES, load_rule_sets
+from jobs import QUEUED, RUNNING, JobStore
+from metrics import (BYTES_BUCKETS, CONTENT_TYPE, STAGE_BUCKETS, Counter,
+                     Gauge, Histogram, Registry)
+from processing import (PROFILE_DIR, TEMP_DIR, artifact_stage, file_content_key,
+                        get_sheet_cache, process_bidventor,
+                        process_bidventor_with_timeout, render_deferred, spill_dir)
+from reaper import DiskUsage, reap_idle
+from result_cache import ResultCache, result_key
+from sheet_cache import chunked_content_key
+from workers import create_executor
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 app = FastAPI()
@@ -39,386 +51,6 @@ app.add_middleware(
     expose_headers=["Content-Disposition"]
 )
 
-def generate_impact_report(grouped_ptid, grouped_kwid, grouped_neg):
-    buffer = BytesIO()
-    styles = getSampleStyleSheet()
-    story = []
-
-    bold_style = ParagraphStyle(
-        'BoldStyle',
-        parent=styles['Heading1'],
-        fontSize=14,
-        spaceAfter=20
-    )
-
-    # B.1 - Calculate estimates for Product Targeting IDs
-    ptid_with_new_bid = grouped_ptid.dropna(subset=['PTID_New_Bid'])
-    ptid_est_spend = (ptid_with_new_bid['PTID_New_Bid'] * ptid_with_new_bid['Clicks']).sum()
-    ptid_est_sales = (ptid_est_spend * (ptid_with_new_bid['PTID_ROAS'] + 
-                      (ptid_with_new_bid['PTID_ROAS'] * ptid_with_new_bid['PTID_DIFF_CPC'].abs()))).sum()
-    ptid_est_roas = ptid_est_sales / ptid_est_spend if ptid_est_spend > 0 else 0
-
-    # B.1 - Calculate estimates for Keyword IDs
-    kwid_with_new_bid = grouped_kwid.dropna(subset=['KWID_New_Bid'])
-    kwid_est_spend = (kwid_with_new_bid['KWID_New_Bid'] * kwid_with_new_bid['Clicks']).sum()
-    kwid_est_sales = (kwid_est_spend * (kwid_with_new_bid['KWID_ROAS'] + 
-                      (kwid_with_new_bid['KWID_ROAS'] * kwid_with_new_bid['KWID_DIFF_CPC'].abs()))).sum()
-    kwid_est_roas = kwid_est_sales / kwid_est_spend if kwid_est_spend > 0 else 0
-
-    # B.1 - Calculate estimates for Negative Keywords
-    neg_filter = (grouped_neg['Clicks'] >= 10) & (grouped_neg['Units'] < 1)
-    negkws_est_spend = grouped_neg[neg_filter]['Spend'].sum()
-
-    # B.3 - Compute savings
-    sum_spend_ptid_new_bid = grouped_ptid[grouped_ptid['PTID_New_Bid'].notna()]['Spend'].sum()
-    sum_spend_kwid_new_bid = grouped_kwid[grouped_kwid['KWID_New_Bid'].notna()]['Spend'].sum()
-
-    ptid_spend_savings = ptid_est_spend - sum_spend_ptid_new_bid
-    kwid_spend_savings = kwid_est_spend - sum_spend_kwid_new_bid
-
-    ptid_spend_savings_pct = ptid_spend_savings / (
-        grouped_ptid['Spend'].sum()) if grouped_ptid['Spend'].sum() > 0 else 0
-    kwid_spend_savings_pct = kwid_spend_savings / (
-        grouped_kwid['Spend'].sum()) if grouped_kwid['Spend'].sum() > 0 else 0
-
-    negkws_count = len(grouped_neg[neg_filter])
-
-    # Generate PDF content
-    story.append(Paragraph("OPPORTUNITIES", bold_style))
-    story.append(Spacer(1, 12))
-
-    story.append(Paragraph(
-        f"You are wasting {ptid_spend_savings_pct:.1%} ad spend currently.",
-        styles['Normal']))
-    story.append(Paragraph(
-        f"• We found {len(ptid_with_new_bid)} opportunities that can save you ${ptid_spend_savings:.2f} by using Bidventor's formula in your Product Targeting IDs.",
-        styles['Normal']))
-    story.append(Spacer(1, 12))
-
-    story.append(Paragraph(
-        f"You are wasting {kwid_spend_savings_pct:.1%} ad spend currently.",
-        styles['Normal']))
-    story.append(Paragraph(
-        f"• We found {len(kwid_with_new_bid)} opportunities that can save you ${kwid_spend_savings:.2f} by using Bidventor's formula in your Keyword IDs.",
-        styles['Normal']))
-    story.append(Spacer(1, 12))
-
-    story.append(Paragraph(
-        f"• We found {negkws_count} opportunities that can save you ${negkws_est_spend:.2f} by using Bidventor's proprietary optimization formula.",
-        styles['Normal']))
-    story.append(Spacer(1, 12))
-
-    wasted_ad_spend = negkws_est_spend + ptid_spend_savings + kwid_spend_savings
-    story.append(Paragraph(f"Overall you are wasting ${wasted_ad_spend:.2f}", bold_style))
-    story.append(Paragraph("🌟Use Bidventor to Grow Your Profits on Amazon✨", bold_style))
-
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    doc.build(story)
-    buffer.seek(0)
-    return buffer
-
-def process_bidventor(file_content: bytes):
-    try:
-        xls = pd.ExcelFile(BytesIO(file_content))
-
-        # Create in-memory buffers for outputs
-        opt_log_buffer = BytesIO()
-        amazon_upload_buffer = BytesIO()
-
-        # ------- Product Targeting IDs Processing -------
-        df_sp = pd.read_excel(xls, "Sponsored Products Campaigns")
-        df_ptid = df_sp[(df_sp["Entity"] == "Product Targeting") & (df_sp["State"] == "enabled")]
-
-        # Group and aggregate PTID data
-        ptid_extra_cols = df_ptid.groupby("Product Targeting ID").agg({
-            'Campaign ID': 'first',
-            'Ad Group ID': 'first',
-            'Campaign Name (Informational only)': 'first',
-            'Ad Group Name (Informational only)': 'first',
-            'Resolved Product Targeting Expression (Informational only)': 'first'
-        }).reset_index()
-
-        grouped_ptid = df_ptid.groupby("Product Targeting ID").agg({
-            'Impressions': 'sum',
-            'Clicks': 'sum',
-            'Spend': 'sum',
-            'Sales': 'sum',
-            'Units': 'sum',
-            'Bid': 'first',
-            'Ad Group Default Bid (Informational only)': 'first'
-        }).reset_index()
-
-        grouped_ptid = pd.merge(grouped_ptid, ptid_extra_cols, on="Product Targeting ID")
-        grouped_ptid["Bid"].fillna(grouped_ptid["Ad Group Default Bid (Informational only)"], inplace=True)
-
-        # Calculate metrics
-        grouped_ptid["PTID_ROAS"] = grouped_ptid.apply(
-            lambda x: x["Sales"] / x["Spend"] if x["Spend"] > 0 else 0, axis=1)
-        grouped_ptid["PTID_CPC"] = grouped_ptid.apply(
-            lambda x: x["Spend"] / x["Clicks"] if x["Clicks"] > 0 else 0, axis=1)
-        grouped_ptid["PTID_IDEAL_CPC"] = grouped_ptid.apply(
-            lambda x: (x["Sales"] * 0.2) / x["Clicks"] if x["Clicks"] > 0 else 0, axis=1)
-        grouped_ptid["PTID_DIFF_CPC"] = grouped_ptid.apply(
-            lambda x: (x["PTID_IDEAL_CPC"] - x["PTID_CPC"]) / x["PTID_CPC"] if x["PTID_CPC"] > 0 else 0, axis=1)
-
-        # Calculate new bids
-        def calculate_ptid_new_bid(row):
-            bid = row["Bid"]
-            if pd.isna(bid) or bid == 0:
-                return np.nan
-            if row["PTID_DIFF_CPC"] < 0 and row["Units"] > 3:
-                return max(0.02, bid + (bid * row["PTID_DIFF_CPC"]))
-            if row["PTID_DIFF_CPC"] > 0:
-                if 10 <= row["Units"] <= 50:
-                    return bid + (bid * 0.0075)
-                if 50 < row["Units"] <= 100:
-                    return bid + (bid * 0.01)
-                if row["Units"] > 100:
-                    return bid + (bid * 0.02)
-            return np.nan
-
-        grouped_ptid["PTID_New_Bid"] = grouped_ptid.apply(calculate_ptid_new_bid, axis=1)
-
-        # ------- Keyword IDs Processing -------
-        df_kw = df_sp[(df_sp["Entity"] == "Keyword") & (df_sp["State"] == "enabled")]
-
-        kwid_extra_cols = df_kw.groupby("Keyword ID").agg({
-            'Campaign ID': 'first',
-            'Ad Group ID': 'first',
-            'Campaign Name (Informational only)': 'first',
-            'Ad Group Name (Informational only)': 'first',
-            'Resolved Product Targeting Expression (Informational only)': 'first'
-        }).reset_index()
-
-        grouped_kwid = df_kw.groupby("Keyword ID").agg({
-            'Impressions': 'sum',
-            'Clicks': 'sum',
-            'Spend': 'sum',
-            'Sales': 'sum',
-            'Units': 'sum',
-            'Bid': 'first',
-            'Ad Group Default Bid (Informational only)': 'first'
-        }).reset_index()
-
-        grouped_kwid = pd.merge(grouped_kwid, kwid_extra_cols, on="Keyword ID")
-        grouped_kwid["Bid"].fillna(grouped_kwid["Ad Group Default Bid (Informational only)"], inplace=True)
-
-        # Calculate metrics
-        grouped_kwid["KWID_ROAS"] = grouped_kwid.apply(
-            lambda x: x["Sales"] / x["Spend"] if x["Spend"] > 0 else 0, axis=1)
-        grouped_kwid["KWID_CPC"] = grouped_kwid.apply(
-            lambda x: x["Spend"] / x["Clicks"] if x["Clicks"] > 0 else 0, axis=1)
-        grouped_kwid["KWID_IDEAL_CPC"] = grouped_kwid.apply(
-            lambda x: (x["Sales"] * 0.2) / x["Clicks"] if x["Clicks"] > 0 else 0, axis=1)
-        grouped_kwid["KWID_DIFF_CPC"] = grouped_kwid.apply(
-            lambda x: (x["KWID_IDEAL_CPC"] - x["KWID_CPC"]) / x["KWID_CPC"] if x["KWID_CPC"] > 0 else 0, axis=1)
-
-        # Calculate new bids
-        def calculate_kwid_new_bid(row):
-            bid = row["Bid"]
-            if pd.isna(bid) or bid == 0:
-                return np.nan
-            if row["KWID_DIFF_CPC"] < 0 and row["Units"] > 3:
-                return max(0.02, bid + (bid * row["KWID_DIFF_CPC"]))
-            if row["KWID_DIFF_CPC"] > 0:
-                if 10 <= row["Units"] <= 50:
-                    return bid + (bid * 0.0075)
-                if 50 < row["Units"] <= 100:
-                    return bid + (bid * 0.01)
-                if row["Units"] > 100:
-                    return bid + (bid * 0.02)
-            return np.nan
-
-        grouped_kwid["KWID_New_Bid"] = grouped_kwid.apply(calculate_kwid_new_bid, axis=1)
-
-        # ------- Placements Processing -------
-        df_placements = df_sp[(df_sp["Entity"] == "Bidding Adjustment") & 
-                            (df_sp["Campaign State (Informational only)"] == "enabled")]
-
-        grouped_placements = df_placements.groupby(
-            ["Placement", "Percentage", "Campaign ID"]
-        ).agg({
-            'Impressions': 'sum',
-            'Clicks': 'sum',
-            'Spend': 'sum',
-            'Sales': 'sum',
-            'Units': 'sum',
-            'Campaign Name (Informational only)': 'first'
-        }).reset_index()
-
-        # Calculate placement metrics
-        grouped_placements["PLCMT_ROAS"] = grouped_placements.apply(
-            lambda x: x["Sales"] / x["Spend"] if x["Spend"] > 0 else 0, axis=1)
-        grouped_placements["PLCMT_CPC"] = grouped_placements.apply(
-            lambda x: x["Spend"] / x["Clicks"] if x["Clicks"] > 0 else 0, axis=1)
-        grouped_placements["PLCMT_IDEAL_CPC"] = grouped_placements.apply(
-            lambda x: (x["Sales"] * 0.2) / x["Clicks"] if x["Clicks"] > 0 else 0, axis=1)
-        grouped_placements["PLCMT_DIFF_CPC"] = grouped_placements.apply(
-            lambda x: (x["PLCMT_IDEAL_CPC"] - x["PLCMT_CPC"]) / x["PLCMT_CPC"] if x["PLCMT_CPC"] > 0 else 0, axis=1)
-
-        # Calculate new placement bids
-        def calculate_plcmt_new_bid(row):
-            plcmt_diff_cpc = row["PLCMT_DIFF_CPC"]
-            units = row["Units"]
-            percentage = row["Percentage"]
-
-            if plcmt_diff_cpc <= 0 or units < 3:
-                return np.nan
-
-            new_bid = None
-            if percentage != 0:
-                if 3 <= units <= 10:
-                    new_bid = percentage + (percentage * (plcmt_diff_cpc / 5))
-                elif 10 < units <= 30:
-                    new_bid = percentage + (percentage * (plcmt_diff_cpc / 4))
-                elif 30 < units <= 50:
-                    new_bid = percentage + (percentage * (plcmt_diff_cpc / 3))
-                elif units > 50:
-                    new_bid = percentage + (percentage * (plcmt_diff_cpc / 2))
-            else:
-                if 3 <= units <= 10:
-                    new_bid = (plcmt_diff_cpc * 100) / 5
-                elif 10 < units <= 30:
-                    new_bid = (plcmt_diff_cpc * 100) / 4
-                elif 30 < units <= 50:
-                    new_bid = (plcmt_diff_cpc * 100) / 3
-                elif units > 50:
-                    new_bid = (plcmt_diff_cpc * 100) / 2
-
-            return min(899, new_bid) if new_bid else np.nan
-
-        grouped_placements["PLCMT_New_Bid"] = grouped_placements.apply(calculate_plcmt_new_bid, axis=1)
-
-        # ------- Negative Keywords Processing -------
-        df_neg = pd.read_excel(xls, "SP Search Term Report")
-        df_neg = df_neg[df_neg["Campaign State (Informational only)"] == "enabled"]
-
-        grouped_neg = df_neg.groupby([
-            "Customer Search Term", "Campaign ID", "Ad Group ID"
-        ]).agg({
-            'Impressions': 'sum',
-            'Clicks': 'sum',
-            'Spend': 'sum',
-            'Sales': 'sum',
-            'Units': 'sum',
-            'Campaign Name (Informational only)': 'first',
-            'Ad Group Name (Informational only)': 'first'
-        }).reset_index()
-
-        grouped_neg["NEGKWS_ROAS"] = grouped_neg.apply(
-            lambda x: x["Sales"] / x["Spend"] if x["Spend"] > 0 else 0, axis=1)
-        grouped_neg["NEGKWS_CPC"] = grouped_neg.apply(
-            lambda x: x["Spend"] / x["Clicks"] if x["Clicks"] > 0 else 0, axis=1)
-        grouped_neg["NEG_KW_YES"] = ~grouped_neg["Customer Search Term"].str.startswith("b0", na=False)
-        grouped_neg["NEG_PROD_YES"] = grouped_neg["Customer Search Term"].str.startswith("b0", na=False)
-        grouped_neg["Product Targeting Expression"] = grouped_neg.apply(
-            lambda x: f'asin="{x["Customer Search Term"]}"' if x["NEG_PROD_YES"] else "", axis=1)
-        grouped_neg["Bidventor Action"] = np.where(
-            (grouped_neg["Clicks"] >= 10) & (grouped_neg["Units"] < 1),
-            "To be added as Negative Search term to avoid wasted ad spend",
-            ""
-        )
-
-        # ------- Create Optimization Log -------
-        with pd.ExcelWriter(opt_log_buffer) as writer:
-            grouped_ptid.to_excel(writer, sheet_name="Product Targeting IDs", index=False)
-            grouped_kwid.to_excel(writer, sheet_name="Keyword ID", index=False)
-            grouped_placements.to_excel(writer, sheet_name="Placements", index=False)
-            grouped_neg.to_excel(writer, sheet_name="Negative KWs & Targets", index=False)
-
-        # ------- Create Amazon Upload File -------
-        amazon_upload = pd.DataFrame(columns=[
-            "Product", "Entity", "Operation", "Campaign ID", "Ad Group ID",
-            "Portfolio ID", "Ad ID", "Keyword ID", "Product Targeting ID",
-            "Campaign Name", "Ad Group Name", "Start Date", "End Date",
-            "Targeting Type", "State", "Daily Budget", "SKU",
-            "Ad Group Default Bid", "Bid", "Keyword Text",
-            "Native Language Keyword", "Native Language Locale", "Match Type",
-            "Bidding Strategy", "Placement", "Percentage",
-            "Product Targeting Expression"
-        ])
-
-        # Add Product Targeting updates
-        pt_rows = grouped_ptid.dropna(subset=["PTID_New_Bid"]).copy()
-        if not pt_rows.empty:
-            pt_rows["Product"] = "Sponsored Products"
-            pt_rows["Entity"] = "Product Targeting"
-            pt_rows["Operation"] = "Update"
-            pt_rows["State"] = "enabled"
-            pt_rows["Bid"] = pt_rows["PTID_New_Bid"]
-            amazon_upload = pd.concat([amazon_upload, pt_rows[amazon_upload.columns.intersection(pt_rows.columns)]])
-
-        # Add Keyword updates
-        kw_rows = grouped_kwid.dropna(subset=["KWID_New_Bid"]).copy()
-        if not kw_rows.empty:
-            kw_rows["Product"] = "Sponsored Products"
-            kw_rows["Entity"] = "Keyword"
-            kw_rows["Operation"] = "Update"
-            kw_rows["State"] = "enabled"
-            kw_rows["Bid"] = kw_rows["KWID_New_Bid"]
-            amazon_upload = pd.concat([amazon_upload, kw_rows[amazon_upload.columns.intersection(kw_rows.columns)]])
-
-        # Add Placement updates
-        plcmt_rows = grouped_placements.dropna(subset=["PLCMT_New_Bid"]).copy()
-        if not plcmt_rows.empty:
-            plcmt_rows["Product"] = "Sponsored Products"
-            plcmt_rows["Entity"] = "Bidding Adjustment"
-            plcmt_rows["Operation"] = "Update"
-            plcmt_rows["Percentage"] = plcmt_rows["PLCMT_New_Bid"]
-            amazon_upload = pd.concat([amazon_upload, plcmt_rows[amazon_upload.columns.intersection(plcmt_rows.columns)]])
-
-        # Add Negative Keywords
-        neg_filter = (grouped_neg["Clicks"] >= 10) & (grouped_neg["Units"] < 1)
-        neg_kw_rows = grouped_neg[neg_filter & grouped_neg["NEG_KW_YES"]].copy()
-        if not neg_kw_rows.empty:
-            neg_kw_rows["Product"] = "Sponsored Products"
-            neg_kw_rows["Entity"] = "Negative Keyword"
-            neg_kw_rows["Operation"] = "Create"
-            neg_kw_rows["State"] = "enabled"
-            neg_kw_rows["Match Type"] = "negativeExact"
-            neg_kw_rows["Keyword Text"] = neg_kw_rows["Customer Search Term"]
-            amazon_upload = pd.concat([amazon_upload, neg_kw_rows[amazon_upload.columns.intersection(neg_kw_rows.columns)]])
-
-        # Add Negative Product Targeting
-        neg_prod_rows = grouped_neg[neg_filter & grouped_neg["NEG_PROD_YES"]].copy()
-        if not neg_prod_rows.empty:
-            neg_prod_rows["Product"] = "Sponsored Products"
-            neg_prod_rows["Entity"] = "Negative Product Targeting"
-            neg_prod_rows["Operation"] = "Create"
-            neg_prod_rows["State"] = "enabled"
-            amazon_upload = pd.concat([amazon_upload, neg_prod_rows[amazon_upload.columns.intersection(neg_prod_rows.columns)]])
-
-        # Save Amazon Upload file
-        amazon_upload = amazon_upload.drop_duplicates()
-        ordered_cols = [col for col in amazon_upload.columns if col in amazon_upload]
-        amazon_upload = amazon_upload[ordered_cols]
-        with pd.ExcelWriter(amazon_upload_buffer) as writer:
-            amazon_upload.to_excel(writer, sheet_name="Sponsored Products Campaigns", index=False)
-
-        # Generate Impact Report
-        impact_report_buffer = generate_impact_report(grouped_ptid, grouped_kwid, grouped_neg)
-
-        # Convert buffers to data URLs
-        def get_data_url(buffer, mime_type):
-            buffer.seek(0)
-            b64 = base64.b64encode(buffer.read()).decode()
-            return f"data:{mime_type};base64,{b64}"
-
-        return {
-            "success": True,
-            "files": {
-                "Optimization_Log.xlsx": get_data_url(opt_log_buffer, 
-                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
-                "Amazon_Upload.xlsx": get_data_url(amazon_upload_buffer, 
-                    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
-                "Impact_Report.pdf": get_data_url(impact_report_buffer, 
-                    "application/pdf")
-            }
-        }
-
-    except Exception as e:
-        return {"success": False, "error": str(e)}
-
 @app.get("/health")
 async def health_check():
     return {
@@ -426,50 +58,290 @@ async def health_check():
         "versions": {
             "pandas": pd.__version__,
             "numpy": np.__version__
-        }
+        },
+        "rule_sets": sorted(rule_sets),
+        "sheet_cache": sheet_cache.stats(),
+        "result_cache": result_cache.stats()
     }
 
-TEMP_DIR = Path("temp_chunks")
 TEMP_DIR.mkdir(exist_ok=True)
+# Bytes in TEMP_DIR, kept up to date as uploads are written and deleted and
+# recounted from disk by every reaper pass
+temp_usage = DiskUsage(TEMP_DIR)
+temp_usage.refresh()
+
+sheet_cache = get_sheet_cache()
+
+# Rendered results by workbook hash and bid rules; a repeated upload is
+# answered from here without running process_bidventor
+RESULT_CACHE_DIR = Path(os.environ.get("RESULT_CACHE_DIR", "result_cache"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", 1024**3))
+# Bid rule sets, by name: "default" plus one per <name>.json in RULE_SETS_DIR,
+# picked per upload with the rules form field. Validated here, at startup.
+RULE_SETS_DIR = Path(os.environ.get("RULE_SETS_DIR", "rule_sets"))
+rule_sets = load_rule_sets(RULE_SETS_DIR)
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES)
+
+# Rendered artifacts, one directory per job, served by /download
+RESULTS_DIR = Path(os.environ.get("RESULTS_DIR", "results"))
+RESULTS_DIR.mkdir(exist_ok=True)
+
+# Finished jobs (and their results) are kept this long for status polling
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", 3600))
+jobs = JobStore(JOB_RESULT_TTL,
+                on_expire=lambda job: shutil.rmtree(RESULTS_DIR / job.id, ignore_errors=True))
+
+# Uploads are streamed to disk in blocks of this size, never read whole
+UPLOAD_COPY_BUFFER = 1024 * 1024
 
 chunk_locks: Dict[str, asyncio.Lock] = {}
-executor = ThreadPoolExecutor(max_workers=4)
-
-async def save_chunk_temp(upload_id: str, chunk_index: str, chunk: UploadFile) -> str:
-    chunk_path = TEMP_DIR / f"{upload_id}_{chunk_index}"
-    chunk_path.parent.mkdir(exist_ok=True)
-    
-    if upload_id not in chunk_locks:
-        chunk_locks[upload_id] = asyncio.Lock()
-    
-    async with chunk_locks[upload_id]:
-        async with aiofiles.open(chunk_path, "wb") as buffer:
-            content = await chunk.read()
-            await buffer.write(content)
-    return str(chunk_path)
+# {upload id: {chunk index: sha256}} of the chunks stored so far
+received_chunks: Dict[str, Dict[int, str]] = {}
+# {upload id: time.time() of its last chunk}, for reaping abandoned uploads
+upload_activity: Dict[str, float] = {}
+
+# Uploads idle for this long are deleted with their in-memory state, and so
+# are other temp files untouched for this long
+UPLOAD_TTL = int(os.environ.get("UPLOAD_TTL", 1800))
+UPLOAD_REAP_INTERVAL = int(os.environ.get("UPLOAD_REAP_INTERVAL", 60))
+# Chunks are refused with 507 past this many bytes in TEMP_DIR (search term
+# spills counted as of the last reaper pass), and new uploads with 503 past
+# this many in flight
+MAX_TEMP_BYTES = int(os.environ.get("MAX_TEMP_BYTES", 10 * 1024**3))
+MAX_INFLIGHT_UPLOADS = int(os.environ.get("MAX_INFLIGHT_UPLOADS", 100))
+# Held while a deferred artifact renders, keyed by "<job id>/<file name>"
+render_locks: Dict[str, asyncio.Lock] = {}
+# "process" runs jobs on pre-warmed worker processes, "thread" in this process
+EXECUTOR_BACKEND = os.environ.get("EXECUTOR_BACKEND", "process")
+EXECUTOR_WORKERS = int(os.environ.get("EXECUTOR_WORKERS", os.cpu_count() or 4))
+WORKER_MAX_JOBS = int(os.environ.get("WORKER_MAX_JOBS", 20))
+executor = create_executor(EXECUTOR_BACKEND, EXECUTOR_WORKERS, WORKER_MAX_JOBS)
+
+# Jobs still running this many seconds after a worker picked them up are
+# killed and reported as failed (0 disables the limit). Threads cannot be
+# killed, so with the thread backend the job is only reported as failed and
+# its upload is kept until it actually stops.
+JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT", 1800))
+# Uploads whose timed-out job is still running on a thread
+overrunning_uploads = set()
+
+registry = Registry()
+chunk_receive_seconds = registry.register(Histogram(
+    "bidventor_chunk_receive_seconds", "Time to receive and store one upload chunk"))
+assembly_seconds = registry.register(Histogram(
+    "bidventor_assembly_seconds", "Time to assemble a completed upload"))
+stage_seconds = registry.register(Histogram(
+    "bidventor_stage_seconds", "Duration of each process_bidventor stage",
+    labels=["stage"], buckets=STAGE_BUCKETS))
+input_bytes = registry.register(Histogram(
+    "bidventor_input_bytes", "Uncompressed size of each bulk file sheet submitted for processing",
+    labels=["sheet"], buckets=BYTES_BUCKETS))
+input_rows = registry.register(Counter(
+    "bidventor_input_rows_total", "Rows read from each bulk file sheet", labels=["sheet"]))
+compact_bytes_saved = registry.register(Counter(
+    "bidventor_compact_bytes_saved_total", "Memory saved by converting bulk frames to compact dtypes"))
+registry.register(Gauge(
+    "bidventor_executor_queue_depth", "Jobs waiting for a worker",
+    lambda: jobs.status_counts()[QUEUED]))
+registry.register(Gauge(
+    "bidventor_active_jobs", "Jobs running on a worker",
+    lambda: jobs.status_counts()[RUNNING]))
+registry.register(Gauge(
+    "bidventor_uploads_in_flight", "Uploads with chunks being received or assembled",
+    lambda: len(chunk_locks)))
+job_failures = registry.register(Counter(
+    "bidventor_job_failures_total", "Jobs that failed, timeouts included"))
+chunk_checksum_failures = registry.register(Counter(
+    "bidventor_chunk_checksum_failures_total", "Upload chunks rejected for a checksum mismatch"))
+registry.register(Gauge(
+    "bidventor_temp_bytes", "Bytes held in the upload temp directory",
+    lambda: temp_usage.bytes))
+uploads_rejected = registry.register(Counter(
+    "bidventor_uploads_rejected_total", "Upload chunks and batches refused by an upload cap",
+    labels=["reason"]))
+reaped_uploads = registry.register(Counter(
+    "bidventor_reaped_uploads_total", "Abandoned uploads and orphaned temp files deleted"))
+reaped_bytes = registry.register(Counter(
+    "bidventor_reaped_bytes_total", "Bytes freed by deleting abandoned uploads"))
+job_timeouts = registry.register(Counter(
+    "bidventor_job_timeouts_total", "Jobs that did not finish within JOB_TIMEOUT"))
+
+# Most bulk files (counting archive members) one /batch request may carry,
+# and most bytes they may add up to once unpacked
+MAX_BATCH_FILES = int(os.environ.get("MAX_BATCH_FILES", 100))
+MAX_BATCH_BYTES = int(os.environ.get("MAX_BATCH_BYTES", 2 * 1024**3))
+
+def upload_stem(upload_id: str) -> str:
+    """File name stem for an upload's temp files.
+
+    Upload IDs come from the client (the web app's include the browser's
+    user agent, slashes and all), so they are never used in paths directly.
+    """
+    return hashlib.sha256(upload_id.encode()).hexdigest()[:32]
+
+def assembled_path(upload_id: str) -> Path:
+    return TEMP_DIR / f"{upload_stem(upload_id)}.xlsx"
+
+class ChunkChecksumError(ValueError):
+    pass
+
+class UploadCapacityError(Exception):
+
+    def __init__(self, status_code: int, reason: str, message: str):
+        super().__init__(message)
+        self.status_code = status_code
+        self.reason = reason
+
+class BatchLimitError(ValueError):
+    pass
+
+class MissingChunksError(ValueError):
+
+    def __init__(self, upload_id: str, missing: List[int]):
+        super().__init__(f"Chunks {', '.join(map(str, missing))} missing for upload {upload_id}")
+        self.missing = missing
+
+def check_upload_capacity(incoming: int, new_uploads: int = 0):
+    """Raises UploadCapacityError if new_uploads more uploads would go past
+    MAX_INFLIGHT_UPLOADS, or incoming more bytes past MAX_TEMP_BYTES."""
+    if new_uploads and len(chunk_locks) + new_uploads > MAX_INFLIGHT_UPLOADS:
+        raise UploadCapacityError(503, "in_flight", "Too many uploads in progress, retry later")
+    if temp_usage.bytes + incoming > MAX_TEMP_BYTES:
+        raise UploadCapacityError(507, "temp_bytes", "Not enough upload storage, retry later")
+
+def chunk_path(upload_id: str, chunk_index: int) -> Path:
+    return TEMP_DIR / f"{upload_stem(upload_id)}_{chunk_index}"
+
+def upload_temp_files(upload_id: str) -> List[Path]:
+    """The upload's assembled file, chunk files and partial chunks, and the
+    directory its job spills search terms to.
+
+    Matched by exact name, so that no other upload's files are included.
+    """
+    stem = upload_stem(upload_id)
+    chunk_name = re.compile(rf"{stem}_\d+(\.[0-9a-f]{{32}}\.part)?")
+    files = [path for path in TEMP_DIR.glob(f"{stem}_*")
+             if chunk_name.fullmatch(path.name)]
+    assembled = assembled_path(upload_id)
+    for path in (assembled, spill_dir(assembled)):
+        if path.exists():
+            files.append(path)
+    return files
+
+async def save_chunk_temp(upload_id: str, chunk_index: str, chunk: UploadFile,
+                          chunk_size: int = None, file_size: int = None,
+                          sha256: str = None) -> str:
+    """Streams one chunk to disk and records it as received.
+
+    When the client sends its fixed chunk size the chunk is written straight to
+    its offset in the assembled file, preallocated to file_size if known.
+    Otherwise it is kept as a separate chunk file until combine_chunks().
+    Chunks go to disjoint bytes or files, so those of one upload are written
+    concurrently, without a lock. With sha256 (hex) the chunk is only recorded
+    if its digest matches; ChunkChecksumError is raised otherwise. A chunk
+    written to its offset that fails, by checksum or otherwise, has already
+    overwritten that range, so any earlier record of it is dropped and the
+    upload cannot complete until it is sent again.
+    UploadCapacityError is raised, before anything is written, for a new
+    upload past MAX_INFLIGHT_UPLOADS and for any chunk past MAX_TEMP_BYTES.
+    """
+    incoming = file_size if chunk_size and not assembled_path(upload_id).exists() else chunk.size
+    check_upload_capacity(incoming or 0, 0 if upload_id in chunk_locks else 1)
+    chunk_locks.setdefault(upload_id, asyncio.Lock())
+    upload_activity[upload_id] = time.time()
+    index = int(chunk_index)
+    if chunk_size:
+        path = assembled_path(upload_id)
+        # O_CREAT without O_TRUNC, so racing chunks never clobber each other
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if file_size and os.fstat(fd).st_size < file_size:
+                os.ftruncate(fd, file_size)
+        finally:
+            os.close(fd)
+        temp_usage.update(path)
+        mode, offset = "r+b", index * chunk_size
+    else:
+        # Renamed into place once complete, so a dropped chunk leaves no
+        # partial chunk file behind to be mistaken for a received one
+        path = chunk_path(upload_id, index).with_name(
+            f"{chunk_path(upload_id, index).name}.{uuid.uuid4().hex}.part")
+        mode, offset = "wb", 0
+
+    digest = hashlib.sha256()
+    try:
+        async with aiofiles.open(path, mode) as buffer:
+            await buffer.seek(offset)
+            while True:
+                content = await chunk.read(UPLOAD_COPY_BUFFER)
+                if not content:
+                    break
+                digest.update(content)
+                await buffer.write(content)
+        if sha256 and digest.hexdigest() != sha256.lower():
+            chunk_checksum_failures.inc()
+            raise ChunkChecksumError(f"Checksum mismatch for chunk {index} of upload {upload_id}")
+    except BaseException:
+        if chunk_size:
+            received_chunks.get(upload_id, {}).pop(index, None)
+        else:
+            path.unlink(missing_ok=True)
+        raise
+    finally:
+        temp_usage.update(path)
+    if not chunk_size:
+        part, path = path, path.replace(chunk_path(upload_id, index))
+        temp_usage.update(part)
+        temp_usage.update(path)
+    received_chunks.setdefault(upload_id, {})[index] = digest.hexdigest()
+    upload_activity[upload_id] = time.time()
+    return str(path)
+
+async def combine_chunks(upload_id: str, total_chunks: int, original_filename: str,
+                         file_size: int = None):
+    """Returns the path of the assembled upload, ready for process_bidventor,
+    and its content key, derived from the chunks' sha256 so that the
+    assembled file never has to be hashed again.
+
+    Raises MissingChunksError, leaving the received chunks in place for the
+    client to resume, unless every chunk has been received (and checksummed
+    if the client sent checksums), and ValueError if the assembled size is
+    not file_size.
+    """
+    combined_path = assembled_path(upload_id)
+    chunk_locks.setdefault(upload_id, asyncio.Lock())
 
-async def combine_chunks(upload_id: str, total_chunks: int, original_filename: str) -> bytes:
-    combined_path = TEMP_DIR / f"{upload_id}_complete.xlsx"
-    
-    if upload_id not in chunk_locks:
-        chunk_locks[upload_id] = asyncio.Lock()
-        
     async with chunk_locks[upload_id]:
-        async with aiofiles.open(combined_path, "wb") as combined_file:
+        received = received_chunks.get(upload_id, {})
+        missing = sorted(set(range(total_chunks)) - set(received))
+        if missing:
+            raise MissingChunksError(upload_id, missing)
+
+        if any(chunk_path(upload_id, i).exists() for i in range(total_chunks)):
+            async with aiofiles.open(combined_path, "wb") as combined_file:
+                for i in range(total_chunks):
+                    async with aiofiles.open(chunk_path(upload_id, i), "rb") as chunk_file:
+                        while True:
+                            content = await chunk_file.read(UPLOAD_COPY_BUFFER)
+                            if not content:
+                                break
+                            await combined_file.write(content)
+            temp_usage.update(combined_path)
             for i in range(total_chunks):
-                chunk_path = TEMP_DIR / f"{upload_id}_{i}"
-                if not chunk_path.exists():
-                    raise FileNotFoundError(f"Chunk {i} missing for upload {upload_id}")
-                async with aiofiles.open(chunk_path, "rb") as chunk_file:
-                    content = await chunk_file.read()
-                    await combined_file.write(content)
-                os.remove(chunk_path)
-        
-        async with aiofiles.open(combined_path, "rb") as f:
-            content = await f.read()
-        
-        os.remove(combined_path)
-        return content
+                temp_usage.remove(chunk_path(upload_id, i))
+        if file_size and combined_path.stat().st_size != file_size:
+            raise ValueError(f"Upload {upload_id} assembled to {combined_path.stat().st_size} "
+                             f"bytes, expected {file_size}")
+        key = chunked_content_key(received[i] for i in range(total_chunks))
+        received_chunks.pop(upload_id, None)
+        return combined_path, key
+
+@app.get("/upload/{upload_id:path}/chunks")
+async def uploaded_chunks(upload_id: str):
+    """Chunks received so far and their sha256, for clients resuming an upload."""
+    received = received_chunks.get(upload_id, {})
+    return {"uploadId": upload_id, "received": sorted(received),
+            "sha256": {str(i): received[i] for i in sorted(received)}}
 
 @app.post("/upload")
 async def upload_file(
@@ -478,52 +350,441 @@ async def upload_file(
     chunkIndex: str = Form(None),
     totalChunks: str = Form(...),
     fileName: str = Form(...),
+    chunkSize: int = Form(None),
+    fileSize: int = Form(None),
+    chunkSha256: str = Form(None),
+    accountId: str = Form(None),
+    profile: bool = Form(False),
+    artifacts: str = Form(None),
+    rules: str = Form(None),
+    x_bidventor_profile: str = Header(None),
     complete: bool = Query(False)
 ):
     logger.info(f"Processing upload {uploadId} - Chunk {chunkIndex if chunkIndex else 'complete'}")
     
     if not fileName.endswith('.xlsx'):
         raise HTTPException(400, detail="Invalid file type. Please upload .xlsx")
+    # Comma-separated artifacts to render with the job, or "none"; the others
+    # are rendered on their first download. All of them when not given.
+    render = None
+    if artifacts is not None:
+        render = [name for name in artifacts.split(",") if name and name != "none"]
+        unknown = set(render) - set(ARTIFACTS)
+        if unknown:
+            raise HTTPException(400, detail=f"Unknown artifacts: {', '.join(sorted(unknown))}")
+    rule_set = rule_sets.get(rules or DEFAULT_BID_RULES.name)
+    if rule_set is None:
+        raise HTTPException(400, detail=f"Unknown rule set: {rules}")
 
     try:
         if not complete:
             if not chunk or not chunkIndex:
                 raise HTTPException(400, detail="Chunk and chunkIndex are required for upload")
-            chunk_path = await save_chunk_temp(uploadId, chunkIndex, chunk)
+            started = time.perf_counter()
+            try:
+                await save_chunk_temp(uploadId, chunkIndex, chunk, chunkSize,
+                                      fileSize, chunkSha256)
+            except ChunkChecksumError as e:
+                # Only this chunk is dropped; the client resends it
+                raise HTTPException(422, detail=str(e))
+            except UploadCapacityError as e:
+                uploads_rejected.inc(reason=e.reason)
+                raise HTTPException(e.status_code, detail=str(e),
+                                    headers={"Retry-After": str(UPLOAD_REAP_INTERVAL)})
+            chunk_receive_seconds.observe(time.perf_counter() - started)
             return {"message": f"Chunk {chunkIndex} received for upload {uploadId}"}
         else:
-            content = await combine_chunks(uploadId, int(totalChunks), fileName)
-            loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                executor,
-                process_bidventor,
-                content
-            )
-
-            if result['success']:
-                chunk_locks.pop(uploadId, None)
-                # remove the temp file
-                for file in TEMP_DIR.glob(f"{uploadId}*"):
-                    if file.exists():
-                        file.unlink()
-                return result
-            else:
-                logger.error(f"Processing error: {result['error']}")
-                raise HTTPException(400, detail=result['error'])
-
+            # Retried complete requests get the job already started for them
+            job = jobs.for_upload(uploadId)
+            if job is None:
+                started = time.perf_counter()
+                try:
+                    file_path, cache_key = await combine_chunks(
+                        uploadId, int(totalChunks), fileName, fileSize)
+                except MissingChunksError as e:
+                    # Kept for the client to resume; see GET /upload/{id}/chunks
+                    raise HTTPException(409, detail={"message": str(e), "missing": e.missing})
+                assembly_seconds.observe(time.perf_counter() - started)
+                if file_path.stat().st_size == 0:
+                    release_upload(uploadId)
+                    raise HTTPException(400, detail="The uploaded file is empty")
+                job = jobs.create(uploadId)
+                # Profile with the profile form field or an X-Bidventor-Profile: 1 header
+                profile = profile or x_bidventor_profile == "1"
+                job.task = asyncio.create_task(
+                    run_job(job, file_path, accountId, profile, render, rule_set, cache_key))
+            return job.to_dict()
+
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unhandled exception for upload {uploadId}: {str(e)}", exc_info=True)
         if uploadId in chunk_locks:
             async with chunk_locks[uploadId]:
-                for file in TEMP_DIR.glob(f"{uploadId}*"):
-                    if file.exists():
-                        file.unlink()
+                for file in upload_temp_files(uploadId):
+                    temp_usage.remove(file)
             chunk_locks.pop(uploadId, None)
+        received_chunks.pop(uploadId, None)
+        upload_activity.pop(uploadId, None)
         raise HTTPException(500, detail=str(e))
 
+def release_upload(upload_id: str):
+    """Drops an upload's in-flight state and temp files once its job has them."""
+    chunk_locks.pop(upload_id, None)
+    upload_activity.pop(upload_id, None)
+    for file in upload_temp_files(upload_id):
+        temp_usage.remove(file)
+
+def link_result(job, result):
+    """Adds download URLs to a successful result's manifest entries."""
+    for name, entry in result['files'].items():
+        entry['url'] = f"/download/{job.id}/{name}"
+    for name, entry in result.get('profile', {}).items():
+        entry['url'] = f"/download/{job.id}/{PROFILE_DIR}/{name}"
+
+def release_overrun(upload_id: str):
+    overrunning_uploads.discard(upload_id)
+    release_upload(upload_id)
+
+async def wait_for_thread_job(job):
+    """Waits for a job on the thread executor for up to JOB_TIMEOUT from when
+    a thread picked it up; raises asyncio.TimeoutError past that."""
+    future = asyncio.wrap_future(job.future)
+    while not future.done() and job.current_status() == QUEUED:
+        await asyncio.wait([future], timeout=1)
+    return await asyncio.wait_for(asyncio.shield(future), JOB_TIMEOUT or None)
+
+async def run_job(job, file_path: Path, account_id: str = None, profile: bool = False,
+                  render: List[str] = None, rules=DEFAULT_BID_RULES, cache_key: str = None):
+    """Runs process_bidventor() for the job and finishes the job with its result.
+
+    A workbook optimized before under the same rules is answered from the
+    result cache instead, unless the job is profiled. Such a hit leaves the
+    account's delta snapshot as it was, so the account's next run compares
+    against the run before; that only costs reuse, never correctness, as
+    only rows whose inputs match the snapshot are reused. cache_key is the
+    file's content key, if the caller has one; the file is hashed otherwise.
+    """
+    release = True
+    result = None
+    try:
+        if result_cache.enabled and not profile:
+            started = time.perf_counter()
+            if cache_key is None:
+                cache_key = await asyncio.to_thread(file_content_key, file_path)
+            result = await asyncio.to_thread(
+                result_cache.get, result_key(cache_key, rules.digest), RESULTS_DIR / job.id)
+            if result is not None:
+                result["resultCacheHit"] = True
+                result["timings"] = {"result_cache": round(time.perf_counter() - started, 4)}
+        if result is None:
+            args = (file_path, RESULTS_DIR / job.id, account_id, profile, render, cache_key, rules)
+            if EXECUTOR_BACKEND == "process":
+                # The worker enforces JOB_TIMEOUT itself, see process_bidventor_with_timeout()
+                job.future = executor.submit(process_bidventor_with_timeout, JOB_TIMEOUT, *args)
+                result = await asyncio.wrap_future(job.future)
+            else:
+                job.future = executor.submit(process_bidventor, *args)
+                result = await wait_for_thread_job(job)
+    except asyncio.TimeoutError:
+        # The thread keeps reading the upload, so it is released only once
+        # the job stops
+        release = False
+        overrunning_uploads.add(job.upload_id)
+        loop = asyncio.get_running_loop()
+        upload_id = job.upload_id
+        job.future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(release_overrun, upload_id))
+        result = {"success": False, "timedOut": True,
+                  "error": f"Processing timed out after {JOB_TIMEOUT}s"}
+    except Exception as e:
+        result = {"success": False, "error": str(e)}
+    finally:
+        if release:
+            release_upload(job.upload_id)
+
+    if result.pop('timedOut', False):
+        job_timeouts.inc()
+    if 'sheetCacheHit' in result:
+        sheet_cache.record_lookup(result.pop('sheetCacheHit'))
+    for stage, seconds in result.get('timings', {}).items():
+        stage_seconds.observe(seconds, stage=stage)
+    for sheet, rows in result.get('inputRows', {}).items():
+        input_rows.inc(rows, sheet=sheet)
+    for sheet, size in result.get('sheetBytes', {}).items():
+        input_bytes.observe(size, sheet=sheet)
+    if 'inputBytes' in result:
+        compact_bytes_saved.inc(result['inputBytes']['saved'])
+    if result['success']:
+        # Only complete results are cached: no deferred artifacts, no profile
+        if cache_key and not profile and not result.get('resultCacheHit') and all(entry['rendered'] for entry in result['files'].values()):
+            cached = {"success": True, "files": result['files'], "kpis": result['kpis']}
+            await asyncio.to_thread(result_cache.put, result_key(cache_key, rules.digest),
+                                    RESULTS_DIR / job.id, cached)
+        link_result(job, result)
+    else:
+        job_failures.inc()
+        logger.error(f"Processing error for upload {job.upload_id}: {result['error']}")
+    job.finish(result)
+
+async def save_upload(upload: UploadFile, path: Path):
+    async with aiofiles.open(path, "wb") as buffer:
+        while True:
+            content = await upload.read(UPLOAD_COPY_BUFFER)
+            if not content:
+                break
+            await buffer.write(content)
+
+def extract_workbooks(archive_path: Path, prefix: str, max_files: int, max_bytes: int):
+    """Unpacks an archive's .xlsx members to TEMP_DIR; returns [(account, path)].
+
+    Each member is named after its path in the archive, minus the extension.
+    Nothing is unpacked if there are more than max_files members or they
+    add up to more than max_bytes (BatchLimitError), or if they would not fit
+    in the temp budget (UploadCapacityError). Members never unpack past their
+    declared size, so the declared sizes bound what gets written.
+    """
+    with zipfile.ZipFile(archive_path) as archive:
+        members = [
+            member for member in archive.infolist()
+            if not member.is_dir() and member.filename.endswith(".xlsx")
+            and not member.filename.startswith("__MACOSX/")
+        ]
+        if len(members) > max_files:
+            raise BatchLimitError(f"A batch holds at most {MAX_BATCH_FILES} bulk files")
+        size = sum(member.file_size for member in members)
+        if size > max_bytes:
+            raise BatchLimitError(f"A batch holds at most {MAX_BATCH_BYTES} bytes of bulk files")
+        check_upload_capacity(size)
+
+        workbooks = []
+        for member in members:
+            path = TEMP_DIR / f"{prefix}_{len(workbooks)}.xlsx"
+            with archive.open(member) as source, open(path, "wb") as target:
+                shutil.copyfileobj(source, target, UPLOAD_COPY_BUFFER)
+            temp_usage.update(path)
+            workbooks.append((member.filename[:-len(".xlsx")], path))
+    return workbooks
+
+@app.post("/batch")
+async def batch_upload(files: List[UploadFile] = File(...),
+                       accountIds: str = Form(None)):
+    """Starts one job per bulk file, for .xlsx files and .zip archives of them.
+
+    Each file is optimized on its own, listed under its name (minus .xlsx),
+    with the jobs spread over the worker pool. accountIds is an optional JSON
+    object of {name: account ID}; only the files it names reuse their
+    account's previous run, as with /upload's accountId, since unrelated
+    customers may well upload files of the same name. Poll
+    GET /batch/{batchId} or follow GET /batch/{batchId}/events for
+    per-account completion.
+    """
+    try:
+        account_ids = json.loads(accountIds) if accountIds else {}
+    except ValueError:
+        account_ids = None
+    if not isinstance(account_ids, dict) or \
+            not all(isinstance(v, str) and v for v in account_ids.values()):
+        raise HTTPException(400, detail="accountIds must be a JSON object of file names to account IDs")
+    token = uuid.uuid4().hex
+    staged = []
+    staged_bytes = 0
+    try:
+        for i, upload in enumerate(files):
+            name = upload.filename or ""
+            if name.endswith(".xlsx"):
+                if len(staged) >= MAX_BATCH_FILES:
+                    raise BatchLimitError(f"A batch holds at most {MAX_BATCH_FILES} bulk files")
+                if staged_bytes + (upload.size or 0) > MAX_BATCH_BYTES:
+                    raise BatchLimitError(f"A batch holds at most {MAX_BATCH_BYTES} bytes of bulk files")
+                check_upload_capacity(upload.size or 0)
+                path = TEMP_DIR / f"batch_{token}_{i}.xlsx"
+                await save_upload(upload, path)
+                temp_usage.update(path)
+                staged.append((name[:-len(".xlsx")], path))
+                staged_bytes += path.stat().st_size
+            elif name.endswith(".zip"):
+                check_upload_capacity(upload.size or 0)
+                archive = TEMP_DIR / f"batch_{token}_{i}.zip"
+                await save_upload(upload, archive)
+                temp_usage.update(archive)
+                try:
+                    workbooks = await asyncio.to_thread(
+                        extract_workbooks, archive, f"batch_{token}_{i}",
+                        MAX_BATCH_FILES - len(staged), MAX_BATCH_BYTES - staged_bytes)
+                finally:
+                    temp_usage.remove(archive)
+                staged += workbooks
+                staged_bytes += sum(path.stat().st_size for _, path in workbooks)
+            else:
+                raise HTTPException(400, detail=f"Invalid file type for {name}. Please upload .xlsx or .zip")
+
+        if not staged:
+            raise HTTPException(400, detail="No .xlsx files in batch")
+        empty = [account for account, path in staged if path.stat().st_size == 0]
+        if empty:
+            raise HTTPException(400, detail=f"Empty bulk files in batch: {', '.join(empty)}")
+        accounts = [account for account, _ in staged]
+        if len(set(accounts)) != len(accounts):
+            raise HTTPException(400, detail="Each bulk file in a batch needs a distinct name")
+        unknown = set(account_ids) - set(accounts)
+        if unknown:
+            raise HTTPException(400, detail=f"accountIds names files not in the batch: {', '.join(sorted(unknown))}")
+        # Each bulk file counts as an upload in flight until its job is done
+        check_upload_capacity(0, len(staged))
+    except Exception as e:
+        for file in TEMP_DIR.glob(f"batch_{token}_*"):
+            temp_usage.remove(file)
+        if isinstance(e, zipfile.BadZipFile):
+            raise HTTPException(400, detail=f"Invalid archive: {e}")
+        if isinstance(e, BatchLimitError):
+            raise HTTPException(413, detail=str(e))
+        if isinstance(e, UploadCapacityError):
+            uploads_rejected.inc(reason=e.reason)
+            raise HTTPException(e.status_code, detail=str(e),
+                                headers={"Retry-After": str(UPLOAD_REAP_INTERVAL)})
+        raise
+
+    batch = jobs.create_batch(accounts)
+    for (account, path), job in zip(staged, batch.jobs.values()):
+        chunk_locks.setdefault(job.upload_id, asyncio.Lock())
+        upload_activity[job.upload_id] = time.time()
+        file_path = path.rename(assembled_path(job.upload_id))
+        temp_usage.update(path)
+        temp_usage.update(file_path)
+        job.task = asyncio.create_task(run_job(job, file_path, account_ids.get(account)))
+    logger.info(f"Started batch {batch.id} with {len(staged)} bulk files")
+    return batch.to_dict()
+
+@app.get("/batch/{batch_id}")
+async def batch_status(batch_id: str):
+    batch = jobs.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(404, detail="Batch not found")
+    return batch.to_dict()
+
+@app.get("/batch/{batch_id}/events")
+async def batch_events(batch_id: str):
+    """Streams an NDJSON line per account as its job finishes, then the manifest."""
+    batch = jobs.get_batch(batch_id)
+    if batch is None:
+        raise HTTPException(404, detail="Batch not found")
+
+    def event(kind, body):
+        return json.dumps({"event": kind, **body}) + "\n"
+
+    async def events():
+        pending = {}
+        for account, job in batch.jobs.items():
+            if job.task is None:
+                yield event("account", {"account": account, **job.to_dict()})
+            else:
+                pending[job.task] = account
+        while pending:
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                account = pending.pop(task)
+                yield event("account", {"account": account,
+                                        **batch.jobs[account].to_dict()})
+        yield event("manifest", batch.to_dict())
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+@app.get("/metrics")
+async def metrics():
+    return Response(registry.render(), media_type=CONTENT_TYPE)
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/download/{job_id}/profile/{filename}")
+async def download_profile(job_id: str, filename: str):
+    job = jobs.get(job_id)
+    if job is None or job.result is None or filename not in job.result.get('profile', {}):
+        raise HTTPException(404, detail="File not found")
+    return FileResponse(RESULTS_DIR / job_id / PROFILE_DIR / filename,
+                        media_type=media_type(filename),
+                        filename=filename)
+
+@app.get("/download/{job_id}/{filename}")
+async def download_file(job_id: str, filename: str):
+    job = jobs.get(job_id)
+    if job is None or job.result is None or filename not in job.result['files']:
+        raise HTTPException(404, detail="File not found")
+    entry = job.result['files'][filename]
+    if not entry['rendered']:
+        # Deferred artifacts render on first download, once per job
+        key = f"{job_id}/{filename}"
+        async with render_locks.setdefault(key, asyncio.Lock()):
+            if not entry['rendered']:
+                try:
+                    described, seconds = await asyncio.wrap_future(executor.submit(
+                        render_deferred, RESULTS_DIR / job_id, filename))
+                except Exception as e:
+                    logger.error(f"Rendering {filename} for job {job_id} failed: {e}")
+                    raise HTTPException(500, detail=f"Could not render {filename}")
+                stage_seconds.observe(seconds, stage=artifact_stage(filename))
+                entry.update(described, rendered=True)
+        render_locks.pop(key, None)
+    return FileResponse(RESULTS_DIR / job_id / filename,
+                        media_type=media_type(filename),
+                        filename=filename)
+
+async def reap_uploads():
+    """Deletes uploads idle for UPLOAD_TTL, then orphaned temp files, then
+    the caches' abandoned staging directories.
+
+    Uploads being assembled or processed are never touched, spill
+    directories included. Orphans are temp files and directories no tracked
+    upload owns, e.g. left by a killed job or from before a restart.
+    """
+    jobs.purge()
+    active = jobs.active_uploads() | overrunning_uploads
+    now = time.time()
+    for upload_id, last_seen in list(upload_activity.items()):
+        lock = chunk_locks.get(upload_id)
+        if now - last_seen < UPLOAD_TTL or upload_id in active or (lock and lock.locked()):
+            continue
+        files = upload_temp_files(upload_id)
+        freed = sum(await asyncio.to_thread(lambda: [temp_usage.remove(path) for path in files]))
+        chunk_locks.pop(upload_id, None)
+        received_chunks.pop(upload_id, None)
+        upload_activity.pop(upload_id, None)
+        reaped_uploads.inc()
+        reaped_bytes.inc(freed)
+        logger.info(f"Reaped abandoned upload {upload_id} ({freed} bytes)")
+
+    owned = {path for owner in active | set(upload_activity)
+             for path in upload_temp_files(owner)}
+    count, freed = await asyncio.to_thread(
+        reap_idle, TEMP_DIR, UPLOAD_TTL, lambda path: path in owned)
+    reaped_uploads.inc(count)
+    reaped_bytes.inc(freed)
+    # Also picks up the spill directories jobs write on the workers
+    await asyncio.to_thread(temp_usage.refresh)
+    for cache in (sheet_cache, result_cache):
+        await asyncio.to_thread(cache.reap_staging, UPLOAD_TTL)
+
+@app.on_event("startup")
+async def start_reaper():
+    async def reap_forever():
+        while True:
+            await asyncio.sleep(UPLOAD_REAP_INTERVAL)
+            try:
+                await reap_uploads()
+            except Exception:
+                logger.exception("Upload reaper pass failed")
+    app.state.reaper = asyncio.create_task(reap_forever())
+
 @app.on_event("shutdown")
 async def cleanup():
+    app.state.reaper.cancel()
     shutil.rmtree(TEMP_DIR, ignore_errors=True)
+    shutil.rmtree(RESULTS_DIR, ignore_errors=True)
     executor.shutdown()
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
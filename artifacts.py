@@ -0,0 +1,251 @@
+import hashlib
+import multiprocessing
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+OPTIMIZATION_LOG = "Optimization_Log.xlsx"
+AMAZON_UPLOAD = "Amazon_Upload.xlsx"
+IMPACT_REPORT = "Impact_Report.pdf"
+ARTIFACTS = [OPTIMIZATION_LOG, AMAZON_UPLOAD, IMPACT_REPORT]
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+PDF_MEDIA_TYPE = "application/pdf"
+MEDIA_TYPES = {
+    ".xlsx": XLSX_MEDIA_TYPE,
+    ".pdf": PDF_MEDIA_TYPE,
+    ".txt": "text/plain",
+}
+
+
+def media_type(filename):
+    return MEDIA_TYPES.get(Path(filename).suffix, "application/octet-stream")
+
+
+def describe(path: Path):
+    """Manifest entry for a rendered artifact: its size and sha256."""
+    with open(path, "rb") as f:
+        digest = hashlib.file_digest(f, "sha256").hexdigest()
+    return {"size": path.stat().st_size, "sha256": digest}
+
+
+def _sheet_rows(frame, batch_rows):
+    """Yields the frame's rows as tuples of Python values, NaN as None."""
+    for start in range(0, len(frame), batch_rows):
+        batch = frame.iloc[start:start + batch_rows]
+        columns = [
+            batch[col].astype(object).where(batch[col].notna(), None)
+            for col in batch.columns
+        ]
+        yield from zip(*columns)
+
+
+def _write_sheet(worksheet, frame, batch_rows):
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+
+    header_font = Font(bold=True)
+    header = []
+    for name in frame.columns:
+        cell = WriteOnlyCell(worksheet, value=name)
+        cell.font = header_font
+        header.append(cell)
+    worksheet.append(header)
+    for row in _sheet_rows(frame, batch_rows):
+        worksheet.append(row)
+
+
+def write_workbook(path, sheets, concurrent=False, batch_rows=50000):
+    """Writes [(sheet_name, frame), ...] to an .xlsx file in constant memory.
+
+    Uses a write-only openpyxl workbook, which streams each sheet's rows to
+    its own part on disk instead of building the cell model in memory. With
+    concurrent=True the sheets are filled from a thread pool, one per sheet.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    jobs = [(workbook.create_sheet(name), frame) for name, frame in sheets]
+    if concurrent and len(jobs) > 1:
+        with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+            for done in [
+                    pool.submit(_write_sheet, worksheet, frame, batch_rows)
+                    for worksheet, frame in jobs
+            ]:
+                done.result()
+    else:
+        for worksheet, frame in jobs:
+            _write_sheet(worksheet, frame, batch_rows)
+    workbook.save(path)
+
+
+def _timed(render):
+    started = time.perf_counter()
+    render()
+    return round(time.perf_counter() - started, 4)
+
+
+def _render_in_child(render, results):
+    try:
+        results.put((_timed(render), None))
+    except Exception as e:
+        results.put((None, f"{type(e).__name__}: {e}"))
+
+
+def render_artifacts(renderers, mode="thread"):
+    """Runs {name: render} callables side by side; returns {name: seconds}.
+
+    mode "process" forks one child per artifact. The children inherit the
+    computed frames without pickling and render on separate cores, so wall
+    time drops to that of the slowest artifact. Use it only from
+    single-threaded worker processes. "thread" uses a thread pool and
+    "serial" renders one after another.
+    """
+    if mode == "serial":
+        return {name: _timed(render) for name, render in renderers.items()}
+
+    if mode == "thread":
+        with ThreadPoolExecutor(max_workers=len(renderers)) as pool:
+            futures = {
+                name: pool.submit(_timed, render)
+                for name, render in renderers.items()
+            }
+            return {name: future.result() for name, future in futures.items()}
+
+    if mode != "process":
+        raise ValueError(f"Unknown artifact rendering mode: {mode}")
+    context = multiprocessing.get_context("fork")
+    children = {}
+    for name, render in renderers.items():
+        results = context.SimpleQueue()
+        child = context.Process(target=_render_in_child, args=(render, results))
+        child.start()
+        children[name] = (child, results)
+
+    timings, errors = {}, []
+    for name, (child, results) in children.items():
+        while results.empty() and child.is_alive():
+            child.join(timeout=0.1)
+        if results.empty():
+            seconds, error = None, f"renderer exited with code {child.exitcode}"
+        else:
+            seconds, error = results.get()
+        child.join()
+        if error:
+            errors.append(f"{name}: {error}")
+        timings[name] = seconds
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return timings
+
+
+AMAZON_UPLOAD_COLUMNS = [
+    "Product", "Entity", "Operation", "Campaign ID", "Ad Group ID",
+    "Portfolio ID", "Ad ID", "Keyword ID", "Product Targeting ID",
+    "Campaign Name", "Ad Group Name", "Start Date", "End Date",
+    "Targeting Type", "State", "Daily Budget", "SKU",
+    "Ad Group Default Bid", "Bid", "Keyword Text",
+    "Native Language Keyword", "Native Language Locale", "Match Type",
+    "Bidding Strategy", "Placement", "Percentage",
+    "Product Targeting Expression"
+]
+
+
+def _upload_block(rows, keys, values, constants):
+    """One entity's rows of the Amazon Upload, as {column: values}.
+
+    values maps upload columns to columns of rows, constants to fixed values.
+    Rows repeating an earlier row's natural keys are dropped.
+    """
+    columns = {column: rows[source].to_numpy()
+               for column, source in values.items()}
+    if len(rows) and keys:
+        repeated = pd.DataFrame({key: columns[key] for key in keys}).duplicated()
+        if repeated.any():
+            columns = {column: data[~repeated.to_numpy()]
+                       for column, data in columns.items()}
+    size = len(next(iter(columns.values())))
+    for column, value in constants.items():
+        columns[column] = np.full(size, value, dtype=object)
+    return columns
+
+
+def build_amazon_upload(grouped_ptid, grouped_kwid, grouped_placements,
+                        grouped_neg, keyword_entity="Keyword"):
+    """Assembles the bulk-upload rows for every new bid and negative target.
+
+    Each entity fills its own slice of a pre-sized frame, deduplicated on its
+    natural key. Every other column of the block is either constant or
+    derived from that key, so this drops exactly what drop_duplicates() on
+    the whole frame did.
+    """
+    update = {"Product": "Sponsored Products", "Operation": "Update"}
+    create = {"Product": "Sponsored Products", "Operation": "Create"}
+
+    neg_filter = (grouped_neg["Clicks"] >= 10) & (grouped_neg["Units"] < 1)
+    neg_rows = grouped_neg[neg_filter]
+    neg_common = {
+        "Campaign ID": "Campaign ID",
+        "Ad Group ID": "Ad Group ID",
+        "Product Targeting Expression": "Product Targeting Expression",
+    }
+
+    blocks = [
+        _upload_block(
+            grouped_ptid[grouped_ptid["PTID_New_Bid"].notna()],
+            ["Product Targeting ID"],
+            {
+                "Campaign ID": "Campaign ID",
+                "Ad Group ID": "Ad Group ID",
+                "Product Targeting ID": "Product Targeting ID",
+                "Bid": "PTID_New_Bid",
+            },
+            {**update, "Entity": "Product Targeting", "State": "enabled"}),
+        _upload_block(
+            grouped_kwid[grouped_kwid["KWID_New_Bid"].notna()],
+            ["Keyword ID"],
+            {
+                "Campaign ID": "Campaign ID",
+                "Ad Group ID": "Ad Group ID",
+                "Keyword ID": "Keyword ID",
+                "Bid": "KWID_New_Bid",
+            },
+            {**update, "Entity": keyword_entity, "State": "enabled"}),
+        _upload_block(
+            grouped_placements[grouped_placements["PLCMT_New_Bid"].notna()],
+            # Groups differing only in their old percentage can end up with
+            # the same new one
+            ["Campaign ID", "Placement", "Percentage"],
+            {
+                "Campaign ID": "Campaign ID",
+                "Placement": "Placement",
+                "Percentage": "PLCMT_New_Bid",
+            },
+            {**update, "Entity": "Bidding Adjustment"}),
+        _upload_block(
+            neg_rows[neg_rows["NEG_KW_YES"]],
+            ["Campaign ID", "Ad Group ID", "Keyword Text"],
+            {**neg_common, "Keyword Text": "Customer Search Term"},
+            {**create, "Entity": "Negative Keyword", "State": "enabled",
+             "Match Type": "negativeExact"}),
+        _upload_block(
+            neg_rows[neg_rows["NEG_PROD_YES"]],
+            ["Campaign ID", "Ad Group ID", "Product Targeting Expression"],
+            neg_common,
+            {**create, "Entity": "Negative Product Targeting",
+             "State": "enabled"}),
+    ]
+
+    sizes = [len(next(iter(block.values()))) for block in blocks]
+    offsets = np.concatenate([[0], np.cumsum(sizes)])
+    data = {}
+    for column in AMAZON_UPLOAD_COLUMNS:
+        values = np.full(offsets[-1], np.nan, dtype=object)
+        for block, start, stop in zip(blocks, offsets[:-1], offsets[1:]):
+            if column in block:
+                values[start:stop] = block[column]
+        data[column] = values
+    return pd.DataFrame(data, columns=AMAZON_UPLOAD_COLUMNS)
@@ -0,0 +1,159 @@
+"""Times each stage of the optimization pipeline on a synthetic bulk file.
+
+    python -m benchmarks.stages --rows 100000
+    python -m benchmarks.stages --rows 1000000 --save after.json --compare before.json
+
+Stages run in process, one after another, in the order process_bidventor
+runs them. Peak RSS is sampled while each stage runs.
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import tempfile
+import threading
+import time
+from io import BytesIO
+
+from artifacts import build_amazon_upload, write_workbook
+from ingest import (SEARCH_TERM_SHEET, SP_SHEET, compact_frames,
+                    read_bulk_sheets)
+from jobs import StageTimer
+from pipeline import optimize, render_impact_report, render_optimization_log
+
+from benchmarks.synthetic import bulk_workbook
+
+
+def current_rss():
+    """Resident set size in bytes, from /proc where available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # High-water mark only, in KiB on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == "Darwin" else peak * 1024
+
+
+class SampledTimer(StageTimer):
+    """StageTimer that also records the peak RSS seen during each stage."""
+
+    def __init__(self, interval=0.005):
+        super().__init__()
+        self.peaks = {}
+        self._peak = current_rss()
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+
+    def _sample(self):
+        while not self._stopped.wait(self._interval):
+            self._peak = max(self._peak, current_rss())
+
+    def mark(self, stage):
+        super().mark(stage)
+        peak = max(self._peak, current_rss())
+        self.peaks[stage] = max(self.peaks.get(stage, 0), peak)
+        self._peak = current_rss()
+
+    def stop(self):
+        self._stopped.set()
+        self._sampler.join()
+
+
+def run_stages(content, output_dir, timer):
+    """Runs the pipeline on the bulk file's bytes; returns its row counts."""
+    sheets, _ = read_bulk_sheets(BytesIO(content))
+    rows = {sheet: len(frame) for sheet, frame in sheets.items()}
+    timer.mark("ingest")
+    compact_frames(sheets)
+    timer.mark("compact")
+
+    result = optimize(sheets, timer)
+    del sheets
+    gc.collect()
+
+    render_optimization_log(result, os.path.join(output_dir, "log.xlsx"))
+    timer.mark("optimization_log")
+    amazon_upload = build_amazon_upload(result.ptid, result.kwid,
+                                        result.placements, result.neg)
+    timer.mark("upload_build")
+    write_workbook(os.path.join(output_dir, "upload.xlsx"),
+                   [("Sponsored Products Campaigns", amazon_upload)])
+    timer.mark("upload_write")
+    render_impact_report(result, os.path.join(output_dir, "report.pdf"))
+    timer.mark("impact_report")
+    return rows
+
+
+def print_report(report, baseline=None):
+    print(f"{report['rows']} campaign rows, {report['search_term_rows']} "
+          f"search term rows ({report['input_mib']:.1f} MiB)")
+    header = f"{'stage':<18} {'time':>9} {'peak RSS':>12}"
+    if baseline:
+        header += f" {'vs base':>9}"
+    print(header)
+    for stage, seconds in report["timings"].items():
+        line = f"{stage:<18} {seconds:8.3f}s " \
+               f"{report['peak_rss'][stage] / 2**20:8.1f} MiB"
+        before = (baseline or {}).get("timings", {}).get(stage)
+        if before:
+            line += f" {seconds / before:8.2f}x"
+        print(line)
+    total = sum(report["timings"].values())
+    line = f"{'total':<18} {total:8.3f}s " \
+           f"{max(report['peak_rss'].values()) / 2**20:8.1f} MiB"
+    if baseline:
+        line += f" {total / sum(baseline['timings'].values()):8.2f}x"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000,
+                        help="Sponsored Products Campaigns rows")
+    parser.add_argument("--search-term-rows", type=int,
+                        help="SP Search Term Report rows (default: --rows)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--input", help="benchmark this bulk file instead")
+    parser.add_argument("--save", help="write the report as JSON")
+    parser.add_argument("--compare", help="JSON report to compare against")
+    args = parser.parse_args()
+
+    if args.input:
+        with open(args.input, "rb") as f:
+            content = f.read()
+    else:
+        started = time.perf_counter()
+        content = bulk_workbook(args.rows, args.search_term_rows, args.seed)
+        print(f"Generated bulk file in {time.perf_counter() - started:.1f}s")
+    gc.collect()
+
+    timer = SampledTimer()
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            rows = run_stages(content, output_dir, timer)
+    finally:
+        timer.stop()
+
+    report = {
+        "rows": rows[SP_SHEET],
+        "search_term_rows": rows[SEARCH_TERM_SHEET],
+        "input_mib": len(content) / 2**20,
+        "timings": timer.timings,
+        "peak_rss": timer.peaks,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(report, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""Synthetic Amazon bulk files for benchmarking.
+
+    python -m benchmarks.synthetic --rows 1000000 --output bulk.xlsx
+"""
+import argparse
+import time
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from artifacts import write_workbook
+from ingest import SEARCH_TERM_SHEET, SP_SHEET
+
+# Share of each Entity in the Sponsored Products Campaigns sheet
+ENTITY_MIX = {
+    "Campaign": 0.03,
+    "Ad Group": 0.07,
+    "Product Ad": 0.15,
+    "Keyword": 0.38,
+    "Product Targeting": 0.22,
+    "Negative Keyword": 0.05,
+    "Bidding Adjustment": 0.10,
+}
+STATE_MIX = {"enabled": 0.78, "paused": 0.18, "archived": 0.04}
+PLACEMENTS = ["Placement Top", "Placement Product Page", "Placement Rest Of Search"]
+# Share of search terms that are ASINs ("b0..."), i.e. product targets
+ASIN_SHARE = 0.2
+WORDS = ["running", "shoes", "women", "men", "trail", "red", "waterproof",
+         "kids", "wide", "lightweight", "black", "sale", "size", "boots",
+         "walking", "sneakers", "white", "leather", "comfortable", "gift"]
+
+
+def _choice(rng, mix, size):
+    return rng.choice(list(mix), size, p=list(mix.values()))
+
+
+def _names(prefix, ids):
+    """"<prefix> <n>" for each ID, formatting every distinct ID only once."""
+    unique, inverse = np.unique(ids, return_inverse=True)
+    labels = np.array([f"{prefix} {n}" for n in range(1, len(unique) + 1)],
+                      dtype=object)
+    return labels[inverse]
+
+
+def _search_term_vocabulary(rng, size):
+    asins = int(size * ASIN_SHARE)
+    alphabet = np.array(list("0123456789abcdefghijklmnopqrstuvwxyz"))
+    codes = alphabet[rng.integers(0, len(alphabet), (asins, 8))]
+    terms = ["b0" + "".join(code) for code in codes]
+    lengths = rng.integers(1, 5, size - asins)
+    words = rng.integers(0, len(WORDS), (size - asins, 4))
+    terms += [" ".join(WORDS[w] for w in row[:n])
+              for row, n in zip(words, lengths)]
+    return np.array(terms, dtype=object)
+
+
+def campaigns_sheet(rows, seed=0):
+    """A Sponsored Products Campaigns sheet with `rows` rows."""
+    rng = np.random.default_rng(seed)
+    campaigns = max(1, rows // 250)
+    entity = _choice(rng, ENTITY_MIX, rows)
+    campaign_id = 100000000000000 + rng.integers(0, campaigns, rows)
+    ad_group_id = 200000000000000 + (campaign_id % 10**6) * 8 + rng.integers(0, 8, rows)
+    is_keyword = entity == "Keyword"
+    is_target = entity == "Product Targeting"
+    is_placement = entity == "Bidding Adjustment"
+    # Each target appears once per bulk file
+    entity_id = 300000000000000 + rng.permutation(rows)
+
+    clicks = rng.poisson(rng.gamma(0.6, 12, rows))
+    units = rng.binomial(clicks, 0.12)
+    spend = np.round(clicks * rng.uniform(0.2, 2.5, rows), 2)
+    sales = np.round(units * rng.uniform(8, 45, rows), 2)
+    bid = np.round(rng.uniform(0.1, 3, rows), 2)
+    bid[rng.random(rows) < 0.1] = np.nan
+
+    return pd.DataFrame({
+        "Product": "Sponsored Products",
+        "Entity": entity,
+        "Operation": None,
+        "Campaign ID": campaign_id,
+        "Ad Group ID": np.where(entity == "Campaign", np.nan, ad_group_id),
+        "Portfolio ID": np.nan,
+        "Ad ID": np.where(entity == "Product Ad", entity_id, np.nan),
+        "Keyword ID": np.where(is_keyword, entity_id, np.nan),
+        "Product Targeting ID": np.where(is_target, entity_id, np.nan),
+        "Campaign Name (Informational only)": _names("Campaign", campaign_id),
+        "Ad Group Name (Informational only)": _names("Ad Group", ad_group_id),
+        "State": _choice(rng, STATE_MIX, rows),
+        "Campaign State (Informational only)": _choice(rng, STATE_MIX, rows),
+        "Bid": np.where(is_keyword | is_target, bid, np.nan),
+        "Ad Group Default Bid (Informational only)": np.round(rng.uniform(0.2, 2, rows), 2),
+        "Keyword Text": np.where(is_keyword, "running shoes", None),
+        "Match Type": np.where(is_keyword, rng.choice(["exact", "phrase", "broad"], rows), None),
+        "Placement": np.where(is_placement, rng.choice(PLACEMENTS, rows), None),
+        "Percentage": np.where(is_placement, rng.choice([0, 10, 25, 50, 100], rows), np.nan),
+        "Resolved Product Targeting Expression (Informational only)":
+            np.where(is_target, 'asin="B0EXAMPLE1"', None),
+        "Impressions": clicks * rng.integers(20, 200, rows),
+        "Clicks": clicks,
+        "Spend": spend,
+        "Sales": sales,
+        "Orders": units,
+        "Units": units,
+    })
+
+
+def search_term_sheet(rows, seed=0):
+    """An SP Search Term Report sheet with `rows` rows."""
+    rng = np.random.default_rng(seed + 1)
+    campaigns = max(1, rows // 250)
+    vocabulary = _search_term_vocabulary(rng, max(10, min(rows // 4, 200000)))
+    # A few terms account for most rows, as in real reports
+    term = np.minimum(rng.zipf(1.3, rows) - 1, len(vocabulary) - 1)
+    campaign_id = 100000000000000 + rng.integers(0, campaigns, rows)
+    ad_group_id = 200000000000000 + (campaign_id % 10**6) * 8 + rng.integers(0, 8, rows)
+    clicks = rng.poisson(rng.gamma(0.5, 6, rows))
+    units = rng.binomial(clicks, 0.08)
+
+    return pd.DataFrame({
+        "Product": "Sponsored Products",
+        "Campaign ID": campaign_id,
+        "Ad Group ID": ad_group_id,
+        "Campaign Name (Informational only)": _names("Campaign", campaign_id),
+        "Ad Group Name (Informational only)": _names("Ad Group", ad_group_id),
+        "Campaign State (Informational only)": _choice(rng, STATE_MIX, rows),
+        "Customer Search Term": vocabulary[term],
+        "Impressions": clicks * rng.integers(10, 100, rows),
+        "Clicks": clicks,
+        "Spend": np.round(clicks * rng.uniform(0.2, 2, rows), 2),
+        "Sales": np.round(units * rng.uniform(8, 45, rows), 2),
+        "Orders": units,
+        "Units": units,
+    })
+
+
+def bulk_workbook(rows, search_term_rows=None, seed=0):
+    """Returns the bytes of a bulk file with `rows` campaign rows.
+
+    The search term report gets as many rows unless search_term_rows is set.
+    """
+    if search_term_rows is None:
+        search_term_rows = rows
+    buffer = BytesIO()
+    write_workbook(buffer, [
+        ("Portfolios", pd.DataFrame({"Portfolio ID": [1], "Portfolio Name": ["Default"]})),
+        (SP_SHEET, campaigns_sheet(rows, seed)),
+        (SEARCH_TERM_SHEET, search_term_sheet(search_term_rows, seed)),
+    ])
+    return buffer.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000,
+                        help="Sponsored Products Campaigns rows")
+    parser.add_argument("--search-term-rows", type=int,
+                        help="SP Search Term Report rows (default: --rows)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    content = bulk_workbook(args.rows, args.search_term_rows, args.seed)
+    with open(args.output, "wb") as f:
+        f.write(content)
+    print(f"Wrote {len(content) / 2**20:.1f} MiB to {args.output} "
+          f"in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Compares the streaming Optimization Log writer with pandas' to_excel.
+
+    python -m benchmarks.xlsx_writer --rows 200000
+"""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from artifacts import write_workbook
+
+
+def sample_frame(rows, seed=0):
+    """A frame shaped like the Negative KWs & Targets sheet."""
+    rng = np.random.default_rng(seed)
+    terms = np.array(["running shoes", "b0abc12345", "trail shoes red"])
+    frame = pd.DataFrame({
+        "Customer Search Term": terms[rng.integers(0, len(terms), rows)],
+        "Campaign ID": rng.integers(10**14, 10**15, rows),
+        "Ad Group ID": rng.integers(10**14, 10**15, rows),
+        "Impressions": rng.integers(0, 5000, rows),
+        "Clicks": rng.integers(0, 50, rows),
+        "Spend": rng.uniform(0, 100, rows).round(2),
+        "Sales": rng.uniform(0, 300, rows).round(2),
+        "Units": rng.integers(0, 5, rows),
+        "Campaign Name (Informational only)": "Campaign",
+        "Ad Group Name (Informational only)": "Ad Group",
+    })
+    frame["NEGKWS_ROAS"] = np.where(frame["Spend"] > 0, frame["Sales"] / frame["Spend"], 0)
+    frame["NEG_PROD_YES"] = frame["Customer Search Term"].str.startswith("b0")
+    frame["Bidventor Action"] = np.where(frame["Clicks"] >= 10, "To be added", "")
+    frame.loc[frame.index % 7 == 0, "Sales"] = np.nan
+    return frame
+
+
+def write_pandas(path, sheets):
+    with pd.ExcelWriter(path) as writer:
+        for name, frame in sheets:
+            frame.to_excel(writer, sheet_name=name, index=False)
+
+
+def measure(label, writer, path, sheets, trace_memory):
+    started = time.perf_counter()
+    writer(path, sheets)
+    elapsed = time.perf_counter() - started
+    peak = "-"
+    if trace_memory:
+        # Separate run, tracemalloc slows allocation-heavy code a lot
+        tracemalloc.start()
+        writer(path, sheets)
+        peak = f"{tracemalloc.get_traced_memory()[1] / 2**20:.1f} MiB"
+        tracemalloc.stop()
+    print(f"{label:<20} {elapsed:8.2f}s {peak:>14} "
+          f"{os.path.getsize(path) / 2**20:8.1f} MiB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000,
+                        help="rows per sheet")
+    parser.add_argument("--sheets", type=int, default=4)
+    parser.add_argument("--memory", action="store_true",
+                        help="also report peak traced allocations")
+    args = parser.parse_args()
+
+    frame = sample_frame(args.rows)
+    sheets = [(f"Sheet {i}", frame) for i in range(args.sheets)]
+    print(f"{args.sheets} sheets x {args.rows} rows")
+    print(f"{'writer':<20} {'time':>9} {'peak alloc':>14} {'file':>11}")
+    with tempfile.TemporaryDirectory() as tmp:
+        measure("pandas to_excel", write_pandas,
+                os.path.join(tmp, "a.xlsx"), sheets, args.memory)
+        measure("streaming", write_workbook,
+                os.path.join(tmp, "b.xlsx"), sheets, args.memory)
+        measure("streaming, threads",
+                lambda path, sheets: write_workbook(path, sheets, concurrent=True),
+                os.path.join(tmp, "c.xlsx"), sheets, args.memory)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+import copy
+import hashlib
+import json
+import math
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+# Bump whenever the way rules are evaluated changes, so that results cached
+# under the old evaluation stop matching
+RULES_VERSION = 2
+
+# The bid rules as data. Tiers cover units above the previous tier's
+# max_units up to their own, inclusive; the last tier has no max_units.
+DEFAULT_RULES = {
+    # Ideal CPC is this share of the sales per click
+    "ideal_cpc_factor": 0.2,
+    # Product Targeting and Keyword IDs
+    "targets": {
+        # Converting targets that overpay are lowered by the CPC gap, never
+        # below min_bid
+        "lower_above_units": 3,
+        "min_bid": 0.02,
+        # Targets that underpay are stepped up by their unit tier's rate
+        "step_up_min_units": 10,
+        "step_ups": [
+            {"max_units": 50, "rate": 0.0075},
+            {"max_units": 100, "rate": 0.01},
+            {"max_units": None, "rate": 0.02},
+        ],
+    },
+    # Bidding Adjustment placements: the percentage is raised by the CPC gap
+    # divided by the unit tier's divisor, capped at max_percentage
+    "placements": {
+        "min_units": 3,
+        "max_percentage": 899,
+        "tiers": [
+            {"max_units": 10, "divisor": 5},
+            {"max_units": 30, "divisor": 4},
+            {"max_units": 50, "divisor": 3},
+            {"max_units": None, "divisor": 2},
+        ],
+    },
+}
+
+
+def _keys(section, expected, where):
+    if not isinstance(section, dict):
+        raise ValueError(f"{where} must be an object")
+    if set(section) != set(expected):
+        raise ValueError(f"{where} needs exactly the keys {', '.join(expected)}")
+
+
+def _number(section, key, where, positive=False):
+    value = section[key]
+    if isinstance(value, bool) or not isinstance(value, (int, float)) \
+            or not math.isfinite(value) or value < 0 or (positive and value == 0):
+        raise ValueError(f"{where}.{key} must be a {'positive' if positive else 'non-negative'} number")
+    return float(value)
+
+
+def _tiers(section, key, value_key, min_units, where, positive=False):
+    """Compiles a tier table to (upper unit bounds, values per tier)."""
+    tiers = section[key]
+    if not isinstance(tiers, list) or not tiers:
+        raise ValueError(f"{where}.{key} must be a non-empty list")
+    edges, values = [], []
+    for n, tier in enumerate(tiers):
+        at = f"{where}.{key}[{n}]"
+        _keys(tier, ["max_units", value_key], at)
+        values.append(_number(tier, value_key, at, positive))
+        if n == len(tiers) - 1:
+            if tier["max_units"] is not None:
+                raise ValueError(f"{at}.max_units must be null in the last tier")
+            break
+        edge = _number(tier, "max_units", at)
+        if edge < (edges[-1] if edges else min_units):
+            raise ValueError(f"{at}.max_units must not be below the tier before it")
+        edges.append(edge)
+    return np.array(edges), np.array(values)
+
+
+class BidRules:
+    """A rule set like DEFAULT_RULES, validated and compiled once.
+
+    The tier tables become sorted unit bounds and per-tier values, so
+    evaluating a rule is one searchsorted and a few array operations over
+    all rows. Invalid rule sets raise ValueError when constructed.
+    """
+
+    def __init__(self, spec, name="default"):
+        self.name = name
+        self.spec = copy.deepcopy(spec)
+        try:
+            self._compile(self.spec)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid bid rules '{name}': {e}") from None
+        canonical = json.dumps({"version": RULES_VERSION, "rules": self.spec},
+                               sort_keys=True)
+        # Identifies the rules for cached results and account snapshots
+        self.digest = hashlib.sha256(canonical.encode()).hexdigest()
+
+    def _compile(self, spec):
+        _keys(spec, ["ideal_cpc_factor", "targets", "placements"], "rules")
+        self.ideal_cpc_factor = _number(spec, "ideal_cpc_factor", "rules", positive=True)
+
+        targets = spec["targets"]
+        _keys(targets, ["lower_above_units", "min_bid", "step_up_min_units", "step_ups"],
+              "targets")
+        self.lower_above_units = _number(targets, "lower_above_units", "targets")
+        self.min_bid = _number(targets, "min_bid", "targets")
+        self.step_up_min_units = _number(targets, "step_up_min_units", "targets")
+        self.step_up_edges, self.step_up_rates = _tiers(
+            targets, "step_ups", "rate", self.step_up_min_units, "targets")
+
+        placements = spec["placements"]
+        _keys(placements, ["min_units", "max_percentage", "tiers"], "placements")
+        self.placement_min_units = _number(placements, "min_units", "placements")
+        self.max_percentage = _number(placements, "max_percentage", "placements",
+                                      positive=True)
+        self.placement_edges, self.placement_divisors = _tiers(
+            placements, "tiers", "divisor", self.placement_min_units, "placements",
+            positive=True)
+
+    def target_new_bid(self, bid, diff_cpc, units):
+        bid = np.asarray(bid, dtype=float)
+        diff_cpc = np.asarray(diff_cpc, dtype=float)
+        units = np.asarray(units, dtype=float)
+
+        with np.errstate(invalid="ignore"):
+            lowered = bid + (bid * diff_cpc)
+            # NaN units land past the last bound, and fail every condition
+            rate = self.step_up_rates[np.searchsorted(self.step_up_edges, units)]
+            conditions = [
+                np.isnan(bid) | (bid == 0),
+                (diff_cpc < 0) & (units > self.lower_above_units),
+                (diff_cpc > 0) & (units >= self.step_up_min_units),
+            ]
+            choices = [
+                np.nan,
+                # Same as max(min_bid, lowered), including the NaN case
+                np.where(lowered > self.min_bid, lowered, self.min_bid),
+                bid + (bid * rate),
+            ]
+        return np.select(conditions, choices, default=np.nan)
+
+    def placement_new_bid(self, percentage, diff_cpc, units):
+        percentage = np.asarray(percentage, dtype=float)
+        diff_cpc = np.asarray(diff_cpc, dtype=float)
+        units = np.asarray(units, dtype=float)
+
+        with np.errstate(invalid="ignore"):
+            divisor = self.placement_divisors[
+                np.searchsorted(self.placement_edges, units)]
+            new_bid = np.where(percentage != 0,
+                               percentage + (percentage * (diff_cpc / divisor)),
+                               (diff_cpc * 100) / divisor)
+            skip = (diff_cpc <= 0) | ~(units >= self.placement_min_units)
+            # Same as min(max_percentage, new_bid), including the NaN case
+            capped = np.where(new_bid < self.max_percentage, new_bid,
+                              self.max_percentage)
+        return np.where(skip, np.nan, capped)
+
+
+DEFAULT_BID_RULES = BidRules(DEFAULT_RULES)
+
+
+def load_rule_sets(directory):
+    """Compiles the default rules and every <name>.json rule set in directory.
+
+    Returns {name: BidRules}. A rule set that fails validation raises
+    ValueError, so that bad rules are caught at startup.
+    """
+    rule_sets = {DEFAULT_BID_RULES.name: DEFAULT_BID_RULES}
+    directory = Path(directory)
+    if directory.is_dir():
+        for path in sorted(directory.glob("*.json")):
+            rule_sets[path.stem] = BidRules(json.loads(path.read_text()), path.stem)
+    return rule_sets
+
+
+def _safe_divide(numerator, denominator):
+    """numerator / denominator where denominator > 0, else 0."""
+    numerator = np.asarray(numerator, dtype=float)
+    denominator = np.asarray(denominator, dtype=float)
+    out = np.zeros(len(denominator), dtype=float)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def add_performance_metrics(grouped, prefix, ideal_cpc=True, rules=DEFAULT_BID_RULES):
+    """Adds the <prefix>_ROAS/CPC/IDEAL_CPC/DIFF_CPC columns to a grouped frame."""
+    spend = grouped["Spend"].to_numpy(dtype=float)
+    clicks = grouped["Clicks"].to_numpy(dtype=float)
+    sales = grouped["Sales"].to_numpy(dtype=float)
+
+    cpc = _safe_divide(spend, clicks)
+    grouped[f"{prefix}_ROAS"] = _safe_divide(sales, spend)
+    grouped[f"{prefix}_CPC"] = cpc
+    if ideal_cpc:
+        ideal = _safe_divide(sales * rules.ideal_cpc_factor, clicks)
+        grouped[f"{prefix}_IDEAL_CPC"] = ideal
+        grouped[f"{prefix}_DIFF_CPC"] = _safe_divide(ideal - cpc, cpc)
+    return grouped
+
+
+def target_new_bid(bid, diff_cpc, units, rules=DEFAULT_BID_RULES):
+    """Vectorized bid rule for Product Targeting and Keyword IDs.
+
+    Mirrors the row-wise calculate_ptid_new_bid / calculate_kwid_new_bid:
+    lower the bid by the CPC gap (never below the minimum bid) for converting
+    targets that overpay, and step it up by unit tier otherwise.
+    """
+    return rules.target_new_bid(bid, diff_cpc, units)
+
+
+def placement_new_bid(percentage, diff_cpc, units, rules=DEFAULT_BID_RULES):
+    """Vectorized bid rule for Bidding Adjustment placements.
+
+    Mirrors the row-wise calculate_plcmt_new_bid: the percentage is raised by
+    a fraction of the CPC gap that grows with the unit tier, capped at the
+    rules' maximum percentage.
+    """
+    return rules.placement_new_bid(percentage, diff_cpc, units)
+
+
+def classify_search_terms(search_terms):
+    """Splits search terms into ASINs and keywords in one pass.
+
+    Returns a bool array that is True for ASIN terms (those starting with
+    "b0") and an object array holding asin="<term>" for them and "" for
+    everything else. Each distinct term is classified and formatted once,
+    then spread to the rows through its code.
+    """
+    if isinstance(search_terms.dtype, pd.CategoricalDtype):
+        codes = search_terms.cat.codes.to_numpy()
+        uniques = search_terms.cat.categories
+    else:
+        codes, uniques = pd.factorize(search_terms, sort=False)
+    # One trailing non-ASIN slot, picked by code -1 (a missing term)
+    unique_is_asin = np.zeros(len(uniques) + 1, dtype=bool)
+    unique_expressions = np.full(len(uniques) + 1, "", dtype=object)
+    for i, term in enumerate(uniques):
+        # Numeric cells stay numbers and are never ASINs
+        if isinstance(term, str) and term.startswith("b0"):
+            unique_is_asin[i] = True
+            unique_expressions[i] = f'asin="{term}"'
+    return unique_is_asin[codes], unique_expressions[codes]
@@ -0,0 +1,97 @@
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from threading import Lock
+
+from reaper import reap_idle
+
+
+class DiskCache:
+    """A directory of cache entries, one subdirectory each, keyed by name.
+
+    Subclasses fill a staging directory and commit() it as an entry. The
+    least recently used entries (by directory mtime, see touch()) are evicted
+    once the cache grows past max_bytes. The cache is disabled when
+    max_bytes is 0 or the subclass passes enabled=False.
+    """
+
+    def __init__(self, directory, max_bytes, enabled=True):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.enabled = enabled and max_bytes > 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = Lock()
+        if self.enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def staging(self, key) -> Path:
+        """Creates a directory to build key's entry in before commit().
+
+        Each call gets a directory of its own, so concurrent writers of one
+        key, in one process or several, never share one.
+        """
+        return Path(tempfile.mkdtemp(prefix=f".{key}.", suffix=".tmp", dir=self.directory))
+
+    def commit(self, key, staging: Path):
+        """Moves a staged entry into place, unless another writer got there
+        first, and evicts down to max_bytes."""
+        with self._lock:
+            if (self.directory / key).exists():
+                shutil.rmtree(staging, ignore_errors=True)
+            else:
+                staging.rename(self.directory / key)
+            self._evict()
+
+    def reap_staging(self, ttl):
+        """Deletes staging directories untouched for ttl seconds, left by
+        writers that died before commit(). Returns (count, bytes freed)."""
+        if not self.enabled:
+            return 0, 0
+        return reap_idle(self.directory, ttl,
+                         lambda path: not (path.is_dir() and path.name.startswith(".")))
+
+    @staticmethod
+    def touch(entry: Path):
+        """Marks an entry as just used. Call with the lock held."""
+        now = time.time()
+        os.utime(entry, (now, now))
+
+    def _entries(self):
+        entries = []
+        for entry in self.directory.iterdir():
+            if not entry.is_dir() or entry.name.startswith("."):
+                continue
+            try:
+                size = sum(f.stat().st_size for f in entry.iterdir())
+                entries.append((entry.stat().st_mtime, size, entry))
+            except FileNotFoundError:
+                # Evicted by another process meanwhile
+                continue
+        return sorted(entries)
+
+    def _evict(self):
+        entries = self._entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            size = sum(size for _, size, _ in self._entries()) \
+                if self.enabled else 0
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+            }
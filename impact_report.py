@@ -0,0 +1,111 @@
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer
+
+
+@lru_cache(maxsize=None)
+def report_styles():
+    """Builds the report's paragraph styles once per process."""
+    styles = getSampleStyleSheet()
+    bold_style = ParagraphStyle(
+        'BoldStyle',
+        parent=styles['Heading1'],
+        fontSize=14,
+        spaceAfter=20
+    )
+    return styles, bold_style
+
+
+def _nan_sum(values):
+    """Series.sum() of a float array: NaN skipped, same summation order."""
+    return np.where(np.isnan(values), 0, values).sum()
+
+
+def _target_kpis(grouped, prefix):
+    new_bid = grouped[f"{prefix}_New_Bid"].to_numpy(dtype=float)
+    spend = grouped["Spend"].to_numpy(dtype=float)
+    has_bid = ~np.isnan(new_bid)
+    clicks = grouped["Clicks"].to_numpy(dtype=float)[has_bid]
+    roas = grouped[f"{prefix}_ROAS"].to_numpy(dtype=float)[has_bid]
+    diff_cpc = grouped[f"{prefix}_DIFF_CPC"].to_numpy(dtype=float)[has_bid]
+
+    est_spend = _nan_sum(new_bid[has_bid] * clicks)
+    est_sales = _nan_sum(est_spend * (roas + roas * np.abs(diff_cpc)))
+    total_spend = _nan_sum(spend)
+    savings = est_spend - _nan_sum(spend[has_bid])
+    return {
+        "opportunities": int(has_bid.sum()),
+        "estimatedSpend": float(est_spend),
+        "estimatedSales": float(est_sales),
+        "estimatedRoas": float(est_sales / est_spend) if est_spend > 0 else 0.0,
+        "spend": float(total_spend),
+        "savings": float(savings),
+        "savingsPct": float(savings / total_spend) if total_spend > 0 else 0.0,
+    }
+
+
+def impact_kpis(grouped_ptid, grouped_kwid, grouped_neg):
+    """The Impact Report's numbers, computed in one pass over each frame."""
+    clicks = grouped_neg["Clicks"].to_numpy(dtype=float)
+    units = grouped_neg["Units"].to_numpy(dtype=float)
+    wasted = (clicks >= 10) & (units < 1)
+    ptid = _target_kpis(grouped_ptid, "PTID")
+    kwid = _target_kpis(grouped_kwid, "KWID")
+    negatives = {
+        "opportunities": int(wasted.sum()),
+        "spend": float(_nan_sum(grouped_neg["Spend"].to_numpy(dtype=float)[wasted])),
+    }
+    return {
+        "productTargeting": ptid,
+        "keywords": kwid,
+        "negatives": negatives,
+        "wastedAdSpend": negatives["spend"] + ptid["savings"] + kwid["savings"],
+    }
+
+
+def generate_impact_report(kpis, output=None):
+    """Renders the PDF for impact_kpis() to the output path, or to a new
+    BytesIO if none is given."""
+    buffer = BytesIO() if output is None else str(output)
+    styles, bold_style = report_styles()
+    story = []
+    ptid, kwid, negatives = kpis["productTargeting"], kpis["keywords"], kpis["negatives"]
+
+    # Generate PDF content
+    story.append(Paragraph("OPPORTUNITIES", bold_style))
+    story.append(Spacer(1, 12))
+
+    story.append(Paragraph(
+        f"You are wasting {ptid['savingsPct']:.1%} ad spend currently.",
+        styles['Normal']))
+    story.append(Paragraph(
+        f"• We found {ptid['opportunities']} opportunities that can save you ${ptid['savings']:.2f} by using Bidventor's formula in your Product Targeting IDs.",
+        styles['Normal']))
+    story.append(Spacer(1, 12))
+
+    story.append(Paragraph(
+        f"You are wasting {kwid['savingsPct']:.1%} ad spend currently.",
+        styles['Normal']))
+    story.append(Paragraph(
+        f"• We found {kwid['opportunities']} opportunities that can save you ${kwid['savings']:.2f} by using Bidventor's formula in your Keyword IDs.",
+        styles['Normal']))
+    story.append(Spacer(1, 12))
+
+    story.append(Paragraph(
+        f"• We found {negatives['opportunities']} opportunities that can save you ${negatives['spend']:.2f} by using Bidventor's proprietary optimization formula.",
+        styles['Normal']))
+    story.append(Spacer(1, 12))
+
+    story.append(Paragraph(f"Overall you are wasting ${kpis['wastedAdSpend']:.2f}", bold_style))
+    story.append(Paragraph("🌟Use Bidventor to Grow Your Profits on Amazon✨", bold_style))
+
+    doc = SimpleDocTemplate(buffer, pagesize=letter)
+    doc.build(story)
+    if output is None:
+        buffer.seek(0)
+    return buffer
@@ -0,0 +1,281 @@
+import logging
+import posixpath
+import sys
+import time
+import zipfile
+from xml.etree import ElementTree
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+SP_SHEET = "Sponsored Products Campaigns"
+SEARCH_TERM_SHEET = "SP Search Term Report"
+
+# Columns the optimizer reads from each sheet; everything else in the bulk
+# file is skipped without being converted.
+TEXT_COLUMNS = {
+    SP_SHEET: [
+        "Entity",
+        "State",
+        "Campaign State (Informational only)",
+        "Campaign Name (Informational only)",
+        "Ad Group Name (Informational only)",
+        "Resolved Product Targeting Expression (Informational only)",
+        "Placement",
+    ],
+    SEARCH_TERM_SHEET: [
+        "Campaign State (Informational only)",
+        "Campaign Name (Informational only)",
+        "Ad Group Name (Informational only)",
+        "Customer Search Term",
+    ],
+}
+NUMERIC_COLUMNS = {
+    SP_SHEET: [
+        "Campaign ID",
+        "Ad Group ID",
+        "Keyword ID",
+        "Product Targeting ID",
+        "Bid",
+        "Ad Group Default Bid (Informational only)",
+        "Percentage",
+        "Impressions",
+        "Clicks",
+        "Spend",
+        "Sales",
+        "Units",
+    ],
+    SEARCH_TERM_SHEET: [
+        "Campaign ID",
+        "Ad Group ID",
+        "Impressions",
+        "Clicks",
+        "Spend",
+        "Sales",
+        "Units",
+    ],
+}
+SHEET_COLUMNS = {
+    sheet: TEXT_COLUMNS[sheet] + NUMERIC_COLUMNS[sheet]
+    for sheet in (SP_SHEET, SEARCH_TERM_SHEET)
+}
+
+ID_COLUMNS = ["Campaign ID", "Ad Group ID", "Keyword ID", "Product Targeting ID"]
+COUNT_COLUMNS = ["Impressions", "Clicks", "Units"]
+# Text columns with at most this share of distinct values become categoricals
+CATEGORY_MAX_RATIO = 0.5
+
+_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_ID = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}id"
+_PACKAGE_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}Relationship"
+
+# Strings pd.read_excel treats as missing by default
+NA_STRINGS = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan",
+    "1.#IND", "1.#QNAN", "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a",
+    "nan", "null"
+]
+
+
+def _reader_engine():
+    try:
+        import python_calamine  # noqa: F401
+    except ImportError:
+        return "openpyxl"
+    return "calamine"
+
+
+def _build_frame(sheet, header, columns):
+    """Turns the collected column values into a frame with pd.read_excel dtypes."""
+    text_columns = set(TEXT_COLUMNS[sheet])
+    data = {}
+    for name in header:
+        values = pd.Series(columns[name], dtype=object)
+        values = values.where(values.notna() & ~values.isin(NA_STRINGS),
+                              np.nan)
+        if name not in text_columns:
+            values = values.infer_objects()
+            if values.dtype.kind == "f" and values.notna().all() and \
+                    np.array_equal(values, np.floor(values)):
+                # read_excel turns integral floats into ints
+                values = values.astype(np.int64)
+        data[name] = values
+    return pd.DataFrame(data, columns=header)
+
+
+def _iter_sheet_openpyxl(workbook, sheet, batch_rows=None):
+    """Yields the sheet as frames of up to batch_rows rows (all if None).
+
+    Always yields at least one frame, empty for an empty sheet.
+    """
+    ws = workbook[sheet]
+    rows = ws.iter_rows(values_only=True)
+    header_row = next(rows, ())
+    wanted = set(SHEET_COLUMNS[sheet])
+    picks = [(index, name) for index, name in enumerate(header_row)
+             if name in wanted]
+    header = [name for _, name in picks]
+    columns = {name: [] for name in header}
+    count, yielded = 0, False
+    for row in rows:
+        values = [row[index] if index < len(row) else None
+                  for index, _ in picks]
+        if all(value is None for value in values):
+            continue
+        for name, value in zip(header, values):
+            columns[name].append(value)
+        count += 1
+        if count == batch_rows:
+            yield _build_frame(sheet, header, columns)
+            columns = {name: [] for name in header}
+            count, yielded = 0, True
+    if count or not yielded:
+        yield _build_frame(sheet, header, columns)
+
+
+def _read_sheet_openpyxl(workbook, sheet):
+    return next(_iter_sheet_openpyxl(workbook, sheet))
+
+
+def iter_sheet_batches(source, sheet, batch_rows):
+    """Streams one sheet of a bulk file as frames of up to batch_rows rows.
+
+    Only the current batch is held in memory. Each batch gets the dtypes
+    read_bulk_sheets() would give it on its own, so a column that is
+    integral in one batch and not in another comes out int64 in the first
+    and float64 in the second; concatenating them gives the whole-sheet
+    dtype.
+    """
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True,
+                             keep_links=False)
+    try:
+        yield from _iter_sheet_openpyxl(workbook, sheet, batch_rows)
+    finally:
+        workbook.close()
+
+
+def _read_sheets_openpyxl(source, sheets, timings):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(source, read_only=True, data_only=True,
+                             keep_links=False)
+    try:
+        frames = {}
+        for sheet in sheets:
+            started = time.perf_counter()
+            frames[sheet] = _read_sheet_openpyxl(workbook, sheet)
+            timings[sheet] = time.perf_counter() - started
+        return frames
+    finally:
+        workbook.close()
+
+
+def _read_sheets_calamine(source, sheets, timings):
+    frames = {}
+    with pd.ExcelFile(source, engine="calamine") as xls:
+        for sheet in sheets:
+            started = time.perf_counter()
+            wanted = set(SHEET_COLUMNS[sheet])
+            frames[sheet] = pd.read_excel(
+                xls,
+                sheet,
+                usecols=lambda name: name in wanted,
+                dtype={col: object for col in TEXT_COLUMNS[sheet]})
+            timings[sheet] = time.perf_counter() - started
+    return frames
+
+
+def read_bulk_sheets(source, sheets=(SP_SHEET, SEARCH_TERM_SHEET)):
+    """Reads the optimizer's sheets and columns from an Amazon bulk file.
+
+    source can be a path or a binary file object. Uses python-calamine when it
+    is installed and a read-only openpyxl stream otherwise. Returns the frames
+    and the parse time of each sheet in seconds, both keyed by sheet name.
+    """
+    timings = {}
+    engine = _reader_engine()
+    if engine == "calamine":
+        frames = _read_sheets_calamine(source, sheets, timings)
+    else:
+        frames = _read_sheets_openpyxl(source, sheets, timings)
+    for sheet in sheets:
+        logger.info(f"Parsed '{sheet}' ({len(frames[sheet])} rows) with "
+                    f"{engine} in {timings[sheet]:.2f}s")
+    return frames, timings
+
+
+def sheet_sizes(source, sheets=(SP_SHEET, SEARCH_TERM_SHEET)):
+    """Uncompressed size in bytes of each sheet's XML in an xlsx file.
+
+    Reads only the workbook's directory and sheet index, never the sheets.
+    Sheets the workbook does not have are left out.
+    """
+    with zipfile.ZipFile(source) as archive:
+        workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+        rels = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+        targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(_PACKAGE_REL)}
+        sizes = {}
+        for sheet in workbook.iter(f"{_MAIN_NS}sheet"):
+            target = targets.get(sheet.get(_REL_ID))
+            if sheet.get("name") not in sheets or target is None:
+                continue
+            # Targets are relative to xl/ unless they start with a slash
+            part = target.lstrip("/") if target.startswith("/") else \
+                posixpath.normpath(posixpath.join("xl", target))
+            try:
+                sizes[sheet.get("name")] = archive.getinfo(part).file_size
+            except KeyError:
+                pass
+        return sizes
+
+
+def _intern(values):
+    return values.map(lambda v: sys.intern(v) if isinstance(v, str) else v)
+
+
+def _is_text(values):
+    return pd.api.types.is_object_dtype(values) or \
+        pd.api.types.is_string_dtype(values)
+
+
+def _compact_column(name, values, text_columns):
+    if isinstance(values.dtype, (pd.CategoricalDtype, pd.Int64Dtype)):
+        return values
+    if name in ID_COLUMNS:
+        if values.dtype.kind == "i":
+            return values.astype("Int64")
+        if values.dtype.kind == "f":
+            present = values.dropna()
+            if np.array_equal(present, np.floor(present)):
+                return values.astype("Int64")
+            return values
+        return _intern(values) if _is_text(values) else values
+    if name in COUNT_COLUMNS and values.dtype.kind == "i":
+        return pd.to_numeric(values, downcast="integer")
+    if name in text_columns and _is_text(values):
+        if values.nunique() <= CATEGORY_MAX_RATIO * len(values):
+            return values.astype("category")
+        return _intern(values)
+    return values
+
+
+def compact_frames(frames):
+    """Converts the bulk frames to compact dtypes, in place.
+
+    Repetitive text columns become categoricals and other text is interned.
+    IDs become nullable Int64, and count columns get the smallest int type
+    that holds them. Floats stay float64: spend and sales are not exactly
+    representable in float32. Returns (bytes before, bytes after).
+    """
+    text_columns = set(TEXT_COLUMNS[SP_SHEET] + TEXT_COLUMNS[SEARCH_TERM_SHEET])
+    before = after = 0
+    for frame in frames.values():
+        before += int(frame.memory_usage(index=False, deep=True).sum())
+        for name in frame.columns:
+            frame[name] = _compact_column(name, frame[name], text_columns)
+        after += int(frame.memory_usage(index=False, deep=True).sum())
+    return before, after
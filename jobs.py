@@ -0,0 +1,211 @@
+import time
+import uuid
+from collections import Counter
+from threading import Lock
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class StageTimer:
+    """Records how long each pipeline stage took, in seconds."""
+
+    def __init__(self):
+        self.timings = {}
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        """Ends `stage`, timed from the previous mark (or construction)."""
+        now = time.perf_counter()
+        self.timings[stage] = round(
+            self.timings.get(stage, 0) + now - self._last, 4)
+        self._last = now
+
+    def record(self, stage, seconds):
+        """Adds a duration measured elsewhere, e.g. in a child process."""
+        self.timings[stage] = round(seconds, 4)
+
+
+class Job:
+
+    def __init__(self, upload_id):
+        self.id = uuid.uuid4().hex
+        self.upload_id = upload_id
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.timings = {}
+        self.result = None
+        self.error = None
+        # Keeps the asyncio task driving the job alive until it finishes
+        self.task = None
+        # Executor future of the process_bidventor call
+        self.future = None
+
+    def start(self):
+        self.status = RUNNING
+        self.started_at = time.time()
+
+    def finish(self, result):
+        """Stores a process_bidventor() result and marks the job done or failed."""
+        self.timings = result.pop("timings", {})
+        if result.get("success"):
+            self.status = DONE
+            self.result = result
+        else:
+            self.status = FAILED
+            self.error = result.get("error")
+        self.finished_at = time.time()
+        self.task = None
+        self.future = None
+
+    def current_status(self):
+        # Executors flag a future as running once a worker has picked it up
+        if self.status == QUEUED and self.future is not None and \
+                self.future.running():
+            self.start()
+        return self.status
+
+    def to_dict(self):
+        self.current_status()
+        job = {
+            "jobId": self.id,
+            "uploadId": self.upload_id,
+            "status": self.status,
+            "createdAt": self.created_at,
+            "startedAt": self.started_at,
+            "finishedAt": self.finished_at,
+            "timings": self.timings,
+        }
+        if self.status == DONE:
+            job.update(self.result)
+        elif self.status == FAILED:
+            job["error"] = self.error
+        return job
+
+
+class Batch:
+    """Jobs started together from one batch upload, one per account."""
+
+    def __init__(self, batch_id, jobs):
+        self.id = batch_id
+        self.created_at = time.time()
+        # {account: Job}, in upload order
+        self.jobs = jobs
+
+    def to_dict(self):
+        """The batch's combined manifest."""
+        accounts = {account: job.to_dict() for account, job in self.jobs.items()}
+        counts = Counter(job["status"] for job in accounts.values())
+        if counts[DONE] + counts[FAILED] == len(accounts):
+            status = DONE
+        elif counts[QUEUED] == len(accounts):
+            status = QUEUED
+        else:
+            status = RUNNING
+        return {
+            "batchId": self.id,
+            "status": status,
+            "createdAt": self.created_at,
+            "counts": {s: counts[s] for s in (QUEUED, RUNNING, DONE, FAILED)},
+            "accounts": accounts,
+        }
+
+
+class JobStore:
+    """In-flight and finished jobs, with finished ones kept for `ttl` seconds.
+
+    Jobs are also indexed by upload ID so that a client retrying the
+    complete request gets the existing job back instead of a second run.
+    A batch is dropped once all of its jobs have expired.
+    """
+
+    def __init__(self, ttl, on_expire=None):
+        self.ttl = ttl
+        # Called with each expired job, e.g. to delete its stored results
+        self.on_expire = on_expire
+        self._jobs = {}
+        self._by_upload = {}
+        self._batches = {}
+        self._lock = Lock()
+
+    def _purge(self):
+        now = time.time()
+        expired = [
+            job for job in self._jobs.values()
+            if job.finished_at is not None and now - job.finished_at > self.ttl
+        ]
+        for job in expired:
+            del self._jobs[job.id]
+            if self._by_upload.get(job.upload_id) == job.id:
+                del self._by_upload[job.upload_id]
+            if self.on_expire is not None:
+                self.on_expire(job)
+        if expired:
+            self._batches = {
+                batch_id: batch for batch_id, batch in self._batches.items()
+                if any(job.id in self._jobs for job in batch.jobs.values())
+            }
+
+    def get(self, job_id):
+        with self._lock:
+            self._purge()
+            return self._jobs.get(job_id)
+
+    def for_upload(self, upload_id):
+        with self._lock:
+            self._purge()
+            job_id = self._by_upload.get(upload_id)
+            return self._jobs.get(job_id) if job_id else None
+
+    def create(self, upload_id):
+        job = Job(upload_id)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._by_upload[upload_id] = job.id
+        return job
+
+    def get_batch(self, batch_id):
+        with self._lock:
+            self._purge()
+            return self._batches.get(batch_id)
+
+    def create_batch(self, accounts):
+        """Creates a batch with one queued job per account.
+
+        Each job's upload ID is "<batch id>_<n>", n being the account's
+        position in the batch, zero-padded so that no job's ID is a prefix
+        of another's.
+        """
+        batch_id = uuid.uuid4().hex
+        width = len(str(len(accounts) - 1))
+        batch = Batch(batch_id, {
+            account: Job(f"{batch_id}_{n:0{width}d}")
+            for n, account in enumerate(accounts)
+        })
+        with self._lock:
+            for job in batch.jobs.values():
+                self._jobs[job.id] = job
+                self._by_upload[job.upload_id] = job.id
+            self._batches[batch_id] = batch
+        return batch
+
+    def purge(self):
+        """Expires finished jobs past their ttl, as every lookup does."""
+        with self._lock:
+            self._purge()
+
+    def active_uploads(self):
+        """Upload IDs of the jobs that have not finished yet."""
+        with self._lock:
+            return {job.upload_id for job in self._jobs.values()
+                    if job.finished_at is None}
+
+    def status_counts(self):
+        """{status: number of jobs}, over every job still in the store."""
+        with self._lock:
+            counts = Counter(job.current_status() for job in self._jobs.values())
+        return {status: counts[status] for status in (QUEUED, RUNNING, DONE, FAILED)}
@@ -2,15 +2,58 @@ from flask import Flask, jsonify, request, send_file
 import pandas as pd
 import numpy as np
 import os
+import threading
 import uuid
+from pathlib import Path
 from werkzeug.utils import secure_filename
 from flask_cors import CORS
 
+from artifacts import build_amazon_upload
+from aggregation import (aggregate_placements, aggregate_search_terms,
+                         aggregate_targets)
+from bid_rules import (add_performance_metrics, classify_search_terms,
+                       placement_new_bid, target_new_bid)
+from ingest import SEARCH_TERM_SHEET, SP_SHEET, read_bulk_sheets
+from reaper import disk_usage, reap_idle, start_reaper
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 300 * 1024 * 1024  # 300MB max limit
 
+# Upload directories (the bulk file and its results) are deleted once
+# untouched for this long
+UPLOAD_TTL = int(os.environ.get("UPLOAD_TTL", 3600))
+UPLOAD_REAP_INTERVAL = int(os.environ.get("UPLOAD_REAP_INTERVAL", 60))
+# Uploads are refused past this many bytes in UPLOAD_FOLDER or this many
+# being processed at once
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 10 * 1024**3))
+MAX_INFLIGHT_UPLOADS = int(os.environ.get("MAX_INFLIGHT_UPLOADS", 8))
+inflight_uploads = threading.BoundedSemaphore(MAX_INFLIGHT_UPLOADS)
+# IDs of the uploads being processed, which the reaper skips
+processing = set()
+
+
+reaper = None
+reaper_lock = threading.Lock()
+
+
+def reap_uploads():
+    reap_idle(Path(app.config['UPLOAD_FOLDER']), UPLOAD_TTL,
+              keep=lambda path: path.name in processing)
+
+
+@app.before_request
+def ensure_reaper():
+    """Starts the reaper with the first request the serving process handles,
+    so that merely importing this module (tests, tooling, a preloading
+    server) starts no thread."""
+    global reaper
+    if reaper is None:
+        with reaper_lock:
+            if reaper is None:
+                reaper = start_reaper(UPLOAD_REAP_INTERVAL, reap_uploads)
+
 
 
 def generate_impact_report(output_dir, grouped_ptid, grouped_kwid,
@@ -143,7 +186,7 @@ def process_bidventor(file_path, output_dir):
     """Processes Amazon Sponsored Products Campaigns file and optimizes bids."""
     try:
         # Load the Excel file
-        xls = pd.ExcelFile(file_path)
+        sheets, _ = read_bulk_sheets(file_path)
         output_dir = app.config['UPLOAD_FOLDER']
         opt_log_path = os.path.join(output_dir, 'Optimization_Log.xlsx')
         amazon_upload_path = os.path.join(output_dir, 'Amazon_Upload.xlsx')
@@ -151,80 +194,16 @@ def process_bidventor(file_path, output_dir):
         # Create optimization log Excel file
         with pd.ExcelWriter(opt_log_path) as writer:
             # Step A: Optimization Log - Product Targeting ID
-            df_sp = pd.read_excel(xls, "Sponsored Products Campaigns")
+            df_sp = sheets[SP_SHEET]
             df_ptid = df_sp[(df_sp["Entity"] == "Product Targeting")
                             & (df_sp["State"] == "enabled")]
 
-            ptid_extra_cols = df_ptid.groupby("Product Targeting ID").agg({
-                "Campaign ID":
-                "first",
-                "Ad Group ID":
-                "first",
-                "Campaign Name (Informational only)":
-                "first",
-                "Ad Group Name (Informational only)":
-                "first",
-                "Resolved Product Targeting Expression (Informational only)":
-                "first"
-            }).reset_index()
-
-            grouped_ptid = df_ptid.groupby("Product Targeting ID").agg({
-                "Impressions":
-                "sum",
-                "Clicks":
-                "sum",
-                "Spend":
-                "sum",
-                "Sales":
-                "sum",
-                "Units":
-                "sum",
-                "Bid":
-                "first",
-                "Ad Group Default Bid (Informational only)":
-                "first"
-            }).reset_index()
-
-            grouped_ptid = pd.merge(grouped_ptid,
-                                    ptid_extra_cols,
-                                    on="Product Targeting ID")
-            grouped_ptid["Bid"].fillna(
-                grouped_ptid["Ad Group Default Bid (Informational only)"],
-                inplace=True)
-
-            grouped_ptid["PTID_ROAS"] = grouped_ptid.apply(
-                lambda x: x["Sales"] / x["Spend"] if x["Spend"] > 0 else 0,
-                axis=1)
-            grouped_ptid["PTID_CPC"] = grouped_ptid.apply(
-                lambda x: x["Spend"] / x["Clicks"] if x["Clicks"] > 0 else 0,
-                axis=1)
-            grouped_ptid["PTID_IDEAL_CPC"] = grouped_ptid.apply(
-                lambda x: (x["Sales"] * 0.2) / x["Clicks"]
-                if x["Clicks"] > 0 else 0,
-                axis=1)
-            grouped_ptid["PTID_DIFF_CPC"] = grouped_ptid.apply(
-                lambda x: (x["PTID_IDEAL_CPC"] - x["PTID_CPC"]) / x["PTID_CPC"]
-                if x["PTID_CPC"] > 0 else 0,
-                axis=1)
-
-            def calculate_ptid_new_bid(row):
-                bid = row["Bid"]
-                if pd.isna(bid) or bid == 0:
-                    return np.nan
-
-                if row["PTID_DIFF_CPC"] < 0 and row["Units"] > 3:
-                    return max(0.02, bid + (bid * row["PTID_DIFF_CPC"]))
-                if row["PTID_DIFF_CPC"] > 0:
-                    if 10 <= row["Units"] <= 50:
-                        return bid + (bid * 0.0075)  # 0.75%
-                    if 50 < row["Units"] <= 100:
-                        return bid + (bid * 0.01)  # 1%
-                    if row["Units"] > 100:
-                        return bid + (bid * 0.02)  # 2%
-                return np.nan
-
-            grouped_ptid["PTID_New_Bid"] = grouped_ptid.apply(
-                calculate_ptid_new_bid, axis=1)
+            grouped_ptid = aggregate_targets(df_ptid, "Product Targeting ID")
+
+            add_performance_metrics(grouped_ptid, "PTID")
+            grouped_ptid["PTID_New_Bid"] = target_new_bid(
+                grouped_ptid["Bid"], grouped_ptid["PTID_DIFF_CPC"],
+                grouped_ptid["Units"])
             grouped_ptid.to_excel(writer,
                                   sheet_name="Product Targeting IDs",
                                   index=False)
@@ -233,196 +212,43 @@ def process_bidventor(file_path, output_dir):
             df_kw = df_sp[(df_sp["Entity"] == "Keyword")
                           & (df_sp["State"] == "enabled")]
 
-            kwid_extra_cols = df_kw.groupby("Keyword ID").agg({
-                "Campaign ID":
-                "first",
-                "Ad Group ID":
-                "first",
-                "Campaign Name (Informational only)":
-                "first",
-                "Ad Group Name (Informational only)":
-                "first",
-                "Resolved Product Targeting Expression (Informational only)":
-                "first"
-            }).reset_index()
-
-            grouped_kwid = df_kw.groupby("Keyword ID").agg({
-                "Impressions":
-                "sum",
-                "Clicks":
-                "sum",
-                "Spend":
-                "sum",
-                "Sales":
-                "sum",
-                "Units":
-                "sum",
-                "Bid":
-                "first",
-                "Ad Group Default Bid (Informational only)":
-                "first"
-            }).reset_index()
-
-            grouped_kwid = pd.merge(grouped_kwid,
-                                    kwid_extra_cols,
-                                    on="Keyword ID")
-            grouped_kwid["Bid"].fillna(
-                grouped_kwid["Ad Group Default Bid (Informational only)"],
-                inplace=True)
-
-            grouped_kwid["KWID_ROAS"] = grouped_kwid.apply(
-                lambda x: x["Sales"] / x["Spend"] if x["Spend"] > 0 else 0,
-                axis=1)
-            grouped_kwid["KWID_CPC"] = grouped_kwid.apply(
-                lambda x: x["Spend"] / x["Clicks"] if x["Clicks"] > 0 else 0,
-                axis=1)
-            grouped_kwid["KWID_IDEAL_CPC"] = grouped_kwid.apply(
-                lambda x: (x["Sales"] * 0.2) / x["Clicks"]
-                if x["Clicks"] > 0 else 0,
-                axis=1)
-            grouped_kwid["KWID_DIFF_CPC"] = grouped_kwid.apply(
-                lambda x: (x["KWID_IDEAL_CPC"] - x["KWID_CPC"]) / x["KWID_CPC"]
-                if x["KWID_CPC"] > 0 else 0,
-                axis=1)
-
-            def calculate_kwid_new_bid(row):
-                bid = row["Bid"]
-                if pd.isna(bid) or bid == 0:
-                    return np.nan
-
-                if row["KWID_DIFF_CPC"] < 0 and row["Units"] > 3:
-                    return max(0.02, bid + (bid * row["KWID_DIFF_CPC"]))
-                if row["KWID_DIFF_CPC"] > 0:
-                    if 10 <= row["Units"] <= 50:
-                        return bid + (bid * 0.0075)  # 0.75%
-                    if 50 < row["Units"] <= 100:
-                        return bid + (bid * 0.01)  # 1%
-                    if row["Units"] > 100:
-                        return bid + (bid * 0.02)  # 2%
-                return np.nan
-
-            grouped_kwid["KWID_New_Bid"] = grouped_kwid.apply(
-                calculate_kwid_new_bid, axis=1)
+            grouped_kwid = aggregate_targets(df_kw, "Keyword ID")
+
+            add_performance_metrics(grouped_kwid, "KWID")
+            grouped_kwid["KWID_New_Bid"] = target_new_bid(
+                grouped_kwid["Bid"], grouped_kwid["KWID_DIFF_CPC"],
+                grouped_kwid["Units"])
             grouped_kwid.to_excel(writer, sheet_name="Keyword ID", index=False)
 
             # Step ABC: Placements
             df_placements = df_sp[(df_sp["Entity"] == "Bidding Adjustment") & (
                 df_sp["Campaign State (Informational only)"] == "enabled")]
 
-            grouped_placements = df_placements.groupby(
-                ["Placement", "Percentage", "Campaign ID"]).agg({
-                    "Impressions":
-                    "sum",
-                    "Clicks":
-                    "sum",
-                    "Spend":
-                    "sum",
-                    "Sales":
-                    "sum",
-                    "Units":
-                    "sum",
-                    "Campaign Name (Informational only)":
-                    "first"
-                }).reset_index()
-
-            grouped_placements["PLCMT_ROAS"] = grouped_placements.apply(
-                lambda x: x["Sales"] / x["Spend"] if x["Spend"] > 0 else 0,
-                axis=1)
-            grouped_placements["PLCMT_CPC"] = grouped_placements.apply(
-                lambda x: x["Spend"] / x["Clicks"] if x["Clicks"] > 0 else 0,
-                axis=1)
-            grouped_placements["PLCMT_IDEAL_CPC"] = grouped_placements.apply(
-                lambda x: (x["Sales"] * 0.2) / x["Clicks"]
-                if x["Clicks"] > 0 else 0,
-                axis=1)
-            grouped_placements["PLCMT_DIFF_CPC"] = grouped_placements.apply(
-                lambda x:
-                (x["PLCMT_IDEAL_CPC"] - x["PLCMT_CPC"]) / x["PLCMT_CPC"]
-                if x["PLCMT_CPC"] > 0 else 0,
-                axis=1)
-
-            def calculate_plcmt_new_bid(row):
-                plcmt_diff_cpc = row["PLCMT_DIFF_CPC"]
-                units = row["Units"]
-                percentage = row["Percentage"]
-
-                if plcmt_diff_cpc <= 0 or units < 3:
-                    return np.nan
-
-                new_bid = None
-
-                if percentage != 0:
-                    if 3 <= units <= 10:
-                        new_bid = percentage + (percentage *
-                                                (plcmt_diff_cpc / 5))
-                    elif 10 < units <= 30:
-                        new_bid = percentage + (percentage *
-                                                (plcmt_diff_cpc / 4))
-                    elif 30 < units <= 50:
-                        new_bid = percentage + (percentage *
-                                                (plcmt_diff_cpc / 3))
-                    elif units > 50:
-                        new_bid = percentage + (percentage *
-                                                (plcmt_diff_cpc / 2))
-                else:
-                    if 3 <= units <= 10:
-                        new_bid = (plcmt_diff_cpc * 100) / 5
-                    elif 10 < units <= 30:
-                        new_bid = (plcmt_diff_cpc * 100) / 4
-                    elif 30 < units <= 50:
-                        new_bid = (plcmt_diff_cpc * 100) / 3
-                    elif units > 50:
-                        new_bid = (plcmt_diff_cpc * 100) / 2
-
-                if new_bid is not None:
-                    return min(899, new_bid)
-                return np.nan
-
-            grouped_placements["PLCMT_New_Bid"] = grouped_placements.apply(
-                calculate_plcmt_new_bid, axis=1)
+            grouped_placements = aggregate_placements(df_placements)
+
+            add_performance_metrics(grouped_placements, "PLCMT")
+            grouped_placements["PLCMT_New_Bid"] = placement_new_bid(
+                grouped_placements["Percentage"],
+                grouped_placements["PLCMT_DIFF_CPC"],
+                grouped_placements["Units"])
             grouped_placements.to_excel(writer,
                                         sheet_name="Placements",
                                         index=False)
 
             # Step ABCD: Negative Keywords & Targets
-            df_neg = pd.read_excel(xls, "SP Search Term Report")
+            df_neg = sheets[SEARCH_TERM_SHEET]
             df_neg = df_neg[df_neg["Campaign State (Informational only)"] ==
                             "enabled"]
 
-            grouped_neg = df_neg.groupby(
-                ["Customer Search Term", "Campaign ID", "Ad Group ID"]).agg({
-                    "Impressions":
-                    "sum",
-                    "Clicks":
-                    "sum",
-                    "Spend":
-                    "sum",
-                    "Sales":
-                    "sum",
-                    "Units":
-                    "sum",
-                    "Campaign Name (Informational only)":
-                    "first",
-                    "Ad Group Name (Informational only)":
-                    "first"
-                }).reset_index()
-
-            grouped_neg["NEGKWS_ROAS"] = grouped_neg.apply(
-                lambda x: x["Sales"] / x["Spend"] if x["Spend"] > 0 else 0,
-                axis=1)
-            grouped_neg["NEGKWS_CPC"] = grouped_neg.apply(
-                lambda x: x["Spend"] / x["Clicks"] if x["Clicks"] > 0 else 0,
-                axis=1)
-
-            grouped_neg["NEG_KW_YES"] = ~grouped_neg[
-                "Customer Search Term"].str.startswith("b0", na=False)
-            grouped_neg["NEG_PROD_YES"] = grouped_neg[
-                "Customer Search Term"].str.startswith("b0", na=False)
-
-            grouped_neg["Product Targeting Expression"] = grouped_neg.apply(
-                lambda x: f'asin="{x["Customer Search Term"]}"'
-                if x["NEG_PROD_YES"] else "",
-                axis=1)
+            grouped_neg = aggregate_search_terms(df_neg)
+
+            add_performance_metrics(grouped_neg, "NEGKWS", ideal_cpc=False)
+
+            is_asin, expressions = classify_search_terms(
+                grouped_neg["Customer Search Term"])
+            grouped_neg["NEG_KW_YES"] = ~is_asin
+            grouped_neg["NEG_PROD_YES"] = is_asin
+            grouped_neg["Product Targeting Expression"] = expressions
 
             grouped_neg["Bidventor Action"] = np.where(
                 (grouped_neg["Clicks"] >= 10) & (grouped_neg["Units"] < 1),
@@ -434,93 +260,11 @@ def process_bidventor(file_path, output_dir):
                                  index=False)
 
         # Step C: Generate Amazon Upload File
-        amazon_upload = pd.DataFrame(columns=[
-            "Product", "Entity", "Operation", "Campaign ID", "Ad Group ID",
-            "Portfolio ID", "Ad ID", "Keyword ID", "Product Targeting ID",
-            "Campaign Name", "Ad Group Name", "Start Date", "End Date",
-            "Targeting Type", "State", "Daily Budget", "SKU",
-            "Ad Group Default Bid", "Bid", "Keyword Text",
-            "Native Language Keyword", "Native Language Locale", "Match Type",
-            "Bidding Strategy", "Placement", "Percentage",
-            "Product Targeting Expression"
-        ])
-
-        # Product Targeting
-        pt_rows = grouped_ptid.dropna(subset=["PTID_New_Bid"]).copy()
-        if not pt_rows.empty:
-            pt_rows["Product"] = "Sponsored Products"
-            pt_rows["Entity"] = "Product Targeting"
-            pt_rows["Operation"] = "Update"
-            pt_rows["State"] = "enabled"
-            pt_rows["Bid"] = pt_rows["PTID_New_Bid"]
-            amazon_upload = pd.concat([
-                amazon_upload,
-                pt_rows[amazon_upload.columns.intersection(pt_rows.columns)]
-            ])
-
-        # Keywords
-        kw_rows = grouped_kwid.dropna(subset=["KWID_New_Bid"]).copy()
-        if not kw_rows.empty:
-            kw_rows["Product"] = "Sponsored Products"
-            kw_rows["Entity"] = "Keyword ID"
-            kw_rows["Operation"] = "Update"
-            kw_rows["State"] = "enabled"
-            kw_rows["Bid"] = kw_rows["KWID_New_Bid"]
-            amazon_upload = pd.concat([
-                amazon_upload,
-                kw_rows[amazon_upload.columns.intersection(kw_rows.columns)]
-            ])
-
-        # Placements
-        plcmt_rows = grouped_placements.dropna(subset=["PLCMT_New_Bid"]).copy()
-        if not plcmt_rows.empty:
-            plcmt_rows["Product"] = "Sponsored Products"
-            plcmt_rows["Entity"] = "Bidding Adjustment"
-            plcmt_rows["Operation"] = "Update"
-            plcmt_rows["Percentage"] = plcmt_rows["PLCMT_New_Bid"]
-            amazon_upload = pd.concat([
-                amazon_upload, plcmt_rows[amazon_upload.columns.intersection(
-                    plcmt_rows.columns)]
-            ])
-
-        # Negative Keywords & Targets
-        neg_filter = (grouped_neg["Clicks"] >= 10) & (grouped_neg["Units"] < 1)
-
-        # Negative Keywords
-        neg_kw_rows = grouped_neg[neg_filter
-                                  & grouped_neg["NEG_KW_YES"]].copy()
-        if not neg_kw_rows.empty:
-            neg_kw_rows["Product"] = "Sponsored Products"
-            neg_kw_rows["Entity"] = "Negative Keyword"
-            neg_kw_rows["Operation"] = "Create"
-            neg_kw_rows["State"] = "enabled"
-            neg_kw_rows["Match Type"] = "negativeExact"
-            neg_kw_rows["Keyword Text"] = neg_kw_rows["Customer Search Term"]
-            amazon_upload = pd.concat([
-                amazon_upload, neg_kw_rows[amazon_upload.columns.intersection(
-                    neg_kw_rows.columns)]
-            ])
-
-        # Negative Product Targeting
-        neg_prod_rows = grouped_neg[neg_filter
-                                    & grouped_neg["NEG_PROD_YES"]].copy()
-        if not neg_prod_rows.empty:
-            neg_prod_rows["Product"] = "Sponsored Products"
-            neg_prod_rows["Entity"] = "Negative Product Targeting"
-            neg_prod_rows["Operation"] = "Create"
-            neg_prod_rows["State"] = "enabled"
-            amazon_upload = pd.concat([
-                amazon_upload,
-                neg_prod_rows[amazon_upload.columns.intersection(
-                    neg_prod_rows.columns)]
-            ])
-
-        # Remove duplicates and save
-        amazon_upload = amazon_upload.drop_duplicates()
-        ordered_cols = [
-            col for col in amazon_upload.columns if col in amazon_upload
-        ]
-        amazon_upload = amazon_upload[ordered_cols]
+        amazon_upload = build_amazon_upload(grouped_ptid,
+                                            grouped_kwid,
+                                            grouped_placements,
+                                            grouped_neg,
+                                            keyword_entity="Keyword ID")
         amazon_upload.to_excel(amazon_upload_path,
                                sheet_name="Sponsored Products Campaigns",
                                index=False)
@@ -543,9 +287,16 @@ def upload_file():
         return jsonify({'success': False, 'error': 'No selected file'}), 400
 
     if file and file.filename.endswith('.xlsx'):
+        upload_folder = Path(app.config['UPLOAD_FOLDER'])
+        if upload_folder.exists() and \
+                disk_usage(upload_folder) + (request.content_length or 0) > MAX_UPLOAD_BYTES:
+            return jsonify({'success': False, 'error': 'Not enough upload storage, retry later'}), 507
+        if not inflight_uploads.acquire(blocking=False):
+            return jsonify({'success': False, 'error': 'Too many uploads in progress, retry later'}), 503
+        upload_id = uuid.uuid4().hex
+        processing.add(upload_id)
         try:
             # Create unique upload directory
-            upload_id = uuid.uuid4().hex
             output_dir = os.path.join(app.config['UPLOAD_FOLDER'], upload_id)
             os.makedirs(output_dir, exist_ok=True)
 
@@ -585,6 +336,9 @@ def upload_file():
                     return jsonify({'success': False, 'error': 'Processing timeout'}), 408
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 500
+        finally:
+            processing.discard(upload_id)
+            inflight_uploads.release()
     else:
         return jsonify({'success': False, 'error': 'Invalid file type. Please upload .xlsx'}), 400
 
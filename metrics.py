@@ -0,0 +1,125 @@
+"""Minimal Prometheus metrics in the text exposition format.
+
+Metrics are plain in-process counters, so recording one costs a lock and an
+addition. All of them are recorded in the API server process: worker
+processes report their stage timings back with each job's result.
+"""
+import bisect
+from threading import Lock
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds, for request-scale latencies
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Seconds, for pipeline stages on files of up to a few million rows
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+BYTES_BUCKETS = tuple(2**20 * n for n in (1, 4, 16, 32, 64, 128, 256, 512))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(labels)
+        self._values = {}
+        self._lock = Lock()
+
+    def _key(self, labels):
+        return tuple(labels[name] for name in self.label_names)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            lines += self._samples()
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self):
+        if not self._values and not self.label_names:
+            return [f"{self.name} 0"]
+        return [f"{self.name}{_labels(self.label_names, key)} {_number(value)}"
+                for key, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """A gauge read from `callback` at scrape time."""
+    kind = "gauge"
+
+    def __init__(self, name, help, callback):
+        super().__init__(name, help)
+        self.callback = callback
+
+    def _samples(self):
+        return [f"{self.name} {_number(self.callback())}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def _samples(self):
+        lines = []
+        for key, (counts, total) in self._values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = _labels(self.label_names, key, [("le", _number(bound))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            labels = _labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {_number(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
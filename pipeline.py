@@ -0,0 +1,155 @@
+from functools import cached_property
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregation import (aggregate_placements, aggregate_search_terms,
+                         aggregate_targets, partition_rows, take_matching)
+from artifacts import (AMAZON_UPLOAD, IMPACT_REPORT, OPTIMIZATION_LOG,
+                       build_amazon_upload, write_workbook)
+from bid_rules import (DEFAULT_BID_RULES, add_performance_metrics,
+                       classify_search_terms, placement_new_bid)
+from impact_report import generate_impact_report, impact_kpis
+from ingest import SEARCH_TERM_SHEET, SP_SHEET
+from snapshots import optimize_targets
+
+# (snapshot name, Entity, ID column, column prefix) of the bid targets,
+# which are kept per account for delta optimization
+TARGETS = [
+    ("product_targeting", "Product Targeting", "Product Targeting ID", "PTID"),
+    ("keywords", "Keyword", "Keyword ID", "KWID"),
+]
+
+
+class Optimization:
+    """The grouped, bid-optimized frames of one bulk file."""
+
+    FRAMES = ["ptid", "kwid", "placements", "neg"]
+
+    def __init__(self, ptid, kwid, placements, neg, delta):
+        self.ptid = ptid
+        self.kwid = kwid
+        self.placements = placements
+        self.neg = neg
+        # {snapshot name: {"recomputed": n, "reused": n}}
+        self.delta = delta
+
+    def targets(self):
+        """Yields (target, grouped frame) for each of TARGETS."""
+        return zip(TARGETS, [self.ptid, self.kwid])
+
+    @cached_property
+    def kpis(self):
+        """The Impact Report's numbers, see impact_kpis()."""
+        return impact_kpis(self.ptid, self.kwid, self.neg)
+
+    def save(self, directory: Path):
+        """Pickles the frames to directory, for rendering artifacts later."""
+        directory.mkdir(parents=True, exist_ok=True)
+        for name in self.FRAMES:
+            getattr(self, name).to_pickle(directory / f"{name}.pkl")
+
+    @classmethod
+    def load(cls, directory: Path):
+        frames = [pd.read_pickle(directory / f"{name}.pkl") for name in cls.FRAMES]
+        return cls(*frames, delta={})
+
+
+def optimize(sheets, timer, previous=None, search_terms=None, rules=DEFAULT_BID_RULES):
+    """Aggregates the parsed bulk sheets and applies the bid rules.
+
+    previous maps snapshot names to the account's last snapshots, if any.
+    search_terms are search terms aggregated ahead of time, e.g. by
+    stream_search_terms(); sheets then needs no search term report. rules
+    is the BidRules rule set to apply.
+    Time is booked on the timer's "aggregation" and "bid_rules" stages.
+    """
+    previous = previous or {}
+    delta = {}
+    df_sp = sheets[SP_SHEET]
+    # Splits the sheet by Entity once instead of scanning it per entity
+    entity_rows = partition_rows(
+        df_sp, "Entity", [entity for _, entity, _, _ in TARGETS] + ["Bidding Adjustment"])
+
+    # ------- Product Targeting and Keyword IDs Processing -------
+    targets = []
+    for name, entity, key, prefix in TARGETS:
+        df_targets = take_matching(df_sp, entity_rows[entity], "State", "enabled")
+        grouped = aggregate_targets(df_targets, key)
+        timer.mark("aggregation")
+
+        # Calculate metrics and new bids
+        delta[name] = optimize_targets(grouped, key, prefix, previous.get(name), rules)
+        timer.mark("bid_rules")
+        targets.append(grouped)
+    grouped_ptid, grouped_kwid = targets
+
+    # ------- Placements Processing -------
+    df_placements = take_matching(df_sp, entity_rows["Bidding Adjustment"],
+                                  "Campaign State (Informational only)", "enabled")
+    grouped_placements = aggregate_placements(df_placements)
+    timer.mark("aggregation")
+
+    # Calculate placement metrics and new placement bids
+    add_performance_metrics(grouped_placements, "PLCMT", rules=rules)
+    grouped_placements["PLCMT_New_Bid"] = placement_new_bid(
+        grouped_placements["Percentage"], grouped_placements["PLCMT_DIFF_CPC"],
+        grouped_placements["Units"], rules)
+    timer.mark("bid_rules")
+
+    # ------- Negative Keywords Processing -------
+    if search_terms is None:
+        df_neg = sheets[SEARCH_TERM_SHEET]
+        df_neg = df_neg[df_neg["Campaign State (Informational only)"] == "enabled"]
+        grouped_neg = aggregate_search_terms(df_neg)
+        timer.mark("aggregation")
+    else:
+        grouped_neg = search_terms
+
+    add_performance_metrics(grouped_neg, "NEGKWS", ideal_cpc=False)
+    is_asin, expressions = classify_search_terms(grouped_neg["Customer Search Term"])
+    grouped_neg["NEG_KW_YES"] = ~is_asin
+    grouped_neg["NEG_PROD_YES"] = is_asin
+    grouped_neg["Product Targeting Expression"] = expressions
+    grouped_neg["Bidventor Action"] = np.where(
+        (grouped_neg["Clicks"] >= 10) & (grouped_neg["Units"] < 1),
+        "To be added as Negative Search term to avoid wasted ad spend",
+        ""
+    )
+    timer.mark("bid_rules")
+
+    return Optimization(grouped_ptid, grouped_kwid, grouped_placements,
+                        grouped_neg, delta)
+
+
+def render_optimization_log(result, path, concurrent=False):
+    write_workbook(path, [
+        ("Product Targeting IDs", result.ptid),
+        ("Keyword ID", result.kwid),
+        ("Placements", result.placements),
+        ("Negative KWs & Targets", result.neg),
+    ], concurrent=concurrent)
+
+
+def render_amazon_upload(result, path):
+    amazon_upload = build_amazon_upload(result.ptid, result.kwid,
+                                        result.placements, result.neg)
+    write_workbook(path, [("Sponsored Products Campaigns", amazon_upload)])
+
+
+def render_impact_report(result, path):
+    generate_impact_report(result.kpis, path)
+
+
+def render_artifact(result, name, output_dir: Path, concurrent_sheets=False):
+    """Renders the artifact with file name `name` into output_dir."""
+    path = output_dir / name
+    if name == OPTIMIZATION_LOG:
+        render_optimization_log(result, path, concurrent_sheets)
+    elif name == AMAZON_UPLOAD:
+        render_amazon_upload(result, path)
+    elif name == IMPACT_REPORT:
+        render_impact_report(result, path)
+    else:
+        raise ValueError(f"Unknown artifact: {name}")
@@ -0,0 +1,255 @@
+"""Job entry points run on the executor's workers.
+
+Every pool worker imports this module (through the pickled reference to
+process_bidventor), so importing it must not do anything beyond defining
+things: the app, temp directories, rule sets and the result cache stay in
+app.py, and the caches workers need are built on first use.
+"""
+import mmap
+import multiprocessing
+import os
+import signal
+import time
+from contextlib import nullcontext
+from functools import lru_cache, partial
+from pathlib import Path
+
+from artifacts import ARTIFACTS, describe, render_artifacts
+from bid_rules import DEFAULT_BID_RULES
+from ingest import (SEARCH_TERM_SHEET, SP_SHEET, compact_frames, read_bulk_sheets,
+                    sheet_sizes)
+from jobs import StageTimer
+from pipeline import TARGETS, Optimization, optimize, render_artifact
+from profiling import PROFILE_FILES, profiled
+from sheet_cache import SheetCache, content_key
+from snapshots import AccountSnapshots
+from streaming import stream_search_terms
+
+# Chunks and assembled uploads, plus the spill directories of streamed
+# search terms (see spill_dir())
+TEMP_DIR = Path("temp_chunks")
+
+# Bulk files over this size aggregate their search term report batch by
+# batch instead of loading it whole (0 disables streaming)
+STREAM_SEARCH_TERMS_BYTES = int(os.environ.get("STREAM_SEARCH_TERMS_BYTES", 256 * 1024**2))
+STREAM_BATCH_ROWS = int(os.environ.get("STREAM_BATCH_ROWS", 100000))
+# Distinct search term keys held in memory before they spill to disk
+STREAM_MAX_KEYS = int(os.environ.get("STREAM_MAX_KEYS", 2000000))
+
+# Fill the Optimization Log's sheets from one thread each
+XLSX_CONCURRENT_SHEETS = os.environ.get("XLSX_CONCURRENT_SHEETS", "0") == "1"
+
+# "process" renders the three artifacts in forked children (only safe inside
+# single-threaded pool workers), "thread" in a thread pool, "serial" in turn
+ARTIFACT_RENDERING = os.environ.get(
+    "ARTIFACT_RENDERING",
+    "process" if os.environ.get("EXECUTOR_BACKEND", "process") == "process" else "thread")
+
+SHEET_CACHE_DIR = Path(os.environ.get("SHEET_CACHE_DIR", "sheet_cache"))
+SHEET_CACHE_MAX_BYTES = int(os.environ.get("SHEET_CACHE_MAX_BYTES", 2 * 1024**3))
+
+# Per-account snapshots of the last run's targets, for delta optimization
+ACCOUNT_SNAPSHOT_DIR = Path(os.environ.get("ACCOUNT_SNAPSHOT_DIR", "account_snapshots"))
+
+# Subdirectory of a profiled job's results holding the profiler dumps
+PROFILE_DIR = "profile"
+# Subdirectory of a job's results holding the frames of deferred artifacts
+FRAMES_DIR = "frames"
+
+
+@lru_cache(maxsize=None)
+def get_sheet_cache():
+    """This process's SheetCache, created on first use."""
+    return SheetCache(SHEET_CACHE_DIR, SHEET_CACHE_MAX_BYTES)
+
+
+@lru_cache(maxsize=None)
+def get_account_snapshots():
+    """This process's AccountSnapshots, created on first use."""
+    return AccountSnapshots(ACCOUNT_SNAPSHOT_DIR)
+
+
+def file_content_key(file_path: Path) -> str:
+    with open(file_path, "rb") as f, \
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as content:
+        return content_key(content)
+
+
+def spill_dir(file_path: Path) -> Path:
+    """Directory the job for the upload at file_path spills search terms to.
+
+    Named after the upload, so that it is deleted along with it and the
+    reaper can tell which job it belongs to.
+    """
+    return file_path.with_suffix(".spill")
+
+
+def artifact_stage(name):
+    """Timing stage of an artifact, e.g. "amazon_upload" for Amazon_Upload.xlsx."""
+    return Path(name).stem.lower()
+
+
+def process_bidventor(file_path: Path, output_dir: Path, account_id: str = None,
+                      profile: bool = False, render=None, cache_key: str = None,
+                      rules=DEFAULT_BID_RULES):
+    """Optimizes one bulk file and renders its artifacts into output_dir.
+
+    With an account_id, targets unchanged since the account's last run reuse
+    that run's bids and only the rest are recomputed. With profile, the job
+    runs under cProfile and tracemalloc, rendering its artifacts serially so
+    that they are profiled too, and the dumps go to output_dir/profile.
+    render names the artifacts to render now (all if None); the frames are
+    kept in output_dir/frames so that render_deferred() can do the rest.
+    cache_key is the file's content_key(), if the caller already has it.
+    rules is the BidRules rule set to optimize with.
+    """
+    timer = StageTimer()
+    profile_dir = output_dir / PROFILE_DIR
+    sheet_cache = get_sheet_cache()
+    account_snapshots = get_account_snapshots()
+    try:
+        with profiled(profile_dir) if profile else nullcontext():
+            if cache_key is None:
+                cache_key = file_content_key(file_path)
+            # Oversized files stream the search term report separately below
+            streaming = 0 < STREAM_SEARCH_TERMS_BYTES < file_path.stat().st_size
+            sheet_names = (SP_SHEET,) if streaming else (SP_SHEET, SEARCH_TERM_SHEET)
+            sheet_bytes = sheet_sizes(file_path)
+            sheets = sheet_cache.get(cache_key, sheet_names)
+            sheet_cache_hit = sheets is not None
+            if sheets is None:
+                sheets, parse_timings = read_bulk_sheets(file_path, sheet_names)
+                timer.mark("ingest")
+                # Parts of "ingest", reported on their own as well
+                for sheet, seconds in parse_timings.items():
+                    timer.record(f"parse:{sheet}", seconds)
+                # Cached compact, so that hits have next to nothing to convert
+                compact_bytes = compact_frames(sheets)
+                timer.mark("compact")
+                sheet_cache.put(cache_key, sheets)
+                timer.mark("sheet_cache_write")
+            else:
+                compact_bytes = compact_frames(sheets)
+                timer.mark("ingest")
+            input_rows = {sheet: len(frame) for sheet, frame in sheets.items()}
+
+            search_terms = None
+            if streaming:
+                spill_dir(file_path).mkdir(exist_ok=True)
+                search_terms, stream_stats = stream_search_terms(
+                    file_path, STREAM_BATCH_ROWS, STREAM_MAX_KEYS, spill_dir(file_path))
+                input_rows[SEARCH_TERM_SHEET] = stream_stats["rows"]
+                timer.mark("search_term_stream")
+
+            output_dir.mkdir(parents=True, exist_ok=True)
+
+            previous = {}
+            if account_id:
+                for name, _, key, _ in TARGETS:
+                    previous[name] = account_snapshots.load(account_id, name, key, rules)
+            result = optimize(sheets, timer, previous, search_terms, rules)
+
+            if account_id:
+                for (name, _, key, prefix), grouped in result.targets():
+                    account_snapshots.save(account_id, name, grouped, key, prefix, rules)
+                timer.mark("snapshot")
+
+            kpis = result.kpis
+            timer.mark("kpis")
+
+            # ------- Render Optimization Log, Amazon Upload and Impact Report -------
+            render = ARTIFACTS if render is None else render
+            deferred = [name for name in ARTIFACTS if name not in render]
+            if deferred:
+                result.save(output_dir / FRAMES_DIR)
+                timer.mark("frames")
+            if render:
+                render_timings = render_artifacts({
+                    artifact_stage(name): partial(render_artifact, result, name,
+                                                  output_dir, XLSX_CONCURRENT_SHEETS)
+                    for name in render
+                }, mode="serial" if profile else ARTIFACT_RENDERING)
+                timer.mark("artifacts")
+                for name, seconds in render_timings.items():
+                    timer.record(name, seconds)
+
+            files = {name: {**describe(output_dir / name), "rendered": True}
+                     if name in render else {"rendered": False}
+                     for name in ARTIFACTS}
+            timer.mark("manifest")
+            response = {"success": True, "files": files, "kpis": kpis,
+                        "timings": timer.timings,
+                        "sheetCacheHit": sheet_cache_hit,
+                        "inputRows": input_rows,
+                        "sheetBytes": sheet_bytes,
+                        "inputBytes": {"before": compact_bytes[0],
+                                       "after": compact_bytes[1],
+                                       "saved": compact_bytes[0] - compact_bytes[1]}}
+            if streaming:
+                response["searchTermStream"] = stream_stats
+            if account_id:
+                response["delta"] = {
+                    "recomputed": sum(d["recomputed"] for d in result.delta.values()),
+                    "reused": sum(d["reused"] for d in result.delta.values()),
+                    **result.delta,
+                }
+        if profile:
+            response["profile"] = {name: describe(profile_dir / name)
+                                   for name in PROFILE_FILES}
+        return response
+
+    except Exception as e:
+        return {"success": False, "error": str(e), "timings": timer.timings}
+
+
+def render_deferred(output_dir: Path, name: str):
+    """Renders an artifact process_bidventor() left out, from its saved frames.
+
+    Returns the artifact's manifest entry and render time in seconds.
+    """
+    started = time.perf_counter()
+    result = Optimization.load(output_dir / FRAMES_DIR)
+    render_artifact(result, name, output_dir, XLSX_CONCURRENT_SHEETS)
+    return describe(output_dir / name), time.perf_counter() - started
+
+
+def _process_in_child(results, args):
+    # A process group of its own, so that a timeout also stops the artifact
+    # renderers it forks
+    os.setpgid(0, 0)
+    results.put(process_bidventor(*args))
+
+
+def process_bidventor_with_timeout(timeout, *args):
+    """Runs process_bidventor(*args) in a forked child, killed once it has
+    run for timeout seconds (0 runs it here, without a limit).
+
+    The clock starts when a worker picks the job up, so time spent queued
+    does not count. Killing the child rather than the worker frees the
+    worker straight away without breaking its pool. Use it only from
+    single-threaded worker processes.
+    """
+    if not timeout:
+        return process_bidventor(*args)
+    context = multiprocessing.get_context("fork")
+    results = context.SimpleQueue()
+    child = context.Process(target=_process_in_child, args=(results, args))
+    child.start()
+    deadline = time.monotonic() + timeout
+    while results.empty() and child.is_alive() and time.monotonic() < deadline:
+        child.join(timeout=0.1)
+    if not results.empty():
+        result = results.get()
+        child.join()
+        return result
+    if not child.is_alive():
+        return {"success": False, "timings": {},
+                "error": f"Processing exited with code {child.exitcode}"}
+    try:
+        os.killpg(child.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # Killed before it got to set up its process group
+        child.kill()
+    child.join()
+    return {"success": False, "timedOut": True, "timings": {},
+            "error": f"Processing timed out after {timeout}s"}
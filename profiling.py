@@ -0,0 +1,67 @@
+import cProfile
+import io
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+
+PROFILE_STATS = "profile.pstats"
+PROFILE_SUMMARY = "profile.txt"
+ALLOCATIONS = "allocations.txt"
+PROFILE_FILES = [PROFILE_STATS, PROFILE_SUMMARY, ALLOCATIONS]
+
+# Frames kept per traced allocation; more gives better attribution but
+# makes tracing slower
+TRACE_FRAMES = 5
+
+
+def _write_summary(profiler, path, top):
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    path.write_text(out.getvalue())
+
+
+def _write_allocations(snapshot, peak, path, top):
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    ])
+    stats = snapshot.statistics("lineno")
+    lines = [
+        f"Peak traced memory: {peak / 2**20:.1f} MiB",
+        f"Live at end: {sum(stat.size for stat in stats) / 2**20:.1f} MiB",
+        "",
+        f"Top {top} allocation sites still live at the end of the job:",
+    ]
+    for stat in stats[:top]:
+        frame = stat.traceback[0]
+        lines.append(f"{stat.size / 2**20:10.2f} MiB {stat.count:9d} blocks  "
+                     f"{frame.filename}:{frame.lineno}")
+    path.write_text("\n".join(lines) + "\n")
+
+
+@contextmanager
+def profiled(output_dir: Path, top=40):
+    """Runs the block under cProfile and tracemalloc.
+
+    Writes the raw profile (for pstats or snakeviz), a text summary and the
+    top allocation sites to output_dir. The allocation snapshot is taken as
+    the block exits, so it shows what the job still holds at that point.
+    """
+    profiler = cProfile.Profile()
+    tracemalloc.start(TRACE_FRAMES)
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        output_dir.mkdir(parents=True, exist_ok=True)
+        profiler.dump_stats(str(output_dir / PROFILE_STATS))
+        _write_summary(profiler, output_dir / PROFILE_SUMMARY, top)
+        _write_allocations(snapshot, peak, output_dir / ALLOCATIONS, top)
@@ -0,0 +1,152 @@
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def disk_usage(path: Path) -> int:
+    """Bytes in the files under path (a file counts itself)."""
+    if path.is_file():
+        return path.stat().st_size
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.stat(os.path.join(root, name)).st_size
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def last_modified(path: Path) -> float:
+    """Newest modification time of path and everything under it."""
+    newest = path.stat().st_mtime
+    if path.is_dir():
+        for root, dirs, files in os.walk(path):
+            for name in dirs + files:
+                try:
+                    newest = max(newest, os.stat(os.path.join(root, name)).st_mtime)
+                except FileNotFoundError:
+                    pass
+    return newest
+
+
+def remove(path: Path) -> int:
+    """Deletes a file or directory tree; returns the bytes it held."""
+    try:
+        size = disk_usage(path)
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            path.unlink(missing_ok=True)
+    except FileNotFoundError:
+        return 0
+    return size
+
+
+class DiskUsage:
+    """Running total of the bytes under a directory, read without walking it.
+
+    Callers report each file they write or delete there with update(), which
+    stats just that file, and delete through remove(). refresh() walks the
+    whole directory to pick up everything else, e.g. what worker processes
+    write to subdirectories; call it from a background thread now and then.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        # {file: size} of the directory's top-level files
+        self._files = {}
+        self._files_bytes = 0
+        # Bytes in subdirectories as of the last refresh()
+        self._dirs_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def bytes(self) -> int:
+        with self._lock:
+            return self._files_bytes + self._dirs_bytes
+
+    def update(self, path: Path):
+        """Re-reads the size of a top-level file, 0 if it is gone."""
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            size = 0
+        with self._lock:
+            self._files_bytes += size - self._files.pop(path, 0)
+            if size:
+                self._files[path] = size
+
+    def remove(self, path: Path) -> int:
+        """Deletes a top-level file or directory; returns the bytes it held."""
+        is_dir = path.is_dir()
+        freed = remove(path)
+        if is_dir:
+            with self._lock:
+                self._dirs_bytes = max(0, self._dirs_bytes - freed)
+        else:
+            self.update(path)
+        return freed
+
+    def refresh(self) -> int:
+        """Recounts the directory from disk; returns the new total."""
+        files, dirs_bytes = {}, 0
+        if self.directory.exists():
+            for path in self.directory.iterdir():
+                try:
+                    if path.is_dir():
+                        dirs_bytes += disk_usage(path)
+                    else:
+                        files[path] = path.stat().st_size
+                except FileNotFoundError:
+                    pass
+        with self._lock:
+            self._files = files
+            self._files_bytes = sum(files.values())
+            self._dirs_bytes = dirs_bytes
+            return self._files_bytes + self._dirs_bytes
+
+
+def reap_idle(directory: Path, ttl, keep=lambda path: False):
+    """Deletes the entries of directory untouched for more than ttl seconds.
+
+    Entries for which keep(path) is true are left alone. Returns (entries
+    deleted, bytes freed).
+    """
+    if not directory.exists():
+        return 0, 0
+    cutoff = time.time() - ttl
+    count = freed = 0
+    for path in directory.iterdir():
+        if keep(path):
+            continue
+        try:
+            if last_modified(path) >= cutoff:
+                continue
+        except FileNotFoundError:
+            continue
+        freed += remove(path)
+        count += 1
+    if count:
+        logger.info(f"Reaped {count} idle entries ({freed} bytes) from {directory}")
+    return count, freed
+
+
+def start_reaper(interval, reap):
+    """Calls reap() every interval seconds from a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                reap()
+            except Exception:
+                logger.exception("Reaper pass failed")
+
+    thread = threading.Thread(target=run, name="reaper", daemon=True)
+    thread.start()
+    return thread
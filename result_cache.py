@@ -0,0 +1,69 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+from pathlib import Path
+
+from disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+RESULT_FILE = "result.json"
+
+
+def result_key(content_key, rules):
+    """Cache key of a bulk file's results: its content hash and the rules digest."""
+    return hashlib.sha256(f"{content_key}:{rules}".encode()).hexdigest()
+
+
+def _link_or_copy(source: Path, target: Path):
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+
+class ResultCache(DiskCache):
+    """Rendered artifacts and the job result of optimized bulk files.
+
+    Each entry is a directory holding the artifacts and result.json, keyed by
+    result_key(). Files are hard-linked in and out where the filesystem
+    allows, so a hit costs no copying. The least recently used entries are
+    evicted once the cache grows past max_bytes. Changed rules get keys of
+    their own, so the entries made under the old rules simply age out.
+    """
+
+    def get(self, key, output_dir: Path):
+        """Links a cached entry's artifacts into output_dir and returns its
+        result, or returns None."""
+        if not self.enabled:
+            return None
+        entry = self.directory / key
+        with self._lock:
+            if not (entry / RESULT_FILE).exists():
+                self.misses += 1
+                return None
+            self.touch(entry)
+            result = json.loads((entry / RESULT_FILE).read_text())
+            output_dir.mkdir(parents=True, exist_ok=True)
+            for name in result["files"]:
+                _link_or_copy(entry / name, output_dir / name)
+            self.hits += 1
+        return result
+
+    def put(self, key, output_dir: Path, result):
+        """Stores the artifacts in result["files"] from output_dir."""
+        if not self.enabled:
+            return
+        staging = None
+        try:
+            staging = self.staging(key)
+            for name in result["files"]:
+                _link_or_copy(output_dir / name, staging / name)
+            (staging / RESULT_FILE).write_text(json.dumps(result))
+            self.commit(key, staging)
+        except OSError as e:
+            logger.warning(f"Could not cache results for {key}: {e}")
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
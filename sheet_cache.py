@@ -0,0 +1,111 @@
+import hashlib
+import logging
+import shutil
+
+import numpy as np
+
+from disk_cache import DiskCache
+
+logger = logging.getLogger(__name__)
+
+
+def _slug(sheet):
+    return "".join(c if c.isalnum() else "_" for c in sheet)
+
+
+def content_key(content) -> str:
+    """sha256 of the uploaded workbook bytes."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def chunked_content_key(chunk_digests) -> str:
+    """Key of an upload from the sha256 hex digests of its chunks, in order.
+
+    Equal digest lists mean equal chunks and so equal bytes, so this keys
+    the workbook as surely as content_key() without reading it again. The
+    two keys differ for the same bytes, as do those of one workbook sent in
+    chunks of different sizes; those only miss each other's entries.
+    """
+    return hashlib.sha256(",".join(chunk_digests).encode()).hexdigest()
+
+
+class SheetCache(DiskCache):
+    """Parsed bulk sheets stored as Arrow IPC files, keyed by upload hash.
+
+    Each entry is a directory holding one .arrow file per sheet. Entries are
+    read back through a memory map, and the least recently used ones are
+    evicted once the cache grows past max_bytes. The cache is disabled when
+    pyarrow is not installed.
+    """
+
+    def __init__(self, directory, max_bytes):
+        try:
+            import pyarrow  # noqa: F401
+            available = True
+        except ImportError:
+            logger.warning("pyarrow is not installed; sheet cache disabled")
+            available = False
+        super().__init__(directory, max_bytes, available)
+
+    def get(self, key, sheets):
+        """Returns {sheet: DataFrame} for a cached upload, or None.
+
+        An entry evicted while it is being read also gives None.
+        """
+        if not self.enabled:
+            return None
+        import pyarrow as pa
+
+        entry = self.directory / key
+        paths = {sheet: entry / f"{_slug(sheet)}.arrow" for sheet in sheets}
+        with self._lock:
+            if not all(path.exists() for path in paths.values()):
+                return None
+            try:
+                self.touch(entry)
+            except FileNotFoundError:
+                return None
+
+        frames = {}
+        for sheet, path in paths.items():
+            try:
+                with pa.memory_map(str(path)) as source:
+                    frame = pa.ipc.open_file(source).read_all().to_pandas()
+            except FileNotFoundError:
+                return None
+            for col in frame.columns[frame.dtypes == object]:
+                frame[col] = frame[col].where(frame[col].notna(), np.nan)
+            frames[sheet] = frame
+        return frames
+
+    def record_lookup(self, hit):
+        """Counts a get() in the hit/miss stats.
+
+        Kept separate from get() because lookups may run in worker processes
+        while the stats live in the server process.
+        """
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def put(self, key, frames):
+        if not self.enabled:
+            return
+        import pyarrow as pa
+
+        staging = None
+        try:
+            staging = self.staging(key)
+            for sheet, frame in frames.items():
+                table = pa.Table.from_pandas(frame, preserve_index=False)
+                with pa.OSFile(str(staging / f"{_slug(sheet)}.arrow"),
+                               "wb") as sink:
+                    with pa.ipc.new_file(sink, table.schema) as writer:
+                        writer.write_table(table)
+            self.commit(key, staging)
+        except (pa.ArrowException, OSError) as e:
+            logger.warning(f"Could not cache sheets for {key}: {e}")
+            if staging is not None:
+                shutil.rmtree(staging, ignore_errors=True)
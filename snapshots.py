@@ -0,0 +1,137 @@
+import hashlib
+import logging
+import os
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+from aggregation import METRIC_COLUMNS
+from bid_rules import DEFAULT_BID_RULES, add_performance_metrics, target_new_bid
+
+logger = logging.getLogger(__name__)
+
+# Everything the target bid rule reads; a row whose inputs all match the
+# snapshot gets exactly the same metrics and bid as last time
+TARGET_INPUT_COLUMNS = METRIC_COLUMNS + ["Bid"]
+# Schema metadata key holding the digest of the rules a snapshot was made under
+RULES_METADATA = b"bidventor.rules"
+
+
+def target_output_columns(prefix):
+    return [f"{prefix}_ROAS", f"{prefix}_CPC", f"{prefix}_IDEAL_CPC",
+            f"{prefix}_DIFF_CPC", f"{prefix}_New_Bid"]
+
+
+def _same(current, previous):
+    return (current == previous) | (np.isnan(current) & np.isnan(previous))
+
+
+def optimize_targets(grouped, key, prefix, previous=None, rules=DEFAULT_BID_RULES):
+    """Adds the performance metrics and <prefix>_New_Bid to grouped targets.
+
+    previous is the snapshot of the account's last run under the same rules,
+    indexed by key. Rows whose inputs are unchanged since then take their
+    outputs from it and only the rest go through the bid rule. Returns
+    {"recomputed": n, "reused": n}.
+    """
+    if previous is None or previous.empty or grouped.empty:
+        add_performance_metrics(grouped, prefix, rules=rules)
+        grouped[f"{prefix}_New_Bid"] = target_new_bid(
+            grouped["Bid"], grouped[f"{prefix}_DIFF_CPC"], grouped["Units"], rules)
+        return {"recomputed": len(grouped), "reused": 0}
+
+    positions = previous.index.get_indexer(grouped[key])
+    reuse = positions >= 0
+    for col in TARGET_INPUT_COLUMNS:
+        reuse &= _same(grouped[col].to_numpy(dtype=float),
+                       previous[col].to_numpy(dtype=float)[positions])
+
+    changed = grouped.loc[~reuse, TARGET_INPUT_COLUMNS].copy()
+    add_performance_metrics(changed, prefix, rules=rules)
+    changed[f"{prefix}_New_Bid"] = target_new_bid(
+        changed["Bid"], changed[f"{prefix}_DIFF_CPC"], changed["Units"], rules)
+
+    for col in target_output_columns(prefix):
+        values = np.empty(len(grouped), dtype=float)
+        values[reuse] = previous[col].to_numpy(dtype=float)[positions[reuse]]
+        values[~reuse] = changed[col].to_numpy(dtype=float)
+        grouped[col] = values
+    reused = int(reuse.sum())
+    return {"recomputed": len(grouped) - reused, "reused": reused}
+
+
+class AccountSnapshots:
+    """Per-account snapshots of the grouped targets, one Arrow file each.
+
+    A snapshot keeps only the entity ID, the bid rule's inputs and its
+    outputs, so that the next upload for the account can skip the entities
+    whose metrics have not moved. Disabled when pyarrow is not installed.
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        try:
+            import pyarrow  # noqa: F401
+            self.enabled = True
+        except ImportError:
+            logger.warning("pyarrow is not installed; account snapshots disabled")
+            self.enabled = False
+        if self.enabled:
+            self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, account_id, name):
+        # Account IDs come from the client, so never use them as paths
+        account = hashlib.sha256(account_id.encode()).hexdigest()[:32]
+        return self.directory / account / f"{name}.arrow"
+
+    def load(self, account_id, name, key, rules=DEFAULT_BID_RULES):
+        """Returns the last snapshot indexed by key, or None if there is none
+        or it was made under other rules."""
+        if not self.enabled:
+            return None
+        import pyarrow as pa
+
+        path = self._path(account_id, name)
+        try:
+            with pa.memory_map(str(path)) as source:
+                table = pa.ipc.open_file(source).read_all()
+        except FileNotFoundError:
+            return None
+        except (pa.ArrowException, OSError) as e:
+            logger.warning(f"Ignoring unreadable snapshot {path}: {e}")
+            return None
+        if (table.schema.metadata or {}).get(RULES_METADATA) != rules.digest.encode():
+            return None
+        return table.to_pandas().set_index(key)
+
+    def save(self, account_id, name, grouped, key, prefix, rules=DEFAULT_BID_RULES):
+        if not self.enabled:
+            return
+        import pyarrow as pa
+
+        path = self._path(account_id, name)
+        staging = None
+        columns = [key] + TARGET_INPUT_COLUMNS + target_output_columns(prefix)
+        options = pa.ipc.IpcWriteOptions(
+            compression="zstd" if pa.Codec.is_available("zstd") else None)
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # One staging file per writer, as concurrent runs for an account
+            # may share a process on the thread backend
+            fd, staging = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp",
+                                           dir=path.parent)
+            os.close(fd)
+            staging = Path(staging)
+            table = pa.Table.from_pandas(grouped[columns], preserve_index=False)
+            table = table.replace_schema_metadata(
+                {**table.schema.metadata, RULES_METADATA: rules.digest})
+            with pa.OSFile(str(staging), "wb") as sink:
+                with pa.ipc.new_file(sink, table.schema, options=options) as writer:
+                    writer.write_table(table)
+            # Concurrent runs for one account simply leave the last snapshot
+            staging.replace(path)
+        except (pa.ArrowException, OSError) as e:
+            logger.warning(f"Could not save snapshot {path}: {e}")
+            if staging is not None:
+                staging.unlink(missing_ok=True)
@@ -102,13 +102,34 @@ export default function LandingPage() {
             throw new Error(`Final request failed: ${finalResponse.status} - ${errorText}`);
         }
 
-        const data = await finalResponse.json();
+        // The complete request only queues the job; poll it until it finishes
+        let data = await finalResponse.json();
+        while (data.status === 'queued' || data.status === 'running') {
+            await new Promise((resolve) => setTimeout(resolve, 2000));
+            const jobResponse = await fetch(`https://babend-adeel.replit.app/jobs/${data.jobId}`, {
+                headers: {
+                    'Accept': 'application/json',
+                },
+            });
+
+            if (!jobResponse.ok) {
+                const errorText = await jobResponse.text();
+                throw new Error(`Job status request failed: ${jobResponse.status} - ${errorText}`);
+            }
+
+            data = await jobResponse.json();
+        }
         console.log('Final response:', data);
 
+        if (data.status === 'failed') {
+            throw new Error(`Processing failed: ${data.error}`);
+        }
+
         if (data) {
             setFiles(data.files);
-            setDownloadUrl(data.files['Amazon_Upload.xlsx']);
-            setDownloadUrlPdf(data.files['Impact_Report.pdf']);
+            // Each file is a manifest entry; its url is relative to the API
+            setDownloadUrl(`https://babend-adeel.replit.app${data.files['Amazon_Upload.xlsx'].url}`);
+            setDownloadUrlPdf(`https://babend-adeel.replit.app${data.files['Impact_Report.pdf'].url}`);
             toast.success('File uploaded successfully');
         }
 
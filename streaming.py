@@ -0,0 +1,116 @@
+import logging
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from aggregation import (METRIC_COLUMNS, SEARCH_TERM_FIRST_COLUMNS,
+                         SEARCH_TERM_KEYS, aggregate)
+from ingest import SEARCH_TERM_SHEET, iter_sheet_batches
+
+logger = logging.getLogger(__name__)
+
+# Position of each key's first row in the sheet, to restore
+# first-appearance order once the partial aggregates are merged
+FIRST_ROW = "_first_row"
+
+
+def _fold(frame):
+    return aggregate(frame, SEARCH_TERM_KEYS, METRIC_COLUMNS,
+                     SEARCH_TERM_FIRST_COLUMNS + [FIRST_ROW])
+
+
+def _hash_key_columns(frame):
+    # Hash numbers as float64 and text as objects, so that a key hashes the
+    # same whichever dtype its batch happened to get
+    keys = pd.DataFrame({
+        key: frame[key].astype("float64")
+        if pd.api.types.is_numeric_dtype(frame[key]) else frame[key].astype(object)
+        for key in SEARCH_TERM_KEYS
+    })
+    return pd.util.hash_pandas_object(keys, index=False).to_numpy()
+
+
+class SearchTermAggregator:
+    """Folds batches of search term rows into running per-key aggregates.
+
+    Memory holds one row per key seen since the last spill. Past max_keys
+    the running aggregates are hash-partitioned by key and written to
+    spill_dir, and folding starts over. finish() then merges the spilled
+    partials one partition at a time.
+    """
+
+    def __init__(self, max_keys, spill_dir, partitions=16):
+        self.max_keys = max_keys
+        self.partitions = partitions
+        self.rows = 0
+        self.spills = 0
+        self._running = None
+        self._spill_dir = Path(tempfile.mkdtemp(prefix="search_terms_", dir=spill_dir))
+
+    def add(self, batch):
+        batch = batch.reset_index(drop=True)
+        batch[FIRST_ROW] = np.arange(self.rows, self.rows + len(batch))
+        self.rows += len(batch)
+        batch = batch[batch["Campaign State (Informational only)"] == "enabled"]
+        if self._running is not None:
+            batch = pd.concat([self._running, batch], ignore_index=True)
+        self._running = _fold(batch)
+        if len(self._running) > self.max_keys:
+            self._spill()
+
+    def _spill(self):
+        partition = _hash_key_columns(self._running) % self.partitions
+        for p in range(self.partitions):
+            self._running[partition == p].to_pickle(
+                self._spill_dir / f"{p}_{self.spills}.pkl")
+        logger.info(f"Spilled {len(self._running)} search term keys to disk")
+        self.spills += 1
+        self._running = None
+
+    def finish(self):
+        """Returns the aggregated search terms, like aggregate_search_terms()."""
+        if self.spills:
+            if self._running is not None:
+                self._spill()
+            merged = []
+            for p in range(self.partitions):
+                partials = pd.concat(
+                    [pd.read_pickle(self._spill_dir / f"{p}_{spill}.pkl")
+                     for spill in range(self.spills)], ignore_index=True)
+                # Earliest partial first, so "first" keeps the sheet's first value
+                partials = partials.sort_values(FIRST_ROW, kind="stable")
+                merged.append(_fold(partials))
+            grouped = pd.concat(merged, ignore_index=True)
+            grouped = grouped.sort_values(FIRST_ROW, kind="stable")
+        elif self._running is not None:
+            grouped = self._running
+        else:
+            grouped = _fold(pd.DataFrame(columns=SEARCH_TERM_KEYS + METRIC_COLUMNS +
+                                         SEARCH_TERM_FIRST_COLUMNS + [FIRST_ROW]))
+        return grouped.drop(columns=FIRST_ROW).reset_index(drop=True)
+
+    def close(self):
+        shutil.rmtree(self._spill_dir, ignore_errors=True)
+
+
+def stream_search_terms(source, batch_rows, max_keys, spill_dir):
+    """Aggregates a bulk file's search term report without loading it whole.
+
+    Rows are read batch_rows at a time, so memory is bounded by the number
+    of distinct keys (and by max_keys, past which they spill to spill_dir)
+    rather than by the number of rows. Float sums can differ from the
+    in-memory aggregation in the last digits, as they are added up in a
+    different order. Returns the grouped frame and
+    {"rows": n, "spills": n}.
+    """
+    aggregator = SearchTermAggregator(max_keys, spill_dir)
+    try:
+        for batch in iter_sheet_batches(source, SEARCH_TERM_SHEET, batch_rows):
+            aggregator.add(batch)
+        grouped = aggregator.finish()
+        return grouped, {"rows": aggregator.rows, "spills": aggregator.spills}
+    finally:
+        aggregator.close()
@@ -0,0 +1,137 @@
+"""The pre-vectorization bid rules and Amazon Upload builder, row by row.
+
+Lifted verbatim out of the original process_bidventor, as the reference the
+vectorized code is tested against.
+"""
+import numpy as np
+import pandas as pd
+
+
+def baseline_metrics(grouped, prefix, ideal_cpc=True):
+    metrics = pd.DataFrame(index=grouped.index)
+    metrics[f"{prefix}_ROAS"] = grouped.apply(
+        lambda x: x["Sales"] / x["Spend"] if x["Spend"] > 0 else 0, axis=1)
+    metrics[f"{prefix}_CPC"] = grouped.apply(
+        lambda x: x["Spend"] / x["Clicks"] if x["Clicks"] > 0 else 0, axis=1)
+    if ideal_cpc:
+        metrics[f"{prefix}_IDEAL_CPC"] = grouped.apply(
+            lambda x: (x["Sales"] * 0.2) / x["Clicks"] if x["Clicks"] > 0 else 0, axis=1)
+        metrics[f"{prefix}_DIFF_CPC"] = metrics.apply(
+            lambda x: (x[f"{prefix}_IDEAL_CPC"] - x[f"{prefix}_CPC"]) / x[f"{prefix}_CPC"]
+            if x[f"{prefix}_CPC"] > 0 else 0, axis=1)
+    return metrics
+
+
+def baseline_target_new_bid(row, diff_cpc):
+    bid = row["Bid"]
+    if pd.isna(bid) or bid == 0:
+        return np.nan
+    if row[diff_cpc] < 0 and row["Units"] > 3:
+        return max(0.02, bid + (bid * row[diff_cpc]))
+    if row[diff_cpc] > 0:
+        if 10 <= row["Units"] <= 50:
+            return bid + (bid * 0.0075)
+        if 50 < row["Units"] <= 100:
+            return bid + (bid * 0.01)
+        if row["Units"] > 100:
+            return bid + (bid * 0.02)
+    return np.nan
+
+
+def baseline_placement_new_bid(row):
+    plcmt_diff_cpc = row["PLCMT_DIFF_CPC"]
+    units = row["Units"]
+    percentage = row["Percentage"]
+
+    if plcmt_diff_cpc <= 0 or units < 3:
+        return np.nan
+
+    new_bid = None
+    if percentage != 0:
+        if 3 <= units <= 10:
+            new_bid = percentage + (percentage * (plcmt_diff_cpc / 5))
+        elif 10 < units <= 30:
+            new_bid = percentage + (percentage * (plcmt_diff_cpc / 4))
+        elif 30 < units <= 50:
+            new_bid = percentage + (percentage * (plcmt_diff_cpc / 3))
+        elif units > 50:
+            new_bid = percentage + (percentage * (plcmt_diff_cpc / 2))
+    else:
+        if 3 <= units <= 10:
+            new_bid = (plcmt_diff_cpc * 100) / 5
+        elif 10 < units <= 30:
+            new_bid = (plcmt_diff_cpc * 100) / 4
+        elif 30 < units <= 50:
+            new_bid = (plcmt_diff_cpc * 100) / 3
+        elif units > 50:
+            new_bid = (plcmt_diff_cpc * 100) / 2
+
+    return min(899, new_bid) if new_bid else np.nan
+
+
+def baseline_classify_search_terms(grouped_neg):
+    terms = pd.Series(grouped_neg["Customer Search Term"].astype(object))
+    neg_prod_yes = terms.str.startswith("b0", na=False)
+    expressions = pd.DataFrame({"term": terms, "asin": neg_prod_yes}).apply(
+        lambda x: f'asin="{x["term"]}"' if x["asin"] else "", axis=1)
+    return neg_prod_yes, expressions
+
+
+def baseline_amazon_upload(grouped_ptid, grouped_kwid, grouped_placements, grouped_neg):
+    amazon_upload = pd.DataFrame(columns=[
+        "Product", "Entity", "Operation", "Campaign ID", "Ad Group ID",
+        "Portfolio ID", "Ad ID", "Keyword ID", "Product Targeting ID",
+        "Campaign Name", "Ad Group Name", "Start Date", "End Date",
+        "Targeting Type", "State", "Daily Budget", "SKU",
+        "Ad Group Default Bid", "Bid", "Keyword Text",
+        "Native Language Keyword", "Native Language Locale", "Match Type",
+        "Bidding Strategy", "Placement", "Percentage",
+        "Product Targeting Expression"
+    ])
+
+    pt_rows = grouped_ptid.dropna(subset=["PTID_New_Bid"]).copy()
+    if not pt_rows.empty:
+        pt_rows["Product"] = "Sponsored Products"
+        pt_rows["Entity"] = "Product Targeting"
+        pt_rows["Operation"] = "Update"
+        pt_rows["State"] = "enabled"
+        pt_rows["Bid"] = pt_rows["PTID_New_Bid"]
+        amazon_upload = pd.concat([amazon_upload, pt_rows[amazon_upload.columns.intersection(pt_rows.columns)]])
+
+    kw_rows = grouped_kwid.dropna(subset=["KWID_New_Bid"]).copy()
+    if not kw_rows.empty:
+        kw_rows["Product"] = "Sponsored Products"
+        kw_rows["Entity"] = "Keyword"
+        kw_rows["Operation"] = "Update"
+        kw_rows["State"] = "enabled"
+        kw_rows["Bid"] = kw_rows["KWID_New_Bid"]
+        amazon_upload = pd.concat([amazon_upload, kw_rows[amazon_upload.columns.intersection(kw_rows.columns)]])
+
+    plcmt_rows = grouped_placements.dropna(subset=["PLCMT_New_Bid"]).copy()
+    if not plcmt_rows.empty:
+        plcmt_rows["Product"] = "Sponsored Products"
+        plcmt_rows["Entity"] = "Bidding Adjustment"
+        plcmt_rows["Operation"] = "Update"
+        plcmt_rows["Percentage"] = plcmt_rows["PLCMT_New_Bid"]
+        amazon_upload = pd.concat([amazon_upload, plcmt_rows[amazon_upload.columns.intersection(plcmt_rows.columns)]])
+
+    neg_filter = (grouped_neg["Clicks"] >= 10) & (grouped_neg["Units"] < 1)
+    neg_kw_rows = grouped_neg[neg_filter & grouped_neg["NEG_KW_YES"]].copy()
+    if not neg_kw_rows.empty:
+        neg_kw_rows["Product"] = "Sponsored Products"
+        neg_kw_rows["Entity"] = "Negative Keyword"
+        neg_kw_rows["Operation"] = "Create"
+        neg_kw_rows["State"] = "enabled"
+        neg_kw_rows["Match Type"] = "negativeExact"
+        neg_kw_rows["Keyword Text"] = neg_kw_rows["Customer Search Term"]
+        amazon_upload = pd.concat([amazon_upload, neg_kw_rows[amazon_upload.columns.intersection(neg_kw_rows.columns)]])
+
+    neg_prod_rows = grouped_neg[neg_filter & grouped_neg["NEG_PROD_YES"]].copy()
+    if not neg_prod_rows.empty:
+        neg_prod_rows["Product"] = "Sponsored Products"
+        neg_prod_rows["Entity"] = "Negative Product Targeting"
+        neg_prod_rows["Operation"] = "Create"
+        neg_prod_rows["State"] = "enabled"
+        amazon_upload = pd.concat([amazon_upload, neg_prod_rows[amazon_upload.columns.intersection(neg_prod_rows.columns)]])
+
+    return amazon_upload.drop_duplicates()
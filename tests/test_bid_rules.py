@@ -0,0 +1,205 @@
+"""Fuzzes the compiled BidRules against row-wise evaluations of the rules,
+and checks that invalid rule sets are refused."""
+import copy
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from baseline import baseline_placement_new_bid, baseline_target_new_bid
+from bid_rules import (DEFAULT_BID_RULES, DEFAULT_RULES, BidRules,
+                       add_performance_metrics, load_rule_sets)
+
+SEEDS = range(20)
+
+
+def spec_target_new_bid(row, spec):
+    """The target rule of a rule set, evaluated like the baseline does."""
+    targets = spec["targets"]
+    bid, diff_cpc, units = row["Bid"], row["D"], row["Units"]
+    if pd.isna(bid) or bid == 0:
+        return np.nan
+    if diff_cpc < 0 and units > targets["lower_above_units"]:
+        return max(targets["min_bid"], bid + (bid * diff_cpc))
+    if diff_cpc > 0 and units >= targets["step_up_min_units"]:
+        for tier in targets["step_ups"]:
+            if tier["max_units"] is None or units <= tier["max_units"]:
+                return bid + (bid * tier["rate"])
+    return np.nan
+
+
+def spec_placement_new_bid(row, spec):
+    """The placement rule of a rule set, evaluated like the baseline does."""
+    placements = spec["placements"]
+    diff_cpc, units, percentage = row["D"], row["Units"], row["Percentage"]
+    if diff_cpc <= 0 or not units >= placements["min_units"]:
+        return np.nan
+    divisor = next(tier["divisor"] for tier in placements["tiers"]
+                   if tier["max_units"] is None or units <= tier["max_units"])
+    if percentage != 0:
+        new_bid = percentage + (percentage * (diff_cpc / divisor))
+    else:
+        new_bid = (diff_cpc * 100) / divisor
+    return min(placements["max_percentage"], new_bid) if new_bid else np.nan
+
+
+def random_tiers(rng, value_key, low, values):
+    edges = np.sort(rng.choice(np.arange(low, low + 60, 0.5), rng.integers(0, 5)))
+    return [{"max_units": float(edge), value_key: float(rng.choice(values))}
+            for edge in edges] + [{"max_units": None, value_key: float(rng.choice(values))}]
+
+
+def random_spec(rng):
+    step_up_min_units = int(rng.integers(0, 20))
+    placement_min_units = int(rng.integers(0, 10))
+    return {
+        "ideal_cpc_factor": float(rng.choice([0.05, 0.2, 0.25, 1.0])),
+        "targets": {
+            "lower_above_units": int(rng.integers(0, 10)),
+            "min_bid": float(rng.choice([0, 0.02, 0.1, 1.0])),
+            "step_up_min_units": step_up_min_units,
+            "step_ups": random_tiers(rng, "rate", step_up_min_units,
+                                     [0, 0.0075, 0.01, 0.05, 0.5]),
+        },
+        "placements": {
+            "min_units": placement_min_units,
+            "max_percentage": float(rng.choice([50, 200, 899])),
+            "tiers": random_tiers(rng, "divisor", placement_min_units, [0.5, 1, 2, 5]),
+        },
+    }
+
+
+def random_rows(rng, n, spec):
+    """Inputs crowded around the rules' unit bounds, plus NaN, zero and infinite values."""
+    bounds = [spec["targets"]["lower_above_units"], spec["targets"]["step_up_min_units"],
+              spec["placements"]["min_units"]]
+    bounds += [tier["max_units"] for tier in spec["targets"]["step_ups"][:-1]]
+    bounds += [tier["max_units"] for tier in spec["placements"]["tiers"][:-1]]
+    units = rng.choice(bounds, n) + rng.choice([-1, -0.5, 0, 0, 0.5, 1, 200], n)
+    units[rng.random(n) < 0.03] = np.nan
+    diff_cpc = rng.normal(0, 1, n) * rng.choice([1e-3, 1, 100], n)
+    diff_cpc[rng.random(n) < 0.05] = 0
+    diff_cpc[rng.random(n) < 0.03] = np.nan
+    diff_cpc[rng.random(n) < 0.01] = rng.choice([np.inf, -np.inf])
+    return pd.DataFrame({
+        "Bid": rng.choice([np.nan, 0, 0.01, 0.02, 0.5, 2.0, 40.0], n),
+        "Percentage": rng.choice([np.nan, 0, 5, 50, 900, -10], n),
+        "Units": units,
+        "D": diff_cpc,
+    })
+
+
+def assert_same_values(expected, actual):
+    np.testing.assert_array_equal(
+        np.asarray(expected, dtype=float), np.asarray(actual, dtype=float))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_default_rules_match_baseline(seed):
+    rng = np.random.default_rng(seed)
+    rows = random_rows(rng, 5000, DEFAULT_RULES)
+
+    expected = rows.apply(baseline_target_new_bid, axis=1, diff_cpc="D")
+    assert_same_values(expected, DEFAULT_BID_RULES.target_new_bid(
+        rows["Bid"], rows["D"], rows["Units"]))
+
+    expected = rows.rename(columns={"D": "PLCMT_DIFF_CPC"}).apply(
+        baseline_placement_new_bid, axis=1)
+    assert_same_values(expected, DEFAULT_BID_RULES.placement_new_bid(
+        rows["Percentage"], rows["D"], rows["Units"]))
+
+
+@pytest.mark.parametrize("seed", SEEDS)
+def test_random_rules_match_row_wise_evaluation(seed):
+    rng = np.random.default_rng(seed)
+    spec = random_spec(rng)
+    rules = BidRules(spec, "random")
+    rows = random_rows(rng, 3000, spec)
+
+    assert_same_values(rows.apply(spec_target_new_bid, axis=1, spec=spec),
+                       rules.target_new_bid(rows["Bid"], rows["D"], rows["Units"]))
+    assert_same_values(rows.apply(spec_placement_new_bid, axis=1, spec=spec),
+                       rules.placement_new_bid(rows["Percentage"], rows["D"], rows["Units"]))
+
+    grouped = pd.DataFrame({
+        "Spend": rng.choice([0, 1.5, 3, np.nan], 500),
+        "Clicks": rng.choice([0, 1, 3, 7], 500),
+        "Sales": rng.choice([0, 2.5, 10, np.nan], 500),
+    })
+    add_performance_metrics(grouped, "X", rules=rules)
+    expected = grouped.apply(
+        lambda x: (x["Sales"] * spec["ideal_cpc_factor"]) / x["Clicks"]
+        if x["Clicks"] > 0 else 0, axis=1)
+    assert_same_values(expected, grouped["X_IDEAL_CPC"])
+
+
+def test_digest_follows_the_rules():
+    assert BidRules(copy.deepcopy(DEFAULT_RULES)).digest == DEFAULT_BID_RULES.digest
+    spec = copy.deepcopy(DEFAULT_RULES)
+    spec["ideal_cpc_factor"] = 0.25
+    assert BidRules(spec).digest != DEFAULT_BID_RULES.digest
+
+
+def set_key(path, value):
+    def mutate(spec):
+        *parents, key = path
+        for parent in parents:
+            spec = spec[parent]
+        spec[key] = value
+    return mutate
+
+
+def drop_key(path):
+    def mutate(spec):
+        *parents, key = path
+        for parent in parents:
+            spec = spec[parent]
+        del spec[key]
+    return mutate
+
+
+INVALID = {
+    "not an object": lambda spec: [],
+    "missing key": drop_key(["ideal_cpc_factor"]),
+    "unknown key": set_key(["placements", "extra"], 1),
+    "missing tier key": drop_key(["targets", "step_ups", 0, "rate"]),
+    "string number": set_key(["ideal_cpc_factor"], "0.2"),
+    "bool number": set_key(["targets", "min_bid"], True),
+    "zero factor": set_key(["ideal_cpc_factor"], 0),
+    "negative bid": set_key(["targets", "min_bid"], -0.02),
+    "nan": set_key(["targets", "min_bid"], float("nan")),
+    "infinite": set_key(["placements", "max_percentage"], float("inf")),
+    "zero divisor": set_key(["placements", "tiers", 0, "divisor"], 0),
+    "empty tiers": set_key(["targets", "step_ups"], []),
+    "tiers not a list": set_key(["placements", "tiers"], {"max_units": None}),
+    "descending tiers": set_key(["targets", "step_ups", 1, "max_units"], 40),
+    "tier below minimum": set_key(["placements", "tiers", 0, "max_units"], 2),
+    "bounded last tier": set_key(["targets", "step_ups", 2, "max_units"], 200),
+    "unbounded middle tier": set_key(["placements", "tiers", 1, "max_units"], None),
+}
+
+
+@pytest.mark.parametrize("mutate", INVALID.values(), ids=INVALID.keys())
+def test_invalid_rules_are_refused(mutate):
+    spec = copy.deepcopy(DEFAULT_RULES)
+    # Mutators either edit the spec in place or return a replacement
+    replacement = mutate(spec)
+    if replacement is not None:
+        spec = replacement
+    with pytest.raises(ValueError, match="^Invalid bid rules 'custom': "):
+        BidRules(spec, "custom")
+
+
+def test_load_rule_sets(tmp_path):
+    spec = copy.deepcopy(DEFAULT_RULES)
+    spec["targets"]["min_bid"] = 0.1
+    (tmp_path / "cautious.json").write_text(json.dumps(spec))
+    rule_sets = load_rule_sets(tmp_path)
+    assert sorted(rule_sets) == ["cautious", "default"]
+    assert rule_sets["cautious"].min_bid == 0.1
+
+    spec["targets"]["min_bid"] = -1
+    (tmp_path / "broken.json").write_text(json.dumps(spec))
+    with pytest.raises(ValueError, match="'broken'"):
+        load_rule_sets(tmp_path)
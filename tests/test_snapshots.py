@@ -0,0 +1,109 @@
+"""Delta optimization: a run that reuses the account's last snapshot
+against a full recompute of the same bulk file."""
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic import campaigns_sheet, search_term_sheet
+from bid_rules import DEFAULT_BID_RULES, DEFAULT_RULES, BidRules
+from ingest import SEARCH_TERM_SHEET, SP_SHEET
+from jobs import StageTimer
+from pipeline import TARGETS, optimize
+from snapshots import TARGET_INPUT_COLUMNS, AccountSnapshots, target_output_columns
+
+pytest.importorskip("pyarrow")
+
+
+def bulk_sheets(campaigns):
+    return {SP_SHEET: campaigns.copy(), SEARCH_TERM_SHEET: search_term_sheet(500, seed=4)}
+
+
+def with_missing_bids(campaigns, rng):
+    """Some targets without a bid or a default bid to fall back on."""
+    campaigns = campaigns.copy()
+    for _, _, key, _ in TARGETS:
+        ids = campaigns[key].dropna().unique()
+        missing = campaigns[key].isin(ids[rng.random(len(ids)) < 0.05])
+        campaigns.loc[missing, ["Bid", "Ad Group Default Bid (Informational only)"]] = np.nan
+    return campaigns
+
+
+def next_day(campaigns, rng):
+    """The campaigns a day later: some metrics and bids moved, some targets
+    gone and some new, and the rows in another order."""
+    campaigns = campaigns.sample(frac=1, random_state=rng.integers(2**31))
+    moved = rng.random(len(campaigns)) < 0.1
+    campaigns.loc[moved, "Clicks"] += 1
+    campaigns.loc[moved, "Spend"] += 0.5
+    rebid = rng.random(len(campaigns)) < 0.05
+    campaigns.loc[rebid, "Bid"] = campaigns.loc[rebid, "Bid"] * 1.1
+    campaigns = campaigns[rng.random(len(campaigns)) >= 0.05]
+    new = campaigns[campaigns["Entity"].isin(["Keyword", "Product Targeting"])].head(40).copy()
+    new["Keyword ID"] += 10**12
+    new["Product Targeting ID"] += 10**12
+    return pd.concat([campaigns, new], ignore_index=True)
+
+
+def unchanged(grouped, previous, key):
+    """Rows of grouped whose bid rule inputs are exactly as in previous."""
+    merged = grouped[[key] + TARGET_INPUT_COLUMNS].merge(
+        previous[[key] + TARGET_INPUT_COLUMNS], on=key, how="left",
+        suffixes=("", "_previous"), indicator=True)
+    same = merged["_merge"] == "both"
+    for col in TARGET_INPUT_COLUMNS:
+        current, last = merged[col], merged[f"{col}_previous"]
+        same &= (current == last) | (current.isna() & last.isna())
+    return int(same.sum())
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_delta_run_matches_full_recompute(tmp_path, seed):
+    rng = np.random.default_rng(seed)
+    snapshots = AccountSnapshots(tmp_path)
+    day1 = with_missing_bids(campaigns_sheet(6000, seed=seed), rng)
+    first = optimize(bulk_sheets(day1), StageTimer())
+    for (name, _, key, prefix), grouped in first.targets():
+        snapshots.save("acct", name, grouped, key, prefix)
+
+    day2 = next_day(day1, rng)
+    previous = {name: snapshots.load("acct", name, key) for name, _, key, _ in TARGETS}
+    delta = optimize(bulk_sheets(day2), StageTimer(), previous)
+    full = optimize(bulk_sheets(day2), StageTimer())
+
+    for ((name, _, key, prefix), grouped), (_, expected), (_, last) in zip(
+            delta.targets(), full.targets(), first.targets()):
+        columns = [key] + TARGET_INPUT_COLUMNS + target_output_columns(prefix)
+        pd.testing.assert_frame_equal(expected[columns], grouped[columns], check_exact=True)
+
+        reused = unchanged(grouped, last, key)
+        assert 0 < reused < len(grouped)
+        assert delta.delta[name] == {"recomputed": len(grouped) - reused, "reused": reused}
+
+
+def test_unchanged_file_reuses_every_target(tmp_path):
+    snapshots = AccountSnapshots(tmp_path)
+    day1 = campaigns_sheet(3000, seed=9)
+    first = optimize(bulk_sheets(day1), StageTimer())
+    for (name, _, key, prefix), grouped in first.targets():
+        snapshots.save("acct", name, grouped, key, prefix)
+
+    previous = {name: snapshots.load("acct", name, key) for name, _, key, _ in TARGETS}
+    again = optimize(bulk_sheets(day1), StageTimer(), previous)
+    for name, counts in again.delta.items():
+        assert counts["recomputed"] == 0
+        assert counts["reused"] > 0
+
+
+def test_snapshot_is_ignored_under_other_rules(tmp_path):
+    snapshots = AccountSnapshots(tmp_path)
+    first = optimize(bulk_sheets(campaigns_sheet(2000, seed=1)), StageTimer())
+    (name, _, key, prefix), grouped = next(iter(first.targets()))
+    snapshots.save("acct", name, grouped, key, prefix)
+
+    spec = copy.deepcopy(DEFAULT_RULES)
+    spec["targets"]["min_bid"] = 0.1
+    assert snapshots.load("acct", name, key, DEFAULT_BID_RULES) is not None
+    assert snapshots.load("acct", name, key, BidRules(spec, "cautious")) is None
+    assert snapshots.load("other", name, key) is None
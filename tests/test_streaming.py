@@ -0,0 +1,68 @@
+"""The streamed search term aggregation, spilling or not, against the
+in-memory aggregation of the whole sheet."""
+import pandas as pd
+import pytest
+
+from aggregation import aggregate_search_terms
+from artifacts import write_workbook
+from benchmarks.synthetic import search_term_sheet
+from ingest import SEARCH_TERM_SHEET, read_bulk_sheets
+from streaming import SearchTermAggregator, stream_search_terms
+
+
+def in_memory(sheet):
+    return aggregate_search_terms(
+        sheet[sheet["Campaign State (Informational only)"] == "enabled"])
+
+
+def assert_same_search_terms(expected, actual):
+    # Sums are added up in another order, so they may differ in the last digits
+    pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual,
+                                  check_dtype=False, check_exact=False, rtol=1e-9)
+
+
+@pytest.mark.parametrize("max_keys, spills", [(10**9, 0), (300, None), (1, None)],
+                         ids=["in memory", "spilled", "spilled every batch"])
+def test_aggregator_matches_in_memory(tmp_path, max_keys, spills):
+    sheet = search_term_sheet(20000, seed=5)
+    aggregator = SearchTermAggregator(max_keys, tmp_path, partitions=4)
+    try:
+        for start in range(0, len(sheet), 1500):
+            aggregator.add(sheet.iloc[start:start + 1500].copy())
+        actual = aggregator.finish()
+    finally:
+        aggregator.close()
+
+    if spills is None:
+        assert aggregator.spills > 1
+    else:
+        assert aggregator.spills == spills
+    assert aggregator.rows == len(sheet)
+    assert_same_search_terms(in_memory(sheet), actual)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_stream_search_terms_spills_and_cleans_up(tmp_path):
+    path = tmp_path / "bulk.xlsx"
+    write_workbook(path, [(SEARCH_TERM_SHEET, search_term_sheet(3000, seed=8))])
+    spill_dir = tmp_path / "spill"
+    spill_dir.mkdir()
+
+    actual, stats = stream_search_terms(path, 250, 40, spill_dir)
+
+    assert stats["rows"] == 3000
+    assert stats["spills"] > 1
+    sheets, _ = read_bulk_sheets(path, (SEARCH_TERM_SHEET,))
+    assert_same_search_terms(in_memory(sheets[SEARCH_TERM_SHEET]), actual)
+    assert list(spill_dir.iterdir()) == []
+
+
+def test_empty_report(tmp_path):
+    sheet = search_term_sheet(100, seed=2)
+    sheet["Campaign State (Informational only)"] = "paused"
+    aggregator = SearchTermAggregator(10, tmp_path)
+    aggregator.add(sheet)
+    grouped = aggregator.finish()
+    aggregator.close()
+    assert grouped.empty
+    assert list(grouped.columns) == list(in_memory(sheet).columns)
@@ -0,0 +1,129 @@
+"""The vectorized bid rules and Amazon Upload builder against the original
+row-wise code, run on a generated bulk file."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from artifacts import build_amazon_upload
+from baseline import (baseline_amazon_upload, baseline_classify_search_terms,
+                      baseline_metrics, baseline_placement_new_bid,
+                      baseline_target_new_bid)
+from benchmarks.synthetic import campaigns_sheet, search_term_sheet
+from bid_rules import (add_performance_metrics, classify_search_terms,
+                       placement_new_bid, target_new_bid)
+from ingest import SEARCH_TERM_SHEET, SP_SHEET, compact_frames
+from jobs import StageTimer
+from pipeline import optimize
+
+
+def as_objects(frame):
+    """frame with object columns, NaN for every missing value and a fresh index."""
+    frame = frame.astype(object).reset_index(drop=True)
+    return frame.where(frame.notna(), np.nan)
+
+
+def assert_same_values(expected, actual):
+    np.testing.assert_array_equal(
+        np.asarray(expected, dtype=float), np.asarray(actual, dtype=float))
+
+
+@pytest.fixture(scope="module", params=[False, True], ids=["raw", "compact"])
+def result(request):
+    sheets = {SP_SHEET: campaigns_sheet(20000, seed=3),
+              SEARCH_TERM_SHEET: search_term_sheet(20000, seed=3)}
+    if request.param:
+        compact_frames(sheets)
+    return optimize(sheets, StageTimer())
+
+
+@pytest.mark.parametrize("frame, prefix", [("ptid", "PTID"), ("kwid", "KWID")])
+def test_target_metrics_and_bids_match_baseline(result, frame, prefix):
+    grouped = getattr(result, frame)
+    expected = baseline_metrics(grouped, prefix)
+    for column in expected:
+        assert_same_values(expected[column], grouped[column])
+    rows = pd.concat([grouped[["Bid", "Units"]], expected], axis=1)
+    assert_same_values(
+        rows.apply(baseline_target_new_bid, axis=1, diff_cpc=f"{prefix}_DIFF_CPC"),
+        grouped[f"{prefix}_New_Bid"])
+
+
+def test_placement_bids_match_baseline(result):
+    grouped = result.placements
+    expected = baseline_metrics(grouped, "PLCMT")
+    for column in expected:
+        assert_same_values(expected[column], grouped[column])
+    rows = pd.concat([grouped[["Percentage", "Units"]], expected], axis=1)
+    assert_same_values(rows.apply(baseline_placement_new_bid, axis=1),
+                       grouped["PLCMT_New_Bid"])
+
+
+def test_search_terms_match_baseline(result):
+    grouped = result.neg
+    expected = baseline_metrics(grouped, "NEGKWS", ideal_cpc=False)
+    for column in expected:
+        assert_same_values(expected[column], grouped[column])
+    neg_prod_yes, expressions = baseline_classify_search_terms(grouped)
+    np.testing.assert_array_equal(neg_prod_yes.to_numpy(), grouped["NEG_PROD_YES"].to_numpy())
+    np.testing.assert_array_equal(~neg_prod_yes.to_numpy(), grouped["NEG_KW_YES"].to_numpy())
+    np.testing.assert_array_equal(expressions.to_numpy(),
+                                  grouped["Product Targeting Expression"].to_numpy())
+
+
+def test_amazon_upload_matches_baseline(result):
+    frames = [result.ptid, result.kwid, result.placements, result.neg]
+    pd.testing.assert_frame_equal(as_objects(baseline_amazon_upload(*frames)),
+                                  as_objects(build_amazon_upload(*frames)),
+                                  check_exact=True)
+
+
+def test_amazon_upload_drops_repeated_placements(result):
+    # Placement groups that only differed in their old percentage
+    placements = pd.concat([result.placements, result.placements.head(50)],
+                           ignore_index=True)
+    frames = [result.ptid, result.kwid, placements, result.neg]
+    pd.testing.assert_frame_equal(as_objects(baseline_amazon_upload(*frames)),
+                                  as_objects(build_amazon_upload(*frames)),
+                                  check_exact=True)
+
+
+def test_edge_cases_match_baseline():
+    """Boundary units, missing and zero bids, NaN gaps and numeric terms."""
+    rng = np.random.default_rng(7)
+    n = 20000
+    rows = pd.DataFrame({
+        "Bid": rng.choice([np.nan, 0, 0.01, 0.02, 0.5, 2.0], n),
+        "Percentage": rng.choice([np.nan, 0, 5, 50, 900], n),
+        "Units": rng.choice([np.nan, 0, 2, 3, 3.5, 4, 10, 10.5, 30, 30.5, 50,
+                             50.5, 51, 100, 100.5, 101], n),
+        "D": np.where(rng.random(n) < 0.05, np.nan,
+                      rng.normal(0, 1, n) * rng.choice([1, 1e-3, 100], n)),
+    })
+    rows.loc[rng.random(n) < 0.05, "D"] = 0
+
+    expected = rows.apply(baseline_target_new_bid, axis=1, diff_cpc="D")
+    assert_same_values(expected, target_new_bid(rows["Bid"], rows["D"], rows["Units"]))
+
+    expected = rows.rename(columns={"D": "PLCMT_DIFF_CPC"}).apply(
+        baseline_placement_new_bid, axis=1)
+    assert_same_values(
+        expected, placement_new_bid(rows["Percentage"], rows["D"], rows["Units"]))
+
+    metrics = pd.DataFrame({
+        "Spend": rng.choice([0, 1.5, 3, np.nan], n),
+        "Clicks": rng.choice([0, 1, 3, 7], n),
+        "Sales": rng.choice([0, 2.5, 10, np.nan], n),
+    })
+    expected = baseline_metrics(metrics, "X")
+    add_performance_metrics(metrics, "X")
+    for column in expected:
+        assert_same_values(expected[column], metrics[column])
+
+    terms = pd.Series(["b0abc", "B0ABC", "shoes", np.nan, 42, "b0", "", "xb0"] * 10,
+                      dtype=object)
+    grouped = pd.DataFrame({"Customer Search Term": terms})
+    neg_prod_yes, expressions = baseline_classify_search_terms(grouped)
+    for series in (terms, terms.astype("category")):
+        is_asin, actual = classify_search_terms(series)
+        np.testing.assert_array_equal(neg_prod_yes.to_numpy(), is_asin)
+        np.testing.assert_array_equal(expressions.to_numpy(), actual)
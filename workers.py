@@ -0,0 +1,53 @@
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Imported once in the fork server, so every worker forked from it starts
+# with the heavy libraries already loaded
+PRELOAD_MODULES = [
+    "numpy",
+    "pandas",
+    "openpyxl",
+    "reportlab.platypus",
+    "aggregation",
+    "bid_rules",
+    "impact_report",
+    "ingest",
+    "pipeline",
+    "processing",
+    "streaming",
+]
+
+
+def warm_worker():
+    """Process pool initializer: finishes warming a freshly forked worker."""
+    import numpy  # noqa: F401
+    import openpyxl  # noqa: F401
+    import pandas  # noqa: F401
+
+    from impact_report import report_styles
+    report_styles()
+
+
+def create_executor(backend, max_workers, max_jobs_per_worker):
+    """Returns the executor process_bidventor jobs run on.
+
+    backend is "process" for a pool of pre-warmed worker processes, each
+    replaced after max_jobs_per_worker jobs, or "thread" for a thread pool
+    in the server process.
+    """
+    if backend == "thread":
+        return ThreadPoolExecutor(max_workers=max_workers)
+    if backend != "process":
+        raise ValueError(f"Unknown executor backend: {backend}")
+
+    context = multiprocessing.get_context("forkserver")
+    context.set_forkserver_preload(PRELOAD_MODULES)
+    logger.info(f"Starting process pool with {max_workers} workers, "
+                f"recycled every {max_jobs_per_worker} jobs")
+    return ProcessPoolExecutor(max_workers=max_workers,
+                               mp_context=context,
+                               initializer=warm_worker,
+                               max_tasks_per_child=max_jobs_per_worker)